@@ -0,0 +1,129 @@
+"""
+Compares refreshing every quantity of an instrument with the single value endpoints
+(/instrumentDB/getLatestValue and /setLatestValue, one request per quantity)
+against the batch endpoints (/instrumentDB/getLatestValues and /setLatestValues, one request in total).
+
+Starts an Instrument Server (instrumentDB blueprint only) on a local port with the embedded SQLite backend,
+so no database server is needed. Run from the project root:
+    python Benchmarks/batch_latest_value_benchmark.py
+"""
+import os
+import sys
+import time
+import logging
+import tempfile
+import threading
+import statistics
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'InstrumentServer'))
+
+import requests
+from flask import Flask
+from werkzeug.serving import make_server
+
+import instrumentDB
+import instrument_server_service
+from DB import db
+from DB import driver_cache
+from DB import latest_value_store
+
+QUANTITY_COUNTS = (10, 50, 200)
+REPEATS = 10
+PORT = 5097
+BENCHMARK_INSTRUMENT = 'benchmark_instrument'
+
+
+def create_app(database_path: str, logger: logging.Logger) -> Flask:
+    app = Flask(__name__)
+    app.config.update(DATABASE_BACKEND='sqlite', SQLITE_DATABASE=database_path)
+    db.setLogger(logger)
+    db.init_db(app)
+
+    backend = app.extensions[db.BACKEND_EXTENSION_KEY]
+    feed = backend.create_change_feed(logger)
+
+    store = latest_value_store.LatestValueStore(backend.persist, logger, on_set=feed.publish_latest_value)
+    latest_value_store.set_store(store)
+    store.start()
+
+    instrument_server_service.set_service(instrument_server_service.InstrumentServerService(
+        backend, store, driver_cache.DriverCache(), feed, logger))
+
+    app.register_blueprint(instrumentDB.bp)
+    instrumentDB.setLogger(logger)
+    return app
+
+
+def add_instrument(quantity_count: int) -> list:
+    labels = [f'Quantity {i}' for i in range(quantity_count)]
+    backend = instrument_server_service.get_service()._backend
+    backend.delete_instrument(BENCHMARK_INSTRUMENT)
+    backend.add_instrument({'cute_name': BENCHMARK_INSTRUMENT, 'interface': 'GPIB', 'address': '1'},
+                           {'general_settings': {'name': 'Benchmark', 'ini_path': 'benchmark.ini'},
+                            'model_and_options': {}, 'visa': {},
+                            'quantities': {label: {'label': label, 'data_type': 'DOUBLE'} for label in labels}})
+    return labels
+
+
+def measure(refresh) -> tuple:
+    """Returns (median ms, response bytes) of one refresh"""
+    timings = []
+    response_bytes = 0
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        response_bytes = refresh()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), response_bytes
+
+
+def main():
+    logger = logging.getLogger()
+    logger.setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as instance_path:
+        app = create_app(os.path.join(instance_path, 'benchmark.sqlite3'), logger)
+        server = make_server('127.0.0.1', PORT, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        url = f'http://127.0.0.1:{PORT}/instrumentDB'
+        session = requests.Session()
+
+        def get_each(labels):
+            return sum(len(session.get(f'{url}/getLatestValue',
+                                       params={'cute_name': BENCHMARK_INSTRUMENT, 'label': label}).content)
+                       for label in labels)
+
+        def set_each(labels):
+            return sum(len(session.put(f'{url}/setLatestValue',
+                                       params={'cute_name': BENCHMARK_INSTRUMENT, 'label': label,
+                                               'latest_value': '1.0'}).content)
+                       for label in labels)
+
+        def get_batch(labels):
+            return len(session.post(f'{url}/getLatestValues',
+                                    json={'quantities': [[BENCHMARK_INSTRUMENT, label] for label in labels]}).content)
+
+        def set_batch(labels):
+            return len(session.put(f'{url}/setLatestValues',
+                                   json={'latest_values': [[BENCHMARK_INSTRUMENT, label, '1.0']
+                                                           for label in labels]}).content)
+
+        refreshes = (('get each', get_each), ('get batch', get_batch), ('set each', set_each), ('set batch', set_batch))
+
+        print(f"{'quantities':>10} " + ' '.join(f'{name + " ms":>14} {name + " bytes":>16}' for name, _ in refreshes))
+        for quantity_count in QUANTITY_COUNTS:
+            labels = add_instrument(quantity_count)
+            row = f'{quantity_count:>10} '
+            for name, refresh in refreshes:
+                latency, response_bytes = measure(lambda: refresh(labels))
+                row += f'{latency:>14.2f} {response_bytes:>16} '
+            print(row)
+
+        session.close()
+        server.shutdown()
+        latest_value_store.get_store().close()
+        app.extensions[db.BACKEND_EXTENSION_KEY].close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Load test of the catalog endpoints (/instrumentDB/allInstruments and /getInstrument) with many concurrent clients,
+served by Flask's development server (one new thread per connection) and by waitress (the production mode of
+FlaskInstrumentServer.run_server, a fixed pool of worker threads).
+
+Starts the instrumentDB blueprint on local ports with the embedded SQLite backend, so no database server is needed.
+Run from the project root:
+    python Benchmarks/catalog_load_test.py
+"""
+import os
+import sys
+import time
+import logging
+import tempfile
+import threading
+import statistics
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'InstrumentServer'))
+
+import requests
+import waitress
+from werkzeug.serving import make_server
+
+import instrument_server_service
+from DB import db
+from DB import latest_value_store
+from batch_latest_value_benchmark import create_app
+
+CLIENT_COUNTS = (1, 8, 32)
+DURATION = 5.0
+INSTRUMENT_COUNT = 20
+QUANTITY_COUNT = 50
+WORKER_THREADS = 8
+DEVELOPMENT_PORT = 5098
+PRODUCTION_PORT = 5099
+
+
+def add_instruments():
+    backend = instrument_server_service.get_service()._backend
+    for i in range(INSTRUMENT_COUNT):
+        labels = [f'Quantity {j}' for j in range(QUANTITY_COUNT)]
+        backend.add_instrument({'cute_name': f'instrument_{i}', 'interface': 'GPIB', 'address': str(i)},
+                               {'general_settings': {'name': 'Benchmark', 'ini_path': 'benchmark.ini'},
+                                'model_and_options': {}, 'visa': {},
+                                'quantities': {label: {'label': label, 'data_type': 'DOUBLE'} for label in labels}})
+
+
+def run_clients(url: str, client_count: int) -> tuple:
+    """Each client alternates between the two endpoints for DURATION seconds,
+    returns (requests per second, p50 ms, p99 ms, failed requests)"""
+    timings = []
+    failures = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + DURATION
+
+    def client(index):
+        session = requests.Session()
+        own_timings = []
+        own_failures = 0
+        i = 0
+        while time.perf_counter() < deadline:
+            if i % 2:
+                request = lambda: session.get(f'{url}/allInstruments')
+            else:
+                request = lambda: session.get(f'{url}/getInstrument',
+                                              params={'cute_name': f'instrument_{(index + i) % INSTRUMENT_COUNT}'})
+            start = time.perf_counter()
+            try:
+                if request().status_code != 200:
+                    own_failures += 1
+            except requests.RequestException:
+                own_failures += 1
+            own_timings.append((time.perf_counter() - start) * 1000)
+            i += 1
+        session.close()
+        with lock:
+            timings.extend(own_timings)
+            failures.append(own_failures)
+
+    clients = [threading.Thread(target=client, args=[index]) for index in range(client_count)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+
+    percentiles = statistics.quantiles(timings, n=100)
+    return len(timings) / DURATION, percentiles[49], percentiles[98], sum(failures)
+
+
+def main():
+    logger = logging.getLogger()
+    logger.setLevel(logging.WARNING)
+    # the development server logs every request, waitress every request queued while all worker threads are busy
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    logging.getLogger('waitress.queue').setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as instance_path:
+        app = create_app(os.path.join(instance_path, 'benchmark.sqlite3'), logger)
+        add_instruments()
+
+        development_server = make_server('127.0.0.1', DEVELOPMENT_PORT, app, threaded=True)
+        threading.Thread(target=development_server.serve_forever, daemon=True).start()
+
+        production_server = waitress.create_server(app, host='127.0.0.1', port=PRODUCTION_PORT,
+                                                   threads=WORKER_THREADS, connection_limit=100, backlog=64)
+        threading.Thread(target=production_server.run, daemon=True).start()
+
+        servers = (('development', DEVELOPMENT_PORT), (f'waitress ({WORKER_THREADS} threads)', PRODUCTION_PORT))
+
+        print(f"{'server':>22} {'clients':>8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'failed':>8}")
+        for name, port in servers:
+            for client_count in CLIENT_COUNTS:
+                throughput, p50, p99, failed = run_clients(f'http://127.0.0.1:{port}/instrumentDB', client_count)
+                print(f'{name:>22} {client_count:>8} {throughput:>10.1f} {p50:>10.2f} {p99:>10.2f} {failed:>8}')
+
+        development_server.shutdown()
+        production_server.close()
+        latest_value_store.get_store().close()
+        app.extensions[db.BACKEND_EXTENSION_KEY].close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark of importing a synthetic library of DRIVER_COUNT Labber-style .ini drivers (10 to 200 quantities each,
+a few of them broken) with driver_library.import_library, in this process and with pools of worker processes.
+Run from the project root:
+    python Benchmarks/driver_library_benchmark.py
+"""
+import os
+import sys
+import random
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'InstrumentServer'))
+
+import driver_library
+
+DRIVER_COUNT = 1000
+DRIVERS_PER_FOLDER = 50
+BROKEN_EVERY = 40
+WORKER_COUNTS = (1, 2, 4, os.cpu_count())
+
+QUANTITY_TEMPLATES = (
+    'datatype: DOUBLE\nunit: V\nlow_lim: -10\nhigh_lim: 10\ndef_value: 0\nset_cmd: :VOLT{i}\n',
+    'datatype: BOOLEAN\ndef_value: False\nset_cmd: :OUTP{i}\n',
+    'datatype: COMBO\ndef_value: Sine\ncombo_def_1: Sine\ncombo_def_2: Square\ncmd_def_1: SIN\ncmd_def_2: SQU\n'
+    'set_cmd: :FUNC{i}\n',
+    'datatype: VECTOR\nx_name: Time\nx_unit: s\npermission: READ\nget_cmd: :TRAC{i}?\n',
+)
+
+
+def write_driver(path: str, index: int, quantity_count: int, broken: bool):
+    lines = [f'[General settings]\nname: Synthetic driver {index}\ndriver_path: Synthetic_{index}\ninterface: GPIB\n',
+             '[Model and options]\nmodel_str_1: SYN-1\ncheck_model: True\n',
+             '[VISA settings]\nuse_visa: True\ntimeout: 5\nterm_char: LF\n']
+    for i in range(quantity_count):
+        template = QUANTITY_TEMPLATES[i % len(QUANTITY_TEMPLATES)]
+        if broken and i == quantity_count // 2:
+            template = 'unit: V\n'
+        lines.append(f'[Quantity {i}]\ngroup: Group {i % 5}\n' + template.format(i=i))
+    with open(path, 'w') as file:
+        file.write('\n'.join(lines))
+
+
+def create_library(directory: str):
+    rng = random.Random(0)
+    for index in range(DRIVER_COUNT):
+        folder = os.path.join(directory, f'vendor_{index // DRIVERS_PER_FOLDER}')
+        os.makedirs(folder, exist_ok=True)
+        write_driver(os.path.join(folder, f'driver_{index}.ini'), index, rng.randint(10, 200),
+                     broken=index % BROKEN_EVERY == 0)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as library:
+        create_library(library)
+        print(f'{DRIVER_COUNT} drivers, {os.cpu_count()} CPUs')
+        print(f"{'workers':>8} {'ms':>10} {'ms/driver':>10} {'failed':>8} {'quantities':>11}")
+        for workers in sorted(set(WORKER_COUNTS)):
+            report = driver_library.import_library(library, workers)
+            quantities = sum(driver['quantity_count'] or 0 for driver in report['drivers'])
+            print(f"{report['workers']:>8} {report['elapsed_ms']:>10.1f} "
+                  f"{report['elapsed_ms'] / report['driver_count']:>10.3f} {report['failed_count']:>8} "
+                  f"{quantities:>11}")
+
+        failed = next(driver for driver in report['drivers'] if driver['error'])
+        print(f"\ne.g. {os.path.relpath(failed['ini_path'], library)}: {failed['error']}")
+
+
+if __name__ == '__main__':
+    main()
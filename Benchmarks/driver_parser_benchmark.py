@@ -0,0 +1,61 @@
+"""
+Benchmark of driverParserService on synthetic drivers with QUANTITY_COUNT quantities: reading the sections
+(RawConfigParser and the single pass readSections), building the quantities (getQuantities) and the whole parse.
+Run from the project root:
+    python Benchmarks/driver_parser_benchmark.py
+"""
+import os
+import sys
+import time
+import tempfile
+import statistics
+from configparser import RawConfigParser
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'InstrumentServer'))
+
+import driverParserService as dps
+from driver_library_benchmark import write_driver
+
+QUANTITY_COUNT = 5000
+REPEATS = 10
+
+
+def measure(function) -> float:
+    """Returns the median ms of function()"""
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def read_with_config_parser(text: str) -> dict:
+    config = RawConfigParser()
+    config.read_string(text)
+    return config._sections
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        ini_path = os.path.join(directory, 'synthetic.ini')
+        write_driver(ini_path, 0, QUANTITY_COUNT, broken=False)
+        with open(ini_path) as file:
+            text = file.read()
+
+    sections = dps.readSections(text)
+    assert sections == read_with_config_parser(text)
+    quantities = {name: section for name, section in sections.items() if name not in dps.SETTINGS_SECTIONS}
+
+    print(f'{QUANTITY_COUNT} quantities, {len(text) / 1024:.0f} KiB')
+    print(f"{'':>32} {'ms':>10} {'us/quantity':>12}")
+    for name, function in (('RawConfigParser.read_string', lambda: read_with_config_parser(text)),
+                           ('readSections', lambda: dps.readSections(text)),
+                           ('getQuantities', lambda: dps.getQuantities(quantities)),
+                           ('parseDriverText', lambda: dps.parseDriverText(text, ini_path))):
+        elapsed = measure(function)
+        print(f'{name:>32} {elapsed:>10.1f} {elapsed * 1000 / QUANTITY_COUNT:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
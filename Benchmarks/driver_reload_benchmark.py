@@ -0,0 +1,99 @@
+"""
+Benchmark of applying a change to one quantity of an instrument's .ini driver: removing and re-adding the instrument
+(what the settings GUI does today, plus a new instrument manager) and reloading it with the DriverWatcher (only the
+changed row is written, the connected instrument's quantities are patched in place).
+Uses the SQLite backend in a temporary folder and a connected NonVisaInstrumentManager, no instrument needed.
+Run from the project root:
+    python Benchmarks/driver_reload_benchmark.py
+"""
+import os
+import sys
+import copy
+import time
+import logging
+import tempfile
+import threading
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'InstrumentServer'))
+
+from DB import change_feed
+from DB.driver_cache import DriverCache
+from DB.latest_value_store import LatestValueStore
+from DB.sqlite_backend import SQLiteBackend
+from Instrument.non_visa_instrument_manager import NonVisaInstrumentManager
+import instrument_server_service
+import instrument_connection_service
+import driver_reload
+from driver_library_benchmark import write_driver
+
+QUANTITY_COUNTS = (50, 500, 2000)
+REPEATS = 10
+CUTE_NAME = 'synthetic'
+
+
+def connect(service, connection_service, cute_name: str, logger: logging.Logger):
+    driver = copy.deepcopy(service.get_instrument(cute_name))
+    connection_service._connected_instruments[cute_name] = NonVisaInstrumentManager(cute_name, driver, logger)
+    connection_service._instrument_locks[cute_name] = threading.Lock()
+
+
+def edit_driver(ini_path: str, high_lim: int):
+    """Changes the high limit of the first quantity"""
+    with open(ini_path) as file:
+        text = file.read()
+    start = text.index('high_lim: ')
+    with open(ini_path, 'w') as file:
+        file.write(text[:start] + f'high_lim: {high_lim}' + text[text.index('\n', start):])
+
+
+def main():
+    logger = logging.getLogger()
+    logger.setLevel(logging.WARNING)
+
+    print(f"{'quantities':>11} {'remove + add ms':>16} {'hot reload ms':>14} {'speedup':>8}")
+    for quantity_count in QUANTITY_COUNTS:
+        with tempfile.TemporaryDirectory() as directory:
+            ini_path = os.path.join(directory, 'synthetic.ini')
+            write_driver(ini_path, 0, quantity_count, broken=False)
+
+            backend = SQLiteBackend(os.path.join(directory, 'instrument_db.sqlite3'), logger)
+            store = LatestValueStore(lambda latest_values, history: backend.set_latest_values(latest_values), logger)
+            service = instrument_server_service.InstrumentServerService(
+                backend, store, DriverCache(), change_feed.ChangeFeed(logger), logger)
+            instrument_server_service.set_service(service)
+            connection_service = instrument_connection_service.InstrumentConnectionService(logger)
+            watcher = driver_reload.DriverWatcher(service, connection_service, logger, interval=None)
+
+            details = {'cute_name': CUTE_NAME, 'path': ini_path, 'interface': 'GPIB', 'address': '1'}
+            service.add_instrument(details)
+            connect(service, connection_service, CUTE_NAME, logger)
+            watcher.reload(CUTE_NAME)
+
+            remove_and_add, hot_reload = [], []
+            for i in range(REPEATS):
+                edit_driver(ini_path, 100 + 2 * i)
+                start = time.perf_counter()
+                connection_service.disconnect_instrument(CUTE_NAME)
+                service.remove_instrument(CUTE_NAME)
+                service.add_instrument(details)
+                connect(service, connection_service, CUTE_NAME, logger)
+                remove_and_add.append((time.perf_counter() - start) * 1000)
+
+                # the re-added instrument is recorded again, then a change is picked up
+                watcher.reload(CUTE_NAME)
+                edit_driver(ini_path, 101 + 2 * i)
+                start = time.perf_counter()
+                report = watcher.reload(CUTE_NAME)
+                hot_reload.append((time.perf_counter() - start) * 1000)
+                assert report['changed'] and report['patched']
+
+            backend.close()
+
+        slow, fast = statistics.median(remove_and_add), statistics.median(hot_reload)
+        print(f'{quantity_count:>11} {slow:>16.2f} {fast:>14.2f} {slow / fast:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark of reading one quantity of many instruments: one blocking call after the other (what a single thread of
+the GUI or an experiment does today) and concurrently from one event loop through the InstrumentGateway.
+
+The instruments are simulated, every read blocks its thread for IO_TIME seconds like a VISA query does.
+Also shows the deadline of a call to an instrument that hangs. Run from the project root:
+    python Benchmarks/instrument_gateway_benchmark.py
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import statistics
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'InstrumentServer'))
+
+import instrument_connection_service
+import instrument_gateway
+
+INSTRUMENT_COUNTS = (1, 8, 24, 48)
+IO_TIME = 0.01
+REPEATS = 10
+LABEL = 'Voltage'
+
+
+class SimulatedInstrument:
+    """Stands in for an InstrumentManager, get_value blocks like a VISA query"""
+
+    def __init__(self, io_time: float):
+        self.quantities = {LABEL: 0.0}
+        self._io_time = io_time
+
+    def get_value(self, label: str):
+        time.sleep(self._io_time)
+        return self.quantities[label]
+
+
+def connect(connection_service, cute_name: str, io_time: float = IO_TIME):
+    connection_service._connected_instruments[cute_name] = SimulatedInstrument(io_time)
+    connection_service._instrument_locks[cute_name] = threading.Lock()
+
+
+def measure(read) -> float:
+    """Returns the median ms of read()"""
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        read()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    logger = logging.getLogger()
+    logger.setLevel(logging.WARNING)
+
+    connection_service = instrument_connection_service.InstrumentConnectionService(logger)
+    gateway = instrument_gateway.InstrumentGateway(connection_service, logger)
+    gateway.start()
+
+    print(f"{'instruments':>12} {'sequential ms':>14} {'gateway ms':>11} {'speedup':>8}")
+    for instrument_count in INSTRUMENT_COUNTS:
+        cute_names = [f'instrument_{i}' for i in range(instrument_count)]
+        for cute_name in cute_names:
+            connect(connection_service, cute_name)
+
+        def read_sequentially():
+            return [connection_service.get_value(cute_name, LABEL) for cute_name in cute_names]
+
+        def read_through_gateway():
+            return gateway.run(gateway.get_values([(cute_name, LABEL) for cute_name in cute_names], timeout=5.0))
+
+        sequential = measure(read_sequentially)
+        concurrent = measure(read_through_gateway)
+        print(f'{instrument_count:>12} {sequential:>14.1f} {concurrent:>11.1f} {sequential / concurrent:>7.1f}x')
+
+    # a hanging instrument costs its caller the deadline, the other instruments answer as usual
+    connect(connection_service, 'hanging', io_time=2.0)
+
+    async def read_with_hanging():
+        return await asyncio.gather(gateway.get_value('hanging', LABEL, timeout=0.1),
+                                    gateway.get_value('instrument_0', LABEL, timeout=0.1), return_exceptions=True)
+
+    start = time.perf_counter()
+    results = gateway.run(read_with_hanging())
+    print(f'\nhanging instrument with a 100 ms deadline: {results} after {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    gateway.close()
+
+
+if __name__ == '__main__':
+    main()
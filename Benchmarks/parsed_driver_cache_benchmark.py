@@ -0,0 +1,72 @@
+"""
+Benchmark of parsing a library of .ini drivers (copies of the drivers in SampleDrivers) without a cache,
+and with the ParsedDriverCache: the first time (parsed and written to the cache folder), again in the same process,
+after a restart (a new cache reading the folder) and after every file was touched (hashed, not parsed).
+Run from the project root:
+    python Benchmarks/parsed_driver_cache_benchmark.py
+"""
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'InstrumentServer'))
+
+import driverParserService as dps
+from parsed_driver_cache import ParsedDriverCache
+
+SAMPLE_DRIVERS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'SampleDrivers')
+LIBRARY_SIZE = 300
+
+
+def create_library(directory: str) -> list:
+    samples = sorted(os.path.join(SAMPLE_DRIVERS, name) for name in os.listdir(SAMPLE_DRIVERS) if name.endswith('.ini'))
+    paths = []
+    for i in range(LIBRARY_SIZE):
+        path = os.path.join(directory, f'driver_{i}.ini')
+        shutil.copyfile(samples[i % len(samples)], path)
+        paths.append(path)
+    return paths
+
+
+def measure(parse, paths: list) -> float:
+    """Returns the ms to parse every driver in paths"""
+    start = time.perf_counter()
+    for path in paths:
+        parse(path)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    logger = logging.getLogger()
+    logger.setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as library, tempfile.TemporaryDirectory() as instance_path:
+        paths = create_library(library)
+        cache_directory = os.path.join(instance_path, 'parsed_drivers')
+
+        print(f'{LIBRARY_SIZE} drivers')
+        print(f"{'':>32} {'ms':>10} {'ms/driver':>10}")
+
+        def report(name: str, elapsed: float):
+            print(f'{name:>32} {elapsed:>10.1f} {elapsed / LIBRARY_SIZE:>10.3f}')
+
+        report('no cache', measure(dps.parseDriver, paths))
+
+        cache = ParsedDriverCache(cache_directory, logger)
+        report('cache, first time', measure(cache.parse_driver, paths))
+        report('cache, same process', measure(cache.parse_driver, paths))
+
+        restarted = ParsedDriverCache(cache_directory, logger)
+        report('cache, after a restart', measure(restarted.parse_driver, paths))
+
+        for path in paths:
+            os.utime(path, ns=(time.time_ns(), time.time_ns() + 1_000_000_000))
+        report('cache, files touched', measure(restarted.parse_driver, paths))
+        print(restarted.stats())
+
+
+if __name__ == '__main__':
+    main()
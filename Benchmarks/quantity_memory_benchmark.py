@@ -0,0 +1,146 @@
+"""
+Memory and construction time of the quantities of INSTRUMENT_COUNT connected instruments of the same model with
+QUANTITY_COUNT quantities each: one object copying every field of the driver per quantity and instrument (the layout
+QuantityManager had before, reproduced by CopiedQuantity) and QuantityManagers sharing their QuantityDefinitions,
+with the latest values, visibility and links of an instrument in its QuantityStates.
+Every instrument gets its own copy of the driver document first, like InstrumentConnectionService does, that copy is
+not counted. Run from the project root:
+    python Benchmarks/quantity_memory_benchmark.py
+"""
+import os
+import sys
+import gc
+import copy
+import time
+import logging
+import tempfile
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'InstrumentServer'))
+
+import driverParserService as dps
+from Instrument.instrument_manager import InstrumentManager
+from Instrument import quantity_definition
+from driver_library_benchmark import write_driver
+
+INSTRUMENT_COUNT = 50
+QUANTITY_COUNT = 500
+
+
+class CopiedQuantity:
+    """Every driver field copied into the quantity's own __dict__"""
+
+    def __init__(self, quantity_info: dict, write_method, read_method, str_true, str_false):
+        self.instrument_name = quantity_info['cute_name']
+        self.name = quantity_info['label']
+        self.data_type = quantity_info['data_type'].upper()
+        self.unit = quantity_info['unit']
+        self.default_value = quantity_info['def_value']
+        self.tool_tip = quantity_info['tool_tip']
+        self.low_lim = float(quantity_info['low_lim'])
+        self.high_lim = float(quantity_info['high_lim'])
+        self.x_name = quantity_info['x_name']
+        self.x_unit = quantity_info['x_unit']
+        self.combo_cmd = quantity_info['combo_cmd']
+        self.groupname = quantity_info['groupname']
+        self.section = quantity_info['section']
+        self.state_quant = quantity_info['state_quant']
+        self.state_values = quantity_info['state_values']
+        self.model_values = quantity_info['model_values']
+        self.option_values = quantity_info['option_values']
+        self.permission = quantity_info['permission']
+        self.show_in_measurement_dlg = quantity_info['show_in_measurement_dlg']
+        self.set_cmd = str(quantity_info['set_cmd'])
+        self.get_cmd = str(quantity_info['get_cmd'])
+        self.latest_value = quantity_info['latest_value']
+        self.is_visible = True
+        self._write_method = write_method
+        self._read_method = read_method
+        self.str_true = str_true
+        self.str_false = str_false
+        self.linked_quantity_get = None
+        self.linked_quantity_set = None
+
+
+class SimulatedInstrument(InstrumentManager):
+    """InstrumentManager without a VISA connection"""
+
+    def __init__(self, name, driver, logger):
+        self._name = name
+        self._driver = driver
+        self._logger = logger
+        self.quantities = dict()
+        self._initialize_quantities()
+
+    def write(self, msg):
+        pass
+
+    def read(self):
+        return ''
+
+    def close(self):
+        pass
+
+
+class CopyingInstrument(SimulatedInstrument):
+    def _initialize_quantities(self):
+        for name, info in self._driver['quantities'].items():
+            self.quantities[name] = CopiedQuantity(info, self.write, self.read, self._driver['visa']['str_true'],
+                                                   self._driver['visa']['str_false'])
+
+
+def create_documents(ini_path: str) -> list:
+    """A driver document per instrument, laid out like /instrumentDB/getInstrument returns it"""
+    driver = dps.parseDriver(ini_path)
+    documents = []
+    for i in range(INSTRUMENT_COUNT):
+        document = copy.deepcopy(driver)
+        for label, quantity in document['quantities'].items():
+            quantity.update(cute_name=f'instrument_{i}', latest_value=str(i))
+        documents.append(document)
+    return documents
+
+
+def measure(instrument_class, documents: list, logger: logging.Logger):
+    """Returns the bytes allocated while creating the instruments and the ms it took (timed without tracing)"""
+    copies = copy.deepcopy(documents)
+    start = time.perf_counter()
+    instruments = [instrument_class(f'instrument_{i}', document, logger) for i, document in enumerate(copies)]
+    elapsed = (time.perf_counter() - start) * 1000
+    # instruments reference themselves through their bound I/O methods, free them (and unused definitions) now
+    del instruments
+    gc.collect()
+
+    documents = copy.deepcopy(documents)
+    tracemalloc.start()
+    instruments = [instrument_class(f'instrument_{i}', document, logger) for i, document in enumerate(documents)]
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return allocated, elapsed
+
+
+def main():
+    logger = logging.getLogger()
+    logger.setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        ini_path = os.path.join(directory, 'synthetic.ini')
+        write_driver(ini_path, 0, QUANTITY_COUNT, broken=False)
+        documents = create_documents(ini_path)
+
+    print(f'{INSTRUMENT_COUNT} instruments x {QUANTITY_COUNT} quantities')
+    print(f"{'':>28} {'MiB':>8} {'bytes/quantity':>15} {'build ms':>9}")
+    quantity_count = INSTRUMENT_COUNT * QUANTITY_COUNT
+    for name, instrument_class in (('copied fields', CopyingInstrument), ('shared definitions', SimulatedInstrument)):
+        allocated, elapsed = measure(instrument_class, documents, logger)
+        print(f'{name:>28} {allocated / 2 ** 20:>8.2f} {allocated / quantity_count:>15.0f} {elapsed:>9.1f}')
+
+    instruments = [SimulatedInstrument(f'instrument_{i}', document, logger) for i, document in enumerate(documents)]
+    print(f'distinct quantity definitions in use: {quantity_definition.definition_count()}')
+    first, last = instruments[0].quantities['Quantity 0'], instruments[-1].quantities['Quantity 0']
+    print(f'shared: {first.definition is last.definition}, latest values: {first.latest_value}, {last.latest_value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Compares reading VECTOR and VECTOR_COMPLEX latest values (/instrumentDB/getLatestValue) as JSON text
+against NumPy .npy buffers, with and without gzip compression.
+
+Starts an Instrument Server (instrumentDB blueprint only) on a local port with the embedded SQLite backend,
+so no database server is needed. Run from the project root:
+    python Benchmarks/vector_transfer_benchmark.py
+"""
+import os
+import sys
+import time
+import logging
+import tempfile
+import threading
+import statistics
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'InstrumentServer'))
+
+import numpy as np
+import requests
+from werkzeug.serving import make_server
+
+import instrument_server_service
+from DB import db
+from DB import latest_value_store
+from Client.instrument_server_client import NPY_MIMETYPE, decode_npy
+from batch_latest_value_benchmark import create_app, BENCHMARK_INSTRUMENT
+
+POINT_COUNTS = (1000, 100000)
+REPEATS = 10
+PORT = 5094
+
+
+def add_instrument():
+    backend = instrument_server_service.get_service()._backend
+    backend.delete_instrument(BENCHMARK_INSTRUMENT)
+    backend.add_instrument({'cute_name': BENCHMARK_INSTRUMENT, 'interface': 'GPIB', 'address': '1'},
+                           {'general_settings': {'name': 'Benchmark', 'ini_path': 'benchmark.ini'},
+                            'model_and_options': {}, 'visa': {},
+                            'quantities': {'Trace': {'label': 'Trace', 'data_type': 'VECTOR'},
+                                           'Complex trace': {'label': 'Complex trace',
+                                                             'data_type': 'VECTOR_COMPLEX'}}})
+
+
+def measure(read) -> tuple:
+    """Returns (median ms, bytes on the wire) of one read"""
+    timings = []
+    wire_bytes = 0
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        wire_bytes = read()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), wire_bytes
+
+
+def main():
+    logger = logging.getLogger()
+    logger.setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as instance_path:
+        app = create_app(os.path.join(instance_path, 'benchmark.sqlite3'), logger)
+        app.config.update(VECTOR_COMPRESSION_LEVEL=1, VECTOR_COMPRESSION_MIN_SIZE=1024)
+        add_instrument()
+
+        server = make_server('127.0.0.1', PORT, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        url = f'http://127.0.0.1:{PORT}/instrumentDB/getLatestValue'
+        session = requests.Session()
+
+        def read(label, accept, encoding):
+            def run():
+                response = session.get(url, params={'cute_name': BENCHMARK_INSTRUMENT, 'label': label},
+                                       headers={'Accept': accept, 'Accept-Encoding': encoding})
+                if response.headers['Content-Type'].startswith(NPY_MIMETYPE):
+                    decode_npy(response.content)
+                else:
+                    # the text form a JSON client has to parse
+                    tokens = response.json()['latest_value'].strip('[]').split(',')
+                    if label == 'Trace':
+                        np.array(tokens, dtype=float)
+                    else:
+                        np.array([complex(token.strip(' ()')) for token in tokens])
+                # bytes received before decompression
+                return response.raw.tell()
+            return run
+
+        variants = (('json', 'application/json', 'identity'), ('npy', NPY_MIMETYPE, 'identity'),
+                    ('npy+gzip', NPY_MIMETYPE, 'gzip'))
+
+        print(f"{'quantity':>14} {'points':>8} " + ' '.join(f'{name + " ms":>12} {name + " bytes":>14}'
+                                                          for name, _, _ in variants))
+        rng = np.random.default_rng(0)
+        for point_count in POINT_COUNTS:
+            # latest values are stored in their text form, as the quantity managers write them
+            trace = np.round(rng.normal(size=point_count), 6)
+            complex_trace = trace + 1j * trace[::-1]
+            instrument_server_service.get_service().set_latest_values([
+                (BENCHMARK_INSTRUMENT, 'Trace', str(trace.tolist())),
+                (BENCHMARK_INSTRUMENT, 'Complex trace', str(complex_trace.tolist()))])
+
+            for label in ('Trace', 'Complex trace'):
+                row = f'{label:>14} {point_count:>8} '
+                for name, accept, encoding in variants:
+                    latency, wire_bytes = measure(read(label, accept, encoding))
+                    row += f'{latency:>12.2f} {wire_bytes:>14} '
+                print(row)
+
+        session.close()
+        server.shutdown()
+        latest_value_store.get_store().close()
+        app.extensions[db.BACKEND_EXTENSION_KEY].close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,413 @@
+"""
+Python client of the Instrument Server for automation scripts.
+
+    from Client.instrument_server_client import InstrumentServerClient
+
+    with InstrumentServerClient('http://127.0.0.1:5000') as client:
+        client.set_latest_value('dmm', 'Voltage', 1.5)
+
+        with client.batch() as batch:
+            voltage = batch.get('dmm', 'Voltage')
+            current = batch.get('dmm', 'Current')
+        print(voltage.value, current.value)
+
+All requests share one session with a pool of keep-alive connections. Idempotent requests are retried with
+exponential backoff when the connection fails or the server answers 502/503/504.
+"""
+import io
+import copy
+import json
+import threading
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_URL = 'http://127.0.0.1:5000'
+
+# Response header with the version of the returned driver document (see InstrumentServer/instrumentDB.py)
+DRIVER_VERSION_HEADER = 'X-Driver-Version'
+
+# Content type of vectors sent as NumPy .npy buffers (see InstrumentServer/vector_encoding.py)
+NPY_MIMETYPE = 'application/x-npy'
+
+
+class InstrumentServerError(Exception):
+    """The Instrument Server answered with an error status"""
+
+    def __init__(self, status_code: int, message):
+        super().__init__(f'{status_code}: {message}')
+        self.status_code = status_code
+        self.message = message
+
+
+###################################################################################
+# InstrumentServerClient
+###################################################################################
+class InstrumentServerClient:
+    """
+    Client of one Instrument Server, safe to share between threads.
+    Driver documents are cached and revalidated with their ETag, the server only sends them again when
+    the driver or one of its latest values changed.
+    """
+
+    def __init__(self, base_url=DEFAULT_URL, timeout=10.0, retries=3, backoff_factor=0.2, pool_size=10,
+                 cache_drivers=True):
+        self._base_url = base_url.rstrip('/')
+        self._timeout = timeout
+        self._pool_size = pool_size
+        self._cache_drivers = cache_drivers
+
+        # {(cute_name, fields): (etag, document)}
+        self._driver_cache = {}
+        self._driver_cache_lock = threading.Lock()
+
+        retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset({'GET', 'PUT', 'DELETE'}), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def close(self):
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # region server status
+    def is_running(self) -> bool:
+        try:
+            return self._request('GET', '/serverStatus/isRunning') is not None
+        except (requests.ConnectionError, InstrumentServerError):
+            return False
+    # endregion
+
+    # region instruments and drivers
+    def get_all_instruments(self, fields=None) -> dict:
+        """Returns {cute_name: {'manufacturer', 'interface', 'address'}}, only the given fields if not None"""
+        instruments = self._request('GET', '/instrumentDB/allInstruments',
+                                    params={'fields': ','.join(fields) if fields else None})
+        # the server answers with a message instead of an empty dict
+        return instruments if isinstance(instruments, dict) else {}
+
+    def get_instrument(self, cute_name: str, fields=None) -> dict:
+        """
+        Returns the driver document of cute_name, from the local cache while it is current.
+        fields selects sections ('quantities') or single entries ('quantities.Voltage'), all if None.
+        """
+        params = {'cute_name': cute_name, 'fields': ','.join(fields) if fields else None}
+        if not self._cache_drivers:
+            return self._request('GET', '/instrumentDB/getInstrument', params=params)
+
+        key = (cute_name, tuple(fields or ()))
+        with self._driver_cache_lock:
+            cached = self._driver_cache.get(key)
+
+        headers = {'If-None-Match': cached[0]} if cached else {}
+        response = self._send('GET', '/instrumentDB/getInstrument', params=params, headers=headers)
+        if response.status_code == HTTPStatus.NOT_MODIFIED and cached:
+            return copy.deepcopy(cached[1])
+
+        document = response.json()
+        with self._driver_cache_lock:
+            self._driver_cache[key] = (response.headers.get('ETag'), document)
+        return copy.deepcopy(document)
+
+    def get_instrument_settings(self, cute_name: str, fields=None) -> dict:
+        return self._request('GET', '/instrumentDB/getInstrumentSettings',
+                             params={'cute_name': cute_name, 'fields': ','.join(fields) if fields else None})
+
+    def get_driver_versions(self, cute_names=None) -> dict:
+        """Returns {cute_name: version} of the given instruments (all if None)"""
+        return self._request('GET', '/instrumentDB/getDriverVersions', params={'cute_name': cute_names or []})
+
+    def add_instrument(self, cute_name: str, path: str, interface: str, address=None, baud_rate=None,
+                       serial=False, visa=True) -> str:
+        """Adds an instrument using the .ini driver at path (a path on the server's file system)"""
+        return self._request('POST', '/instrumentDB/addInstrument', json={
+            'cute_name': cute_name, 'path': path, 'interface': interface, 'address': address,
+            'baud_rate': baud_rate, 'serial': str(serial), 'visa': str(visa)})
+
+    def import_driver_library(self, directory: str, workers=None) -> dict:
+        """Parses and validates every .ini driver in directory (a path on the server's file system),
+        returns the per-file report"""
+        return self._request('POST', '/driverParser/importLibrary', json={'directory': directory, 'workers': workers})
+
+    def reload_driver(self, cute_name: str) -> dict:
+        """Applies the changes of cute_name's .ini file without disconnecting it, returns what changed"""
+        return self._request('POST', '/instrumentDB/reloadDriver', params={'cute_name': cute_name})
+
+    def remove_instrument(self, cute_name: str) -> str:
+        self.forget_driver(cute_name)
+        return self._request('GET', '/instrumentDB/removeInstrument', params={'cute_name': cute_name})
+
+    def forget_driver(self, cute_name=None):
+        """Drops the cached driver document of cute_name (all if None)"""
+        with self._driver_cache_lock:
+            for key in list(self._driver_cache):
+                if cute_name is None or key[0] == cute_name:
+                    del self._driver_cache[key]
+    # endregion
+
+    # region latest values and history
+    def get_latest_value(self, cute_name: str, label: str):
+        response = self._request('GET', '/instrumentDB/getLatestValue', params={'cute_name': cute_name, 'label': label})
+        return response['latest_value']
+
+    def set_latest_value(self, cute_name: str, label: str, value):
+        self._request('PUT', '/instrumentDB/setLatestValue',
+                      params={'cute_name': cute_name, 'label': label, 'latest_value': value})
+
+    def get_value_history(self, cute_name: str, label: str, start=None, end=None, buckets=100) -> dict:
+        """Returns the history of a quantity downsampled into at most <buckets>. start and end are datetimes
+        or ISO 8601 strings (UTC if naive), by default the last 24 hours"""
+        params = {'cute_name': cute_name, 'label': label, 'buckets': buckets}
+        if start is not None:
+            params['start'] = start if isinstance(start, str) else start.isoformat()
+        if end is not None:
+            params['end'] = end if isinstance(end, str) else end.isoformat()
+        return self._request('GET', '/instrumentDB/getValueHistory', params=params)
+
+    def get_latest_values(self, quantities=(), instruments=()) -> dict:
+        """Returns {cute_name: {label: latest_value}} of the (cute_name, label) pairs in quantities
+        and of every quantity of the instruments, in one request"""
+        response = self._request('POST', '/instrumentDB/getLatestValues',
+                                 json={'quantities': [list(quantity) for quantity in quantities],
+                                       'instruments': list(instruments)})
+        return response['latest_values']
+
+    def set_latest_values(self, latest_values: list):
+        """Sets a list of (cute_name, label, value) in one request"""
+        self._request('PUT', '/instrumentDB/setLatestValues',
+                      json={'latest_values': [list(latest_value) for latest_value in latest_values]})
+
+    def get_vector(self, cute_name: str, label: str, live=False):
+        """
+        Returns the value of a VECTOR or VECTOR_COMPLEX quantity as a read-only numpy array (float64 or complex128)
+        backed by the response buffer. With live=True the value is read from the connected instrument,
+        otherwise the latest value is returned. Requires numpy.
+        """
+        headers = {'Accept': f'{NPY_MIMETYPE}, application/json;q=0.5'}
+        if live:
+            response = self._send('GET', self._instrument_path(cute_name, 'quantities', label), headers=headers)
+        else:
+            response = self._send('GET', '/instrumentDB/getLatestValue', headers=headers,
+                                  params={'cute_name': cute_name, 'label': label})
+
+        if response.headers.get('Content-Type', '').startswith(NPY_MIMETYPE):
+            return decode_npy(response.content)
+
+        # no value yet, or not a vector quantity (the server answered with JSON)
+        if response.json()['value' if live else 'latest_value'] is None:
+            return None
+        raise ValueError(f'{label} of {cute_name} is not a vector quantity.')
+
+    def batch(self):
+        """Collects latest value reads and writes and sends them together when the with block ends"""
+        return Batch(self)
+
+    def stream_latest_values(self, cute_name: str, labels=None, max_rate=None, read_timeout=60.0):
+        """
+        Yields {label: latest_value} of cute_name's quantities as they change, starting with the current values.
+        labels limits the quantities (all if None), max_rate the messages per second. Ends when the instrument
+        is removed, raises requests.ConnectionError if the server sends nothing (not even a keep-alive)
+        for read_timeout seconds.
+        """
+        params = {'label': list(labels or [])}
+        if max_rate is not None:
+            params['max_rate'] = max_rate
+
+        # streams are not retried, a reconnect would skip changes without the caller noticing
+        response = requests.get(self._base_url + self._instrument_path(cute_name, 'stream'), params=params,
+                                stream=True, timeout=(self._timeout, read_timeout))
+        with response:
+            if response.status_code >= HTTPStatus.MULTIPLE_CHOICES:
+                raise InstrumentServerError(response.status_code, self._error_message(response))
+
+            event, data = None, []
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith('event:'):
+                    event = line[len('event:'):].strip()
+                elif line.startswith('data:'):
+                    data.append(line[len('data:'):].strip())
+                elif not line and data:
+                    if event == 'instrument_removed':
+                        return
+                    if event == 'latest_values':
+                        yield json.loads('\n'.join(data))['latest_values']
+                    event, data = None, []
+    # endregion
+
+    # region live instrument I/O
+    def get_value(self, cute_name: str, label: str, timeout: float = None):
+        """Reads quantity label from the connected instrument cute_name,
+        the server gives up after timeout seconds (its default if None) and answers 504"""
+        return self._request('GET', self._instrument_path(cute_name, 'quantities', label),
+                             params={'timeout': timeout})['value']
+
+    def set_value(self, cute_name: str, label: str, value, timeout: float = None):
+        """Sets quantity label of the connected instrument cute_name to value (timeout like get_value)"""
+        self._request('PUT', self._instrument_path(cute_name, 'quantities', label), params={'timeout': timeout},
+                      json={'value': value})
+    # endregion
+
+    # region private helper methods
+    def _send(self, method: str, path: str, **kwargs) -> requests.Response:
+        response = self._session.request(method, self._base_url + path, timeout=self._timeout, **kwargs)
+        if response.status_code >= HTTPStatus.MULTIPLE_CHOICES and response.status_code != HTTPStatus.NOT_MODIFIED:
+            raise InstrumentServerError(response.status_code, self._error_message(response))
+        return response
+
+    @staticmethod
+    def _instrument_path(cute_name: str, *parts) -> str:
+        """Path of an /instruments resource, names may contain characters like '/' or spaces"""
+        return '/'.join(['/instruments', quote(cute_name, safe='')] + [quote(part, safe='') for part in parts])
+
+    @staticmethod
+    def _error_message(response: requests.Response):
+        try:
+            return response.json()
+        except ValueError:
+            return response.text
+
+    def _request(self, method: str, path: str, **kwargs):
+        return self._send(method, path, **kwargs).json()
+    # endregion
+
+
+def decode_npy(buffer: bytes):
+    """Returns the array in a .npy buffer without copying its data (the array is read-only)"""
+    import numpy as np
+
+    stream = io.BytesIO(buffer)
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+
+    count = 1
+    for dimension in shape:
+        count *= dimension
+    array = np.frombuffer(buffer, dtype=dtype, count=count, offset=stream.tell())
+    return array.reshape(shape, order='F' if fortran_order else 'C')
+
+
+###################################################################################
+# Batch
+###################################################################################
+class PendingValue:
+    """Result of a batched operation, available once the batch was executed"""
+
+    def __init__(self):
+        self._done = False
+        self._value = None
+        self._error = None
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    @property
+    def value(self):
+        """The value read (None for writes)
+            Raises:
+                RuntimeError -- if the batch was not executed yet
+                InstrumentServerError -- if the operation failed
+                KeyError -- if the quantity read does not exist
+        """
+        if not self._done:
+            raise RuntimeError('The batch has not been executed yet.')
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def _resolve(self, value=None, error=None):
+        self._value = value
+        self._error = error
+        self._done = True
+
+
+# value of the read operations of a batch
+_READ = object()
+
+
+class Batch:
+    """
+    Latest value reads and writes executed together: all writes in one /setLatestValues request,
+    then all reads in one /getLatestValues request. Against servers without the batch endpoints
+    the single value requests are pipelined over the client's pooled keep-alive connections.
+    """
+
+    def __init__(self, client: InstrumentServerClient):
+        self._client = client
+        self._operations = []
+
+    def get(self, cute_name: str, label: str) -> PendingValue:
+        pending = PendingValue()
+        self._operations.append((pending, (cute_name, label), _READ))
+        return pending
+
+    def set(self, cute_name: str, label: str, value) -> PendingValue:
+        pending = PendingValue()
+        self._operations.append((pending, (cute_name, label), value))
+        return pending
+
+    def execute(self) -> list:
+        """Runs all collected operations (writes before reads), returns their PendingValues in the order they were added"""
+        operations, self._operations = self._operations, []
+        writes = [(pending, quantity, value) for pending, quantity, value in operations if value is not _READ]
+        reads = [(pending, quantity) for pending, quantity, value in operations if value is _READ]
+
+        try:
+            if writes:
+                self._client.set_latest_values([(*quantity, value) for _, quantity, value in writes])
+                for pending, _, _ in writes:
+                    pending._resolve()
+
+            if reads:
+                latest_values = self._client.get_latest_values(quantities=[quantity for _, quantity in reads])
+                for pending, (cute_name, label) in reads:
+                    if label in latest_values.get(cute_name, {}):
+                        pending._resolve(latest_values[cute_name][label])
+                    else:
+                        pending._resolve(error=KeyError(f'Unknown quantity {label} of {cute_name}.'))
+
+        except InstrumentServerError as ex:
+            if ex.status_code != HTTPStatus.NOT_FOUND:
+                for pending, _, _ in operations:
+                    if not pending.done:
+                        pending._resolve(error=ex)
+            else:
+                self._pipeline([operation for operation in operations if not operation[0].done])
+
+        return [pending for pending, _, _ in operations]
+
+    def _pipeline(self, operations: list):
+        """Sends the operations as single value requests, concurrently over the pooled connections"""
+        def run(operation):
+            pending, (cute_name, label), value = operation
+            try:
+                if value is _READ:
+                    pending._resolve(self._client.get_latest_value(cute_name, label))
+                else:
+                    pending._resolve(self._client.set_latest_value(cute_name, label, value))
+            except Exception as ex:
+                pending._resolve(error=ex)
+
+        with ThreadPoolExecutor(max_workers=min(self._client._pool_size, len(operations))) as executor:
+            list(executor.map(run, operations))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
@@ -0,0 +1,372 @@
+import json
+import queue
+import itertools
+import socket
+import select
+import logging
+import datetime
+import threading
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import execute_values
+
+# Postgres NOTIFY channel the Instrument Server publishes its changes on
+CHANGE_CHANNEL = 'instrument_server_changes'
+
+# NOTIFY payloads must be shorter than 8000 bytes
+MAX_PAYLOAD_SIZE = 7900
+
+# Fields of an event left out of a notification that is too big
+TRUNCATED_FIELDS = ('value', 'added', 'changed', 'removed')
+
+# Event types
+LATEST_VALUE = 'latest_value'
+INSTRUMENT_ADDED = 'instrument_added'
+INSTRUMENT_REMOVED = 'instrument_removed'
+DRIVER_CHANGED = 'driver_changed'
+
+# The feed of the Instrument Server running in this process (None when running outside the server)
+_feed = None
+
+
+###################################################################################
+# Subscription
+###################################################################################
+class Subscription:
+    """
+    Queue of the change events a subscriber is interested in.
+    When the subscriber falls behind by more than max_queued events the oldest ones are dropped.
+    """
+
+    def __init__(self, feed, event_types=None, cute_name=None, max_queued=1000):
+        self._feed = feed
+        self._event_types = set(event_types) if event_types else None
+        self._cute_name = cute_name
+        self._queue = queue.Queue(maxsize=max_queued)
+        self.dropped = 0
+
+    def wants(self, event: dict) -> bool:
+        if self._event_types is not None and event['type'] not in self._event_types:
+            return False
+        return self._cute_name is None or event.get('cute_name') == self._cute_name
+
+    def put(self, event: dict):
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Returns the next event, or None if there was none within timeout seconds"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._feed.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class CoalescingSubscription(Subscription):
+    """
+    Subscription that keeps only the newest pending event of each quantity (and of each instrument for
+    added/removed events), so a slow subscriber skips intermediate values but never misses the current one.
+    Replaced events are counted as dropped.
+    """
+
+    def __init__(self, feed, event_types=None, cute_name=None, labels=None):
+        super().__init__(feed, event_types, cute_name)
+        self._labels = set(labels) if labels else None
+        self._condition = threading.Condition()
+        self._pending = {}
+
+    def wants(self, event: dict) -> bool:
+        if not super().wants(event):
+            return False
+        return self._labels is None or event['type'] != LATEST_VALUE or event.get('label') in self._labels
+
+    def put(self, event: dict):
+        key = (event['type'], event.get('cute_name'), event.get('label'))
+        with self._condition:
+            if self._pending.pop(key, None) is not None:
+                self.dropped += 1
+            self._pending[key] = event
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """Returns the oldest pending event, or None if there was none within timeout seconds"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._pending, timeout=timeout):
+                return None
+            return self._pending.pop(next(iter(self._pending)))
+
+    def get_all(self, timeout=None) -> list:
+        """Returns all pending events (oldest first), or an empty list if there were none within timeout seconds"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._pending, timeout=timeout):
+                return []
+            events, self._pending = list(self._pending.values()), {}
+            return events
+
+
+###################################################################################
+# ChangeFeed
+###################################################################################
+class ChangeFeed:
+    """
+    In-process publish/subscribe of latest value changes, added/removed instruments and reloaded drivers.
+    Events are dicts with 'type' (LATEST_VALUE, INSTRUMENT_ADDED, INSTRUMENT_REMOVED or DRIVER_CHANGED), 'cute_name',
+    'timestamp', for latest values 'label' and 'value' and for drivers the 'added', 'changed' and 'removed' labels.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._subscriptions = []
+        self._published = 0
+        self._delivered = 0
+        self._dropped = 0
+
+    def start(self):
+        pass
+
+    def close(self):
+        pass
+
+    def subscribe(self, event_types=None, cute_name=None, max_queued=1000) -> Subscription:
+        """Subscribes to the events of the given types (all if None) of cute_name (all instruments if None)"""
+        return self._add_subscription(Subscription(self, event_types, cute_name, max_queued))
+
+    def subscribe_coalescing(self, event_types=None, cute_name=None, labels=None) -> CoalescingSubscription:
+        """Like subscribe, only the newest pending event of each quantity is kept. Latest value events
+        are limited to the given labels (all if None)"""
+        return self._add_subscription(CoalescingSubscription(self, event_types, cute_name, labels))
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+                self._dropped += subscription.dropped
+
+    def publish(self, event_type: str, cute_name: str, **fields):
+        event = dict(type=event_type, cute_name=cute_name, timestamp=datetime.datetime.utcnow().isoformat(), **fields)
+        with self._lock:
+            self._published += 1
+        self._deliver(event)
+
+    def publish_latest_value(self, cute_name: str, label: str, value):
+        self.publish(LATEST_VALUE, cute_name, label=label, value=value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'subscribers': len(self._subscriptions),
+                'published': self._published,
+                'delivered': self._delivered,
+                'dropped': self._dropped + sum(subscription.dropped for subscription in self._subscriptions)
+            }
+
+    def _add_subscription(self, subscription: Subscription) -> Subscription:
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def _deliver(self, event: dict):
+        with self._lock:
+            subscriptions = [subscription for subscription in self._subscriptions if subscription.wants(event)]
+            self._delivered += len(subscriptions)
+
+        for subscription in subscriptions:
+            subscription.put(event)
+
+
+###################################################################################
+# PostgresChangeFeed
+###################################################################################
+class PostgresChangeFeed(ChangeFeed):
+    """
+    ChangeFeed shared by every process using the same database through LISTEN/NOTIFY on CHANGE_CHANNEL.
+    Local subscribers get events immediately. A background thread with its own connection sends the events
+    published in this process as notifications (all pending ones in one statement) and delivers the
+    notifications of other processes. Scripts can also LISTEN on CHANGE_CHANNEL, payloads are the JSON events.
+
+    While the database can not be reached only the newest pending latest value of each quantity is kept and at most
+    max_pending notifications wait, the oldest ones are dropped (counted in stats as dropped_notifications).
+    """
+
+    def __init__(self, dsn: str, logger: logging.Logger, reconnect_interval=5.0, max_pending=10000):
+        super().__init__(logger)
+        self._dsn = dsn
+        self._reconnect_interval = reconnect_interval
+        self._max_pending = max_pending
+        # {key: event} in publishing order, see _outgoing_key
+        self._outgoing = {}
+        self._outgoing_lock = threading.Lock()
+        self._outgoing_ids = itertools.count()
+        self._dropped_notifications = 0
+        self._stop_event = threading.Event()
+        self._listener = None
+        self._received = 0
+
+        # written to by publish to wake the listener thread up (select only accepts sockets on Windows)
+        self._wakeup_receiver, self._wakeup_sender = socket.socketpair()
+        self._wakeup_receiver.setblocking(False)
+        self._wakeup_sender.setblocking(False)
+
+    def start(self):
+        if self._listener is None:
+            self._listener = threading.Thread(target=self._run_listener, name='ChangeFeedListener', daemon=True)
+            self._listener.start()
+            self._logger.debug(f'{self.__class__.__name__} listening on {CHANGE_CHANNEL}...')
+
+    def close(self):
+        self._stop_event.set()
+        self._wake_up()
+        if self._listener is not None:
+            self._listener.join()
+            self._listener = None
+
+    def publish(self, event_type: str, cute_name: str, **fields):
+        event = dict(type=event_type, cute_name=cute_name, timestamp=datetime.datetime.utcnow().isoformat(), **fields)
+        with self._lock:
+            self._published += 1
+        self._deliver(event)
+
+        key = self._outgoing_key(event)
+        with self._outgoing_lock:
+            # a newer value of the same quantity replaces the pending one (and goes to the end)
+            if self._outgoing.pop(key, None) is not None:
+                self._dropped_notifications += 1
+            elif len(self._outgoing) >= self._max_pending:
+                del self._outgoing[next(iter(self._outgoing))]
+                self._dropped_notifications += 1
+            self._outgoing[key] = event
+        self._wake_up()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._lock:
+            stats['received'] = self._received
+        with self._outgoing_lock:
+            stats['pending_notifications'] = len(self._outgoing)
+            stats['dropped_notifications'] = self._dropped_notifications
+        return stats
+
+    def _outgoing_key(self, event: dict):
+        """Latest values are coalesced per quantity, every other event is sent"""
+        if event['type'] == LATEST_VALUE:
+            return event['type'], event['cute_name'], event.get('label')
+        return next(self._outgoing_ids)
+
+    def _wake_up(self):
+        try:
+            self._wakeup_sender.send(b'\0')
+        except OSError:
+            pass
+
+    def _run_listener(self):
+        while not self._stop_event.is_set():
+            connection = None
+            try:
+                connection = psycopg2.connect(self._dsn)
+                connection.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANGE_CHANNEL};")
+
+                while not self._stop_event.is_set():
+                    readable, _, _ = select.select([connection, self._wakeup_receiver], [], [], 1.0)
+                    if self._wakeup_receiver in readable:
+                        self._drain_wakeups()
+                    self._send_notifications(connection)
+                    if connection in readable:
+                        self._receive_notifications(connection)
+
+            except Exception as ex:
+                self._logger.error(f'Change feed connection failed, reconnecting in {self._reconnect_interval} '
+                                   f'seconds: {ex}')
+                self._stop_event.wait(self._reconnect_interval)
+
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def _drain_wakeups(self):
+        try:
+            while self._wakeup_receiver.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _send_notifications(self, connection):
+        with self._outgoing_lock:
+            outgoing, self._outgoing = self._outgoing, {}
+
+        payloads = []
+        for event in outgoing.values():
+            payload = json.dumps(event, default=str)
+            if len(payload.encode()) > MAX_PAYLOAD_SIZE:
+                # too big for a notification, subscribers can read the value with /instrumentDB/getLatestValue
+                # (and a changed driver with /instrumentDB/getInstrument)
+                payload = json.dumps(dict(event, **{key: None for key in TRUNCATED_FIELDS if key in event},
+                                          truncated=True), default=str)
+            payloads.append((CHANGE_CHANNEL, payload))
+
+        if payloads:
+            try:
+                with connection.cursor() as cursor:
+                    execute_values(cursor, "SELECT pg_notify(channel, payload) "
+                                           "FROM (VALUES %s) AS v(channel, payload);", payloads, page_size=len(payloads))
+            except Exception:
+                self._requeue(outgoing)
+                raise
+
+    def _requeue(self, outgoing: dict):
+        """Puts back the events of a batch that could not be sent, before the ones published since.
+        A newer pending value of the same quantity wins, the oldest events beyond max_pending are dropped."""
+        with self._outgoing_lock:
+            for key in outgoing.keys() & self._outgoing.keys():
+                del outgoing[key]
+                self._dropped_notifications += 1
+            outgoing.update(self._outgoing)
+            while len(outgoing) > self._max_pending:
+                del outgoing[next(iter(outgoing))]
+                self._dropped_notifications += 1
+            self._outgoing = outgoing
+
+    def _receive_notifications(self, connection):
+        connection.poll()
+        own_pid = connection.info.backend_pid
+        while connection.notifies:
+            notification = connection.notifies.pop(0)
+            # our own notifications were already delivered when they were published
+            if notification.pid == own_pid:
+                continue
+            try:
+                event = json.loads(notification.payload)
+            except ValueError:
+                self._logger.warning(f'Ignoring malformed change notification: {notification.payload}')
+                continue
+            with self._lock:
+                self._received += 1
+            self._deliver(event)
+
+
+def set_feed(feed: ChangeFeed):
+    global _feed
+    _feed = feed
+
+
+def get_feed() -> ChangeFeed:
+    return _feed
@@ -1,29 +1,297 @@
 import psycopg2
+import hashlib
 import logging
+import weakref
+import threading
+from collections import deque
+from contextlib import contextmanager
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
 from flask import current_app, g
 
+from DB import schema_catalog
+
+POOL_EXTENSION_KEY = 'db_pool'
+CATALOG_EXTENSION_KEY = 'db_catalog'
+BACKEND_EXTENSION_KEY = 'db_backend'
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
 def setLogger(logger: logging.Logger):
-    global my_logger 
+    global my_logger
     my_logger = logger
 
-def get_db():    
-    connection = psycopg2.connect(current_app.config['DATABASE'])
-    my_logger.debug("db connection established!")
-    return connection
+
+###################################################################################
+# ConnectionPool
+###################################################################################
+class ConnectionPool:
+    """
+    Thread safe pool of PostgreSQL connections.
+    min_size connections are opened up front, at most max_size are ever open at once.
+    Leases block for at most lease_timeout seconds when all connections are in use.
+    """
+
+    def __init__(self, dsn: str, min_size=1, max_size=10, lease_timeout=5.0, health_check=True):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError(f'Invalid pool size: min_size={min_size}, max_size={max_size}')
+
+        self._dsn = dsn
+        self._min_size = min_size
+        self._max_size = max_size
+        self._lease_timeout = lease_timeout
+        self._health_check = health_check
+
+        self._condition = threading.Condition()
+        self._idle = deque()
+        self._open = 0
+        self._in_use = 0
+        self._closed = False
+
+        self._leases = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._replaced = 0
+
+        for _ in range(min_size):
+            self._idle.append(self._connect())
+
+    def get(self):
+        """Leases a healthy connection from the pool"""
+        with self._condition:
+            if self._closed:
+                raise PoolError('Connection pool is closed.')
+
+            if not self._idle and self._open >= self._max_size:
+                self._waits += 1
+                if not self._condition.wait_for(lambda: self._idle or self._open < self._max_size or self._closed,
+                                                timeout=self._lease_timeout):
+                    self._timeouts += 1
+                    raise PoolTimeoutError(f'No database connection became available within '
+                                           f'{self._lease_timeout} seconds.')
+                if self._closed:
+                    raise PoolError('Connection pool is closed.')
+
+            connection = self._idle.popleft() if self._idle else None
+            # reserve the slot so other threads can not open past max_size while we connect
+            if connection is None:
+                self._open += 1
+            self._in_use += 1
+            self._leases += 1
+
+        try:
+            if connection is None:
+                connection = self._connect(reserved=True)
+            elif not self._is_healthy(connection):
+                my_logger.warning("Discarding broken db connection.")
+                self._discard(connection)
+                connection = self._connect(reserved=True)
+                with self._condition:
+                    self._replaced += 1
+        except Exception:
+            with self._condition:
+                self._open -= 1
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+        return connection
+
+    def put(self, connection):
+        """Returns a leased connection to the pool, discarding any uncommitted work"""
+        keep = not connection.closed
+        if keep and connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                keep = False
+
+        with self._condition:
+            self._in_use -= 1
+            if keep and not self._closed:
+                self._idle.append(connection)
+            else:
+                self._open -= 1
+                self._discard(connection)
+            self._condition.notify()
+
+    def close(self):
+        """Closes all idle connections, leased connections are closed as they are returned"""
+        with self._condition:
+            self._closed = True
+            while self._idle:
+                self._open -= 1
+                self._discard(self._idle.popleft())
+            self._condition.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                'min_size': self._min_size,
+                'max_size': self._max_size,
+                'lease_timeout': self._lease_timeout,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'total_leases': self._leases,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'replaced_connections': self._replaced
+            }
+
+    def _connect(self, reserved=False):
+        connection = psycopg2.connect(self._dsn)
+        if not reserved:
+            self._open += 1
+        my_logger.debug("db connection established!")
+        return connection
+
+    @staticmethod
+    def _discard(connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def _is_healthy(self, connection) -> bool:
+        if connection.closed:
+            return False
+
+        if connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+
+        if not self._health_check:
+            return True
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+
+def init_pool(app):
+    """Creates the connection pool for app using the DB_POOL_* config values"""
+    close_pool(app)
+    app.extensions[POOL_EXTENSION_KEY] = ConnectionPool(app.config['DATABASE'],
+                                                        min_size=app.config.get('DB_POOL_MIN_SIZE', 1),
+                                                        max_size=app.config.get('DB_POOL_MAX_SIZE', 10),
+                                                        lease_timeout=app.config.get('DB_POOL_LEASE_TIMEOUT', 5.0),
+                                                        health_check=app.config.get('DB_POOL_HEALTH_CHECK', True))
+    my_logger.debug("db connection pool created!")
+
+
+def close_pool(app):
+    connection_pool = app.extensions.pop(POOL_EXTENSION_KEY, None)
+    if connection_pool and not connection_pool.closed:
+        connection_pool.close()
+        my_logger.debug("db connection pool closed!")
+
+
+def get_pool_stats() -> dict:
+    return current_app.extensions[POOL_EXTENSION_KEY].stats()
+
+
+def get_backend():
+    """The storage backend selected by the DATABASE_BACKEND config value, created by init_db"""
+    return current_app.extensions[BACKEND_EXTENSION_KEY]
+
+
+def get_db():
+    """Leases a connection from the application's pool. Must be given back with close_db"""
+    return current_app.extensions[POOL_EXTENSION_KEY].get()
 
 def close_db(connection):
     if connection:
-        connection.close()
+        current_app.extensions[POOL_EXTENSION_KEY].put(connection)
+
+
+@contextmanager
+def lease():
+    """Leases a connection for the duration of a with block"""
+    connection = get_db()
+    try:
+        yield connection
+    finally:
+        close_db(connection)
+
+
+# Names of the server side prepared statements created on each connection (prepared statements live as long as
+# the session, so a pooled connection prepares each statement once and reuses it for every lease)
+_prepared_statements = weakref.WeakKeyDictionary()
+_prepared_statements_lock = threading.Lock()
+
+
+def execute_prepared(cursor, name: str, statement: str, params: tuple = ()):
+    """
+    Executes statement as the server side prepared statement <name> of the cursor's connection.
+    statement uses $1, $2, ... placeholders, params are bound to them in order.
+    The statement is planned by the server once per connection instead of once per call.
+    """
+    with _prepared_statements_lock:
+        prepared = _prepared_statements.setdefault(cursor.connection, set())
+
+    if name not in prepared:
+        cursor.execute(f"PREPARE {name} AS {statement};")
+        prepared.add(name)
+
+    if params:
+        cursor.execute(f"EXECUTE {name} ({','.join(['%s'] * len(params))});", params)
+    else:
+        cursor.execute(f"EXECUTE {name};")
+
+
+def get_catalog() -> schema_catalog.SchemaCatalog:
+    """Column catalog of the instrument database, built by init_db"""
+    return current_app.extensions[CATALOG_EXTENSION_KEY]
+
 
 def init_db(app):
+    """
+    Creates the storage backend selected by app.config['DATABASE_BACKEND']:
+        'postgres' -- PostgreSQL at app.config['DATABASE'] (default)
+        'sqlite' -- embedded SQLite file at app.config['SQLITE_DATABASE'], no database server required
+    """
+    backend_name = app.config.get('DATABASE_BACKEND', 'postgres')
+
+    if backend_name == 'sqlite':
+        from DB.sqlite_backend import SQLiteBackend
+        app.extensions[BACKEND_EXTENSION_KEY] = SQLiteBackend(app.config['SQLITE_DATABASE'], my_logger)
+        my_logger.debug("db is initialised!")
+        return
+
+    if backend_name != 'postgres':
+        raise ValueError(f"Unknown DATABASE_BACKEND '{backend_name}', expected 'postgres' or 'sqlite'.")
+
+    init_pool(app)
+
     with app.app_context():
-        
+
         connection = get_db()
         cursor = connection.cursor()
-        
+
         with current_app.open_resource('../DB/schema.sql', mode='r') as f:
-            cursor.execute(f.read())
+            schema = f.read()
+            cursor.execute(schema)
 
         cursor.close()
         connection.commit()
-        my_logger.debug("db is initialised!")     
\ No newline at end of file
+
+        # The schema version is the hash of schema.sql, the catalog is only re-read when it changes
+        schema_version = hashlib.sha1(schema.encode()).hexdigest()
+        app.extensions[CATALOG_EXTENSION_KEY] = schema_catalog.get_catalog(connection, schema_version)
+
+        close_db(connection)
+
+    from DB.postgres_backend import PostgresBackend
+    app.extensions[BACKEND_EXTENSION_KEY] = PostgresBackend(app)
+    my_logger.debug("db is initialised!")
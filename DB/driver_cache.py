@@ -0,0 +1,99 @@
+import uuid
+import threading
+from typing import Callable
+
+# The cache of the Instrument Server running in this process (None when running outside the server)
+_cache = None
+
+
+###################################################################################
+# DriverCache
+###################################################################################
+class DriverCache:
+    """
+    Assembled driver documents (see instrumentDBService.getInstrumentDocument) keyed by cute_name.
+    Every instrument has a version counter that is bumped whenever its rows change,
+    a cached document is only served while its version is current.
+    Cached documents are shared, callers must not modify them.
+    """
+
+    def __init__(self):
+        # version counters restart with the process, the epoch keeps version tags from repeating across restarts
+        self._epoch = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._documents = {}
+        self._versions = {}
+        # bumped whenever any instrument changes (added, removed or its settings updated)
+        self._catalog_version = 0
+        self._loading = {}
+        self._hits = 0
+        self._misses = 0
+
+    def version(self, cute_name: str) -> int:
+        with self._lock:
+            return self._versions.get(cute_name, 0)
+
+    def version_tag(self, cute_name: str) -> str:
+        """Opaque version of cute_name's document for clients, changes whenever the document does"""
+        return f'{self._epoch}-{self.version(cute_name)}'
+
+    def catalog_version_tag(self) -> str:
+        """Opaque version of the list of instruments, changes whenever any instrument does"""
+        with self._lock:
+            return f'{self._epoch}-{self._catalog_version}'
+
+    def invalidate(self, cute_name: str):
+        """Bumps the version of cute_name, call after any change to its rows"""
+        with self._lock:
+            self._versions[cute_name] = self._versions.get(cute_name, 0) + 1
+            self._catalog_version += 1
+            self._documents.pop(cute_name, None)
+
+    def get(self, cute_name: str, loader: Callable) -> dict:
+        """Returns the cached document of cute_name, calling loader() to (re)build it if it is missing or stale"""
+        with self._lock:
+            entry = self._documents.get(cute_name)
+            if entry and entry[0] == self._versions.get(cute_name, 0):
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+            load_lock = self._loading.setdefault(cute_name, threading.Lock())
+
+        # Only one thread loads a document, the others wait and use its result
+        with load_lock:
+            with self._lock:
+                version = self._versions.get(cute_name, 0)
+                entry = self._documents.get(cute_name)
+                if entry and entry[0] == version:
+                    # another thread loaded it while we waited
+                    self._misses -= 1
+                    self._hits += 1
+                    return entry[1]
+
+            document = loader()
+
+            with self._lock:
+                # an invalidate() during loading makes the document stale, do not cache it
+                if version == self._versions.get(cute_name, 0):
+                    self._documents[cute_name] = (version, document)
+
+        return document
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'cached_documents': len(self._documents),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': self._hits / lookups if lookups else None
+            }
+
+
+def set_cache(cache: DriverCache):
+    global _cache
+    _cache = cache
+
+
+def get_cache() -> DriverCache:
+    return _cache
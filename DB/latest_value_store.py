@@ -0,0 +1,152 @@
+import logging
+import datetime
+import threading
+from collections import deque
+from typing import Callable
+
+# The store of the Instrument Server running in this process (None when running outside the server)
+_store = None
+
+
+###################################################################################
+# LatestValueStore
+###################################################################################
+class LatestValueStore:
+    """
+    In-memory latest value of every (cute_name, label) pair.
+    Writes only touch memory, a background thread persists them with flush_method every flush_interval seconds.
+    Latest values written between two flushes are coalesced, the last value wins.
+    Every write is also kept as a history record, at most history_buffer_size records are buffered between flushes.
+    on_set(cute_name, label, latest_value) is called after every write (used to publish changes).
+    """
+
+    def __init__(self, flush_method: Callable, logger: logging.Logger, flush_interval=1.0, history_buffer_size=100000,
+                 on_set: Callable = None):
+        # flush_method receives a list of (cute_name, label, latest_value)
+        # and a list of (cute_name, label, recorded_at, value) history records, and stores all or none of them
+        self._flush_method = flush_method
+        self._on_set = on_set
+        self._logger = logger
+        self._flush_interval = flush_interval
+        self._history_buffer_size = history_buffer_size
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._values = {}
+        # write counter of every instrument, bumped whenever one of its values changes
+        self._versions = {}
+        self._dirty = set()
+        self._history = deque()
+        self._dropped_history = 0
+
+        self._stop_event = threading.Event()
+        self._flusher = None
+
+    def start(self):
+        """Starts the background flusher"""
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._run_flusher, name='LatestValueFlusher', daemon=True)
+            self._flusher.start()
+            self._logger.debug(f'{self.__class__.__name__} flushing every {self._flush_interval} seconds...')
+
+    def close(self):
+        """Stops the background flusher and persists everything that is still pending"""
+        self._stop_event.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+
+    def set(self, cute_name: str, label: str, latest_value):
+        self.set_many([(cute_name, label, latest_value)])
+
+    def set_many(self, latest_values: list):
+        """Writes a list of (cute_name, label, latest_value)"""
+        recorded_at = datetime.datetime.utcnow()
+        with self._lock:
+            for cute_name, label, latest_value in latest_values:
+                self._values[(cute_name, label)] = latest_value
+                self._versions[cute_name] = self._versions.get(cute_name, 0) + 1
+                self._dirty.add((cute_name, label))
+
+                if len(self._history) >= self._history_buffer_size:
+                    # the DB is not keeping up (or is down), drop the oldest record
+                    self._history.popleft()
+                    self._dropped_history += 1
+                self._history.append((cute_name, label, recorded_at, latest_value))
+
+        if self._on_set is not None:
+            for cute_name, label, latest_value in latest_values:
+                self._on_set(cute_name, label, latest_value)
+
+    def get(self, cute_name: str, label: str) -> tuple:
+        """Returns (True, latest_value) if the store knows the value, otherwise (False, None)"""
+        with self._lock:
+            key = (cute_name, label)
+            if key in self._values:
+                return True, self._values[key]
+            return False, None
+
+    def get_many(self, cute_name: str, labels) -> dict:
+        """Returns {label: latest_value} for the labels of cute_name that the store knows"""
+        with self._lock:
+            return {label: self._values[(cute_name, label)] for label in labels if (cute_name, label) in self._values}
+
+    def version(self, cute_name: str) -> int:
+        """Write counter of cute_name, changes whenever one of its latest values does"""
+        with self._lock:
+            return self._versions.get(cute_name, 0)
+
+    def discard_instrument(self, cute_name: str):
+        """Forgets all values (including unflushed ones) of a removed instrument"""
+        with self._lock:
+            self._versions[cute_name] = self._versions.get(cute_name, 0) + 1
+            for key in [key for key in self._values if key[0] == cute_name]:
+                del self._values[key]
+                self._dirty.discard(key)
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._dirty)
+
+    def flush(self):
+        """Persists all values and history records written since the last flush"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty and not self._history:
+                    return
+                batch = [(cute_name, label, self._values[(cute_name, label)]) for cute_name, label in self._dirty]
+                history = list(self._history)
+                self._dirty.clear()
+                self._history.clear()
+
+                if self._dropped_history:
+                    self._logger.warning(f'Dropped {self._dropped_history} quantity history records, buffer was full.')
+                    self._dropped_history = 0
+
+            try:
+                self._flush_method(batch, history)
+            except Exception as ex:
+                self._logger.error(f'Failed to persist {len(batch)} latest values and {len(history)} history records, '
+                                   f'will retry: {ex}')
+                # nothing was stored, requeue, unless the instrument was removed in the meantime
+                with self._lock:
+                    self._dirty.update((cute_name, label) for cute_name, label, _ in batch
+                                       if (cute_name, label) in self._values)
+                    room = self._history_buffer_size - len(self._history)
+                    if room > 0:
+                        self._history.extendleft(reversed(history[-room:]))
+
+    def _run_flusher(self):
+        while not self._stop_event.wait(self._flush_interval):
+            self.flush()
+
+
+def set_store(store: LatestValueStore):
+    global _store
+    _store = store
+
+
+def get_store() -> LatestValueStore:
+    return _store
@@ -0,0 +1,222 @@
+import time
+import bisect
+import functools
+import threading
+from typing import Callable
+from flask import g, request
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, label_values, extra='') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, label_values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+###################################################################################
+# Histogram
+###################################################################################
+class Histogram:
+    """Latency distribution per combination of label values, observing costs a lock and a bisect"""
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # {label values: [count per bucket (the last one is +Inf), sum]}
+        self._series = {}
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self._buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def time(self, *label_values):
+        """Context manager observing the duration of its block"""
+        return _Timer(self, label_values)
+
+    def render(self) -> list:
+        with self._lock:
+            series = [(label_values, list(counts), total) for label_values, (counts, total) in self._series.items()]
+
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for label_values, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self._buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                labels = _format_labels(self.labelnames, label_values, 'le="' + le + '"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, label_values)
+            lines.append(f'{self.name}_sum{labels} {repr(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, label_values: tuple):
+        self._histogram = histogram
+        self._label_values = label_values
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._histogram.observe(time.perf_counter() - self._start, *self._label_values)
+
+
+###################################################################################
+# Counter
+###################################################################################
+class Counter:
+    """Monotonic count per combination of label values"""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        lines += [f'{self.name}{_format_labels(self.labelnames, label_values)} {_format_value(value)}'
+                  for label_values, value in values]
+        return lines
+
+
+###################################################################################
+# CallbackMetric
+###################################################################################
+class CallbackMetric:
+    """
+    Gauge or counter read from the server's components when the metrics are scraped.
+    callback() returns {label values tuple: value}, values that are not numbers are left out.
+    """
+
+    def __init__(self, name: str, documentation: str, metric_type: str, labelnames, callback: Callable):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.labelnames = tuple(labelnames)
+        self._callback = callback
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        for label_values, value in sorted(self._callback().items()):
+            if isinstance(value, (int, float)):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, label_values)} {_format_value(value)}')
+        return lines
+
+
+###################################################################################
+# MetricsRegistry
+###################################################################################
+class MetricsRegistry:
+    """The metrics of the server, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        """Adds metric, replacing a metric with the same name (an app created again re-registers its callbacks)"""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def register_callback(self, name: str, documentation: str, metric_type: str, labelnames, callback: Callable):
+        return self.register(CallbackMetric(name, documentation, metric_type, labelnames, callback))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            try:
+                lines += metric.render()
+            except Exception as ex:
+                # a failing component (e.g. the DB is down) must not hide the other metrics
+                lines.append(f'# {metric.name} unavailable: {_escape(ex)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    'instrument_server_request_duration_seconds', 'Time to handle a request (until the first byte of streams).',
+    ('endpoint', 'method', 'status')))
+
+DB_QUERY_LATENCY = REGISTRY.register(Histogram(
+    'instrument_server_db_query_duration_seconds', 'Time of storage backend operations, including waiting for '
+    'a pooled connection.', ('operation',)))
+
+INSTRUMENT_IO_LATENCY = REGISTRY.register(Histogram(
+    'instrument_server_instrument_io_duration_seconds', 'Time of instrument reads and writes per quantity.',
+    ('cute_name', 'quantity', 'operation')))
+
+SWEEP_POINTS = REGISTRY.register(Counter(
+    'instrument_server_sweep_points_total', 'Data points recorded by experiment sweeps.'))
+
+SWEEP_STEP_LATENCY = REGISTRY.register(Histogram(
+    'instrument_server_sweep_step_duration_seconds', 'Time to set the inputs and read the outputs of one sweep step.'))
+
+
+def timed_query(method: Callable) -> Callable:
+    """Decorator of storage backend methods, observes their duration in DB_QUERY_LATENCY"""
+    operation = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            DB_QUERY_LATENCY.observe(time.perf_counter() - start, operation)
+
+    return wrapper
+
+
+def init_app(app):
+    """Observes the latency of every request of app in REQUEST_LATENCY"""
+
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    def observe(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            REQUEST_LATENCY.observe(time.perf_counter() - start, request.endpoint or 'unmatched', request.method,
+                                    response.status_code)
+        return response
+
+    app.before_request(start_timer)
+    app.after_request(observe)
@@ -0,0 +1,108 @@
+from contextlib import contextmanager
+from psycopg2 import errors
+
+# instrumentDBService lives next to the server modules (InstrumentServer is on sys.path when the server runs)
+import instrumentDBService as ids
+from DB import db
+from DB import change_feed
+from DB import metrics
+from DB.storage_backend import StorageBackend, DuplicateInstrumentError
+
+UniqueViolation = errors.lookup('23505')
+
+
+###################################################################################
+# PostgresBackend
+###################################################################################
+class PostgresBackend(StorageBackend):
+    """
+    PostgreSQL storage (DB/schema.sql) using the application's connection pool and schema catalog.
+    Created by db.init_db once the pool and catalog exist.
+    """
+
+    name = 'postgres'
+
+    def __init__(self, app):
+        self._app = app
+
+    @contextmanager
+    def _lease(self):
+        # instrumentDBService reads the catalog from the current app, so every call runs in its context
+        with self._app.app_context(), db.lease() as connection:
+            yield connection
+
+    @metrics.timed_query
+    def add_instrument(self, ins_interface: dict, instrument_details: dict):
+        with self._lease() as connection:
+            try:
+                ids.addInstrumentDetails(connection, ins_interface, instrument_details)
+                connection.commit()
+            except UniqueViolation:
+                raise DuplicateInstrumentError(f"Instrument {ins_interface['cute_name']} already exists.")
+
+    @metrics.timed_query
+    def delete_instrument(self, cute_name: str):
+        with self._lease() as connection:
+            ids.deleteInstrument(connection, cute_name)
+
+    @metrics.timed_query
+    def get_all_instruments(self) -> list:
+        with self._lease() as connection, connection.cursor() as cursor:
+            cursor.execute("SELECT cute_name, manufacturer, interface, address, serial, visa FROM instruments;")
+            column_names = [column.name for column in cursor.description]
+            return [dict(zip(column_names, instrument)) for instrument in cursor.fetchall()]
+
+    @metrics.timed_query
+    def get_instrument_document(self, cute_name: str) -> dict:
+        with self._lease() as connection:
+            return ids.getInstrumentDocument(connection, cute_name)
+
+    @metrics.timed_query
+    def update_setting(self, table: str, column: str, value, key_column: str, key_value):
+        with self._lease() as connection:
+            ids.updateSetting(connection, table, column, value, key_column, key_value)
+
+    @metrics.timed_query
+    def apply_driver_changes(self, cute_name: str, changes: dict):
+        with self._lease() as connection:
+            ids.applyDriverChanges(connection, cute_name, changes)
+
+    @metrics.timed_query
+    def get_latest_value(self, cute_name: str, label: str) -> str:
+        with self._lease() as connection:
+            return ids.getLatestValue(connection, cute_name, label)
+
+    @metrics.timed_query
+    def get_latest_values(self, quantities: list, cute_names: list) -> list:
+        with self._lease() as connection:
+            return ids.getLatestValues(connection, quantities, cute_names)
+
+    @metrics.timed_query
+    def set_latest_values(self, latest_values: list):
+        with self._lease() as connection:
+            ids.setLatestValues(connection, latest_values)
+
+    @metrics.timed_query
+    def add_quantity_history(self, history: list):
+        with self._lease() as connection:
+            ids.addQuantityHistory(connection, history)
+
+    @metrics.timed_query
+    def persist(self, latest_values: list, history: list):
+        with self._lease() as connection:
+            ids.persistLatestValues(connection, latest_values, history)
+
+    @metrics.timed_query
+    def get_quantity_history(self, cute_name: str, label: str, start, end, buckets: int) -> list:
+        with self._lease() as connection:
+            return ids.getQuantityHistory(connection, cute_name, label, start, end, buckets)
+
+    def create_change_feed(self, logger) -> change_feed.ChangeFeed:
+        return change_feed.PostgresChangeFeed(self._app.config['DATABASE'], logger)
+
+    def stats(self) -> dict:
+        with self._app.app_context():
+            return dict(db.get_pool_stats(), backend=self.name)
+
+    def close(self):
+        db.close_pool(self._app)
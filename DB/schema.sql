@@ -143,3 +143,19 @@ CREATE TABLE IF NOT EXISTS quantities (
 
 -- ALTER TABLE quantities RENAME COLUMN "groupname" TO "group";
 
+
+
+/*	Append-only history of every value read from or written to a quantity.
+	Partitioned by month on recorded_at, partitions are created on demand when history is written.
+	numeric_value holds the value as a number (NULL if the value is not numeric) for range aggregates.
+	No foreign key: history is kept after an instrument is removed.
+*/
+CREATE TABLE IF NOT EXISTS quantity_history (
+	cute_name TEXT NOT NULL,
+	label TEXT NOT NULL,
+	recorded_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc'),
+	value TEXT,
+	numeric_value DOUBLE PRECISION
+) PARTITION BY RANGE (recorded_at);
+
+CREATE INDEX IF NOT EXISTS quantity_history_lookup ON quantity_history (cute_name, label, recorded_at);
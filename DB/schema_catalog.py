@@ -0,0 +1,78 @@
+import threading
+
+# Catalogs already read from the database, keyed by schema version
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+###################################################################################
+# SchemaCatalog
+###################################################################################
+class SchemaCatalog:
+    """
+    Column names and types of every table in the instrument database.
+    Read from information_schema once per schema version instead of once per query.
+    """
+
+    def __init__(self, version: str, table_columns: dict):
+        # table_columns: {table: ((column_name, data_type, udt_name), ...)} in ordinal order
+        self._version = version
+        self._columns = {table: tuple(column[0] for column in columns) for table, columns in table_columns.items()}
+        self._types = {table: {column[0]: column[2] for column in columns} for table, columns in table_columns.items()}
+        self._array_columns = {table: frozenset(column[0] for column in columns if column[1] == 'ARRAY')
+                               for table, columns in table_columns.items()}
+        self._json_columns = {table: frozenset(column[0] for column in columns if column[1] in ('json', 'jsonb'))
+                              for table, columns in table_columns.items()}
+
+    @classmethod
+    def load(cls, connection, version: str):
+        """Reads all columns of the current schema with a single information_schema query"""
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT table_name, column_name, data_type, udt_name FROM information_schema.columns "
+                           "WHERE table_schema = current_schema() ORDER BY table_name, ordinal_position;")
+            rows = cursor.fetchall()
+
+        table_columns = {}
+        for table, column_name, data_type, udt_name in rows:
+            table_columns.setdefault(table, []).append((column_name, data_type, udt_name))
+
+        return cls(version, table_columns)
+
+    @property
+    def version(self) -> str:
+        return self._version
+
+    def tables(self) -> tuple:
+        return tuple(self._columns.keys())
+
+    def columns(self, table: str) -> tuple:
+        """Column names of table in the order they were declared"""
+        return self._columns[table]
+
+    def column_type(self, table: str, column: str) -> str:
+        """Postgres type name of column (ex. 'text', '_text' for TEXT[], 'datatype' for enums)"""
+        return self._types[table][column]
+
+    def array_columns(self, table: str) -> frozenset:
+        return self._array_columns[table]
+
+    def json_columns(self, table: str) -> frozenset:
+        return self._json_columns[table]
+
+
+def get_catalog(connection, version: str) -> SchemaCatalog:
+    """Returns the cached catalog for version, reading it from the database only if the version is new"""
+    with _catalogs_lock:
+        catalog = _catalogs.get(version)
+        if catalog is None:
+            catalog = SchemaCatalog.load(connection, version)
+            _catalogs.clear()
+            _catalogs[version] = catalog
+
+    return catalog
+
+
+def invalidate():
+    """Drops all cached catalogs, the next get_catalog call reads information_schema again"""
+    with _catalogs_lock:
+        _catalogs.clear()
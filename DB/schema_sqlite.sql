@@ -0,0 +1,114 @@
+-- SQLite version of schema.sql used by the embedded storage backend (DATABASE_BACKEND = 'sqlite')
+-- Enums are TEXT with CHECK constraints. Declared types are read by DB/sqlite_backend.py:
+--	TEXT_ARRAY	list stored as JSON text (TEXT[] in Postgres)
+--	JSON_TEXT	JSON document stored as text (JSON in Postgres)
+--	BOOLEAN		stored as 0/1, returned as True/False
+
+PRAGMA foreign_keys = ON;
+
+-- contains instrument and connection details
+CREATE TABLE IF NOT EXISTS instruments (
+	cute_name TEXT PRIMARY KEY NOT NULL,
+	manufacturer TEXT NOT NULL,
+	interface TEXT NOT NULL,
+	address TEXT,
+	serial BOOLEAN,
+	visa BOOLEAN
+);
+
+-- contains basic info of the instrument driver
+CREATE TABLE IF NOT EXISTS general_settings (
+	cute_name TEXT PRIMARY KEY REFERENCES instruments(cute_name) ON UPDATE CASCADE,
+	name TEXT NOT NULL,
+	ini_path TEXT NOT NULL,
+	driver_path TEXT,
+	interface TEXT DEFAULT 'GPIB',
+	address TEXT,
+	startup TEXT DEFAULT 'Set config',
+	driver_type TEXT CHECK (driver_type IN ('Auto', 'None', 'CR', 'LF', 'CR+LF')),
+	upload_datetime TIMESTAMP DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+);
+
+CREATE TABLE IF NOT EXISTS model_and_options (
+	cute_name TEXT PRIMARY KEY REFERENCES instruments(cute_name) ON UPDATE CASCADE,
+	check_model BOOLEAN DEFAULT 0,
+	model_cmd TEXT DEFAULT '*IDN?',
+	models TEXT_ARRAY,
+	model_ids TEXT_ARRAY,
+	check_options BOOLEAN,
+	option_cmd TEXT,
+	options TEXT_ARRAY,
+	option_ids TEXT_ARRAY,
+	-- option_cmd must be defined if check_options is true
+	CONSTRAINT option_cmd_if_check_options
+		CHECK ((NOT check_options) OR (option_cmd IS NOT NULL))
+);
+
+-- VISA settings of driver
+CREATE TABLE IF NOT EXISTS visa (
+	cute_name TEXT PRIMARY KEY REFERENCES instruments(cute_name) ON UPDATE CASCADE,
+	use_visa BOOLEAN,
+	reset BOOLEAN DEFAULT 0,
+	query_instr_errors BOOLEAN,
+	error_bit_mask INTEGER,
+	error_cmd TEXT,
+	init TEXT,
+	final TEXT,
+	str_true TEXT DEFAULT '1',
+	str_false TEXT DEFAULT '0',
+	str_value_out TEXT DEFAULT '%.9e%',
+	str_value_strip_start INTEGER DEFAULT 0,
+	str_value_strip_end INTEGER DEFAULT 0,
+	always_read_after_write BOOLEAN DEFAULT 0,
+	timeout INTEGER, -- in seconds
+	term_char TEXT CHECK (term_char IN ('Auto', 'None', 'CR', 'LF', 'CR+LF')),
+	send_end_on_write BOOLEAN,
+	supress_end_on_read BOOLEAN,
+	baud_rate INTEGER DEFAULT 9600,
+	data_bits INTEGER DEFAULT 8,
+	stop_bits FLOAT DEFAULT 1,
+	parity TEXT CHECK (parity IN ('No parity', 'Odd parity', 'Even parity')),
+	gpib_board INTEGER DEFAULT 0,
+	gpib_go_to_local BOOLEAN DEFAULT 0,
+	tcpip_specify_port BOOLEAN DEFAULT 0,
+	tcpip_port TEXT,
+	CONSTRAINT tcpip_port_specified CHECK ((NOT tcpip_specify_port) OR (tcpip_port IS NOT NULL))
+);
+
+CREATE TABLE IF NOT EXISTS quantities (
+	cute_name TEXT REFERENCES instruments(cute_name) ON UPDATE CASCADE,
+	label TEXT,
+	data_type TEXT CHECK (data_type IN ('DOUBLE', 'BOOLEAN', 'COMBO', 'STRING', 'COMPLEX',
+	'VECTOR', 'VECTOR_COMPLEX', 'PATH', 'BUTTON')),
+	unit TEXT,
+	def_value TEXT,
+	tool_tip TEXT,
+	low_lim TEXT DEFAULT '-INF',
+	high_lim TEXT DEFAULT '+INF',
+	x_name TEXT,
+	x_unit TEXT,
+	combo_cmd JSON_TEXT,
+	groupname TEXT,
+	section TEXT,
+	state_quant TEXT,
+	state_values TEXT_ARRAY,
+	model_values TEXT_ARRAY,
+	option_values TEXT_ARRAY,
+	permission TEXT DEFAULT 'BOTH' CHECK (permission IN ('BOTH', 'READ', 'WRITE', 'NONE')),
+	show_in_measurement_dlg BOOLEAN,
+	set_cmd TEXT,
+	get_cmd TEXT DEFAULT 'set_cmd?',
+	latest_value TEXT,
+	PRIMARY KEY (cute_name, label)
+);
+
+-- Append-only history of quantity values (not partitioned, see schema.sql)
+CREATE TABLE IF NOT EXISTS quantity_history (
+	cute_name TEXT NOT NULL,
+	label TEXT NOT NULL,
+	recorded_at TIMESTAMP NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+	value TEXT,
+	numeric_value DOUBLE PRECISION
+);
+
+CREATE INDEX IF NOT EXISTS quantity_history_lookup ON quantity_history (cute_name, label, recorded_at);
@@ -0,0 +1,320 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+from DB import metrics
+from DB.storage_backend import StorageBackend, DuplicateInstrumentError
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema_sqlite.sql')
+
+# Tables of a driver document in the order rows must be deleted
+DOCUMENT_TABLES = ('general_settings', 'model_and_options', 'visa', 'quantities', 'instruments')
+
+TRUE_STRINGS = ('1', 't', 'true', 'y', 'yes', 'on')
+
+
+###################################################################################
+# SQLiteBackend
+###################################################################################
+class SQLiteBackend(StorageBackend):
+    """
+    Embedded storage in a single SQLite file (DB/schema_sqlite.sql), no database server required.
+    Lists and JSON documents are stored as JSON text. One connection is shared by all threads,
+    so database_path may be ':memory:'.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, database_path: str, logger: logging.Logger):
+        self._logger = logger
+        self._database_path = database_path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(database_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA foreign_keys = ON;")
+        if database_path != ':memory:':
+            self._connection.execute("PRAGMA journal_mode = WAL;")
+            self._connection.execute("PRAGMA synchronous = NORMAL;")
+
+        with open(SCHEMA_PATH, mode='r') as f:
+            self._connection.executescript(f.read())
+
+        # {table: {column: declared type}} in declared order (the catalog of this backend)
+        # and {table: {column: DEFAULT expression or NULL}}
+        self._columns = {}
+        self._defaults = {}
+        for (table,) in self._connection.execute("SELECT name FROM sqlite_master WHERE type = 'table';").fetchall():
+            table_info = self._connection.execute(f"PRAGMA table_info({table});").fetchall()
+            self._columns[table] = {column[1]: column[2].upper() for column in table_info}
+            self._defaults[table] = {column[1]: column[4] or 'NULL' for column in table_info}
+
+        self._logger.debug(f'SQLite database opened: {database_path}')
+
+    # region driver documents
+    @metrics.timed_query
+    def add_instrument(self, ins_interface: dict, instrument_details: dict):
+        cute_name = ins_interface['cute_name']
+        model_options = self._split_models(instrument_details['model_and_options'])
+
+        rows = [('instruments', dict(self._row_values('instruments', ins_interface),
+                                     manufacturer=instrument_details['general_settings']['name'])),
+                ('general_settings', dict(self._row_values('general_settings', instrument_details['general_settings']),
+                                          cute_name=cute_name)),
+                ('model_and_options', dict(self._row_values('model_and_options', model_options), cute_name=cute_name)),
+                ('visa', dict(self._row_values('visa', instrument_details['visa']), cute_name=cute_name))]
+        rows += [('quantities', dict(self._row_values('quantities', quantity), cute_name=cute_name))
+                 for quantity in instrument_details['quantities'].values()]
+
+        try:
+            with self._transaction() as connection:
+                for table, values in rows:
+                    connection.execute(f"INSERT INTO {table} ({','.join(values.keys())}) "
+                                       f"VALUES ({','.join('?' * len(values))});", tuple(values.values()))
+
+        except sqlite3.IntegrityError as ex:
+            if 'UNIQUE' in str(ex):
+                raise DuplicateInstrumentError(f'Instrument {cute_name} already exists.')
+            raise
+
+    @metrics.timed_query
+    def apply_driver_changes(self, cute_name: str, changes: dict):
+        settings = dict(changes['settings'])
+        if 'model_and_options' in settings:
+            settings['model_and_options'] = self._split_models(settings['model_and_options'])
+
+        with self._transaction() as connection:
+            for table, values in settings.items():
+                self._update_row(connection, table, values, cute_name)
+            connection.executemany("DELETE FROM quantities WHERE cute_name = ? AND label = ?;",
+                                   [(cute_name, label) for label in changes['removed']])
+            for label, values in changes['changed'].items():
+                self._update_row(connection, 'quantities', values, cute_name, label)
+            for quantity in changes['added'].values():
+                values = dict(self._row_values('quantities', quantity), cute_name=cute_name)
+                connection.execute(f"INSERT INTO quantities ({','.join(values.keys())}) "
+                                   f"VALUES ({','.join('?' * len(values))});", tuple(values.values()))
+
+    @metrics.timed_query
+    def delete_instrument(self, cute_name: str):
+        with self._transaction() as connection:
+            for table in DOCUMENT_TABLES:
+                connection.execute(f"DELETE FROM {table} WHERE cute_name = ?;", (cute_name,))
+
+    @metrics.timed_query
+    def get_all_instruments(self) -> list:
+        return self._select('instruments', None)
+
+    @metrics.timed_query
+    def get_instrument_document(self, cute_name: str) -> dict:
+        with self._lock:
+            instrument_interface = self._select('instruments', cute_name)
+            if not instrument_interface:
+                raise KeyError(f'No instrument named {cute_name}.')
+
+            return {'instrument_interface': instrument_interface[0],
+                    'general_settings': next(iter(self._select('general_settings', cute_name)), None),
+                    'model_and_options': next(iter(self._select('model_and_options', cute_name)), None),
+                    'visa': next(iter(self._select('visa', cute_name)), None),
+                    'quantities': {quantity['label']: quantity for quantity in self._select('quantities', cute_name)}}
+
+    @metrics.timed_query
+    def update_setting(self, table: str, column: str, value, key_column: str, key_value):
+        if column not in self._columns.get(table, {}) or key_column not in self._columns[table]:
+            raise KeyError(f'Unknown column {column} or {key_column} in table {table}.')
+
+        with self._lock:
+            self._connection.execute(f"UPDATE {table} SET {column} = ? WHERE {key_column} = ?;",
+                                     (self._to_sqlite(self._columns[table][column], value), key_value))
+    # endregion
+
+    # region latest values and history
+    @metrics.timed_query
+    def get_latest_value(self, cute_name: str, label: str) -> str:
+        with self._lock:
+            row = self._connection.execute("SELECT latest_value FROM quantities WHERE cute_name = ? AND label = ?;",
+                                           (cute_name, label)).fetchone()
+        return row[0]
+
+    @metrics.timed_query
+    def get_latest_values(self, quantities: list, cute_names: list) -> list:
+        if not quantities and not cute_names:
+            return []
+
+        # pairs and names are passed as JSON arrays so the statement does not depend on their number
+        latest_values_query = """
+            SELECT cute_name, label, latest_value FROM quantities
+            WHERE (cute_name, label) IN (SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]')
+                                         FROM json_each(:quantities))
+               OR cute_name IN (SELECT value FROM json_each(:cute_names));"""
+
+        with self._lock:
+            return self._connection.execute(latest_values_query, {
+                'quantities': json.dumps([list(quantity) for quantity in quantities]),
+                'cute_names': json.dumps(list(cute_names))
+            }).fetchall()
+
+    @metrics.timed_query
+    def set_latest_values(self, latest_values: list):
+        if not latest_values:
+            return
+
+        with self._transaction() as connection:
+            self._update_latest_values(connection, latest_values)
+
+    @metrics.timed_query
+    def add_quantity_history(self, history: list):
+        if not history:
+            return
+
+        with self._transaction() as connection:
+            self._insert_quantity_history(connection, history)
+
+    @metrics.timed_query
+    def persist(self, latest_values: list, history: list):
+        if not latest_values and not history:
+            return
+
+        with self._transaction() as connection:
+            self._insert_quantity_history(connection, history)
+            self._update_latest_values(connection, latest_values)
+
+    @metrics.timed_query
+    def get_quantity_history(self, cute_name: str, label: str, start, end, buckets: int) -> list:
+        # same buckets as width_bucket() in the Postgres query: bucket n covers [start + (n-1)*width, start + n*width)
+        history_query = """
+            SELECT bucket, count(*), min(numeric_value), max(numeric_value), avg(numeric_value),
+                   max(CASE WHEN newest = 1 THEN value END)
+            FROM (SELECT bucket, value, numeric_value,
+                         row_number() OVER (PARTITION BY bucket ORDER BY recorded_at DESC) AS newest
+                  FROM (SELECT CAST((julianday(recorded_at) - julianday(:start)) * :buckets
+                                    / (julianday(:end) - julianday(:start)) AS INTEGER) + 1 AS bucket,
+                               recorded_at, value, numeric_value
+                        FROM quantity_history
+                        WHERE cute_name = :cute_name AND label = :label AND recorded_at >= :start AND recorded_at < :end))
+            GROUP BY bucket
+            ORDER BY bucket;"""
+
+        with self._lock:
+            result = self._connection.execute(history_query, {
+                'cute_name': cute_name, 'label': label, 'buckets': buckets,
+                'start': start.isoformat(timespec='microseconds'), 'end': end.isoformat(timespec='microseconds')
+            }).fetchall()
+
+        bucket_width = (end - start) / buckets
+        return [{'start': (start + (bucket - 1) * bucket_width).isoformat(),
+                 'end': (start + bucket * bucket_width).isoformat(),
+                 'count': count, 'min': minimum, 'max': maximum, 'mean': mean, 'last': last}
+                for bucket, count, minimum, maximum, mean, last in result]
+    # endregion
+
+    def stats(self) -> dict:
+        return {'backend': self.name, 'database': self._database_path}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    # region private helper methods
+    @contextmanager
+    def _transaction(self):
+        """Runs the with block in one transaction, rolled back if it raises"""
+        with self._lock:
+            self._connection.execute("BEGIN;")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK;")
+                raise
+            self._connection.execute("COMMIT;")
+
+    @staticmethod
+    def _update_latest_values(connection, latest_values: list):
+        connection.executemany("UPDATE quantities SET latest_value = ? WHERE cute_name = ? AND label = ?;",
+                               [(None if value is None else str(value), cute_name, label)
+                                for cute_name, label, value in latest_values])
+
+    @staticmethod
+    def _insert_quantity_history(connection, history: list):
+        rows = []
+        for cute_name, label, recorded_at, value in history:
+            try:
+                numeric_value = float(value)
+            except (TypeError, ValueError):
+                numeric_value = None
+            rows.append((cute_name, label, recorded_at.isoformat(timespec='microseconds'),
+                         None if value is None else str(value), numeric_value))
+
+        connection.executemany("INSERT INTO quantity_history (cute_name, label, recorded_at, value, numeric_value) "
+                               "VALUES (?, ?, ?, ?, ?);", rows)
+
+    def _row_values(self, table: str, values: dict) -> dict:
+        """Column values of a row to insert. Like the Postgres builders, empty values are left to the column DEFAULT"""
+        row = {}
+        for column, declared_type in self._columns[table].items():
+            if column not in values:
+                continue
+            if declared_type == 'TEXT_ARRAY':
+                row[column] = json.dumps(list(values[column] or []))
+            elif declared_type == 'JSON_TEXT':
+                row[column] = json.dumps(values[column])
+            elif values[column]:
+                row[column] = self._to_sqlite(declared_type, values[column])
+        return row
+
+    def _update_row(self, connection, table: str, values: dict, cute_name: str, label: str = None):
+        """Sets the given columns of cute_name's row (its quantity label), empty values to the column DEFAULT"""
+        row = self._row_values(table, values)
+        assignments = [f'{column} = ?' if column in row else f'{column} = {self._defaults[table][column]}'
+                       for column in self._columns[table] if column in values]
+        if not assignments:
+            return
+
+        keys = (cute_name,) if label is None else (cute_name, label)
+        connection.execute(f"UPDATE {table} SET {','.join(assignments)} WHERE cute_name = ?"
+                           f"{'' if label is None else ' AND label = ?'};",
+                           tuple(row[column] for column in self._columns[table] if column in row) + keys)
+
+    @staticmethod
+    def _split_models(model_options: dict) -> dict:
+        """models and options are {name: id} in the driver, stored as two parallel arrays"""
+        model_options = dict(model_options)
+        for key, id_key in (('models', 'model_ids'), ('options', 'option_ids')):
+            if key in model_options:
+                model_options[id_key] = list(model_options[key].values())
+                model_options[key] = list(model_options[key].keys())
+        return model_options
+
+    @staticmethod
+    def _to_sqlite(declared_type: str, value):
+        if value is None:
+            return None
+        if declared_type == 'BOOLEAN':
+            return int(value) if isinstance(value, (bool, int)) else int(str(value).strip().lower() in TRUE_STRINGS)
+        if declared_type in ('TEXT_ARRAY', 'JSON_TEXT'):
+            return json.dumps(value)
+        return value
+
+    @staticmethod
+    def _from_sqlite(declared_type: str, value):
+        if value is None:
+            return None
+        if declared_type == 'BOOLEAN':
+            return bool(value)
+        if declared_type in ('TEXT_ARRAY', 'JSON_TEXT'):
+            return json.loads(value)
+        return value
+
+    def _select(self, table: str, cute_name) -> list:
+        columns = self._columns[table]
+        query = f"SELECT {','.join(columns)} FROM {table}"
+        with self._lock:
+            if cute_name is None:
+                rows = self._connection.execute(query + ";").fetchall()
+            else:
+                rows = self._connection.execute(query + " WHERE cute_name = ?;", (cute_name,)).fetchall()
+
+        return [{column: self._from_sqlite(declared_type, value)
+                 for (column, declared_type), value in zip(columns.items(), row)} for row in rows]
+    # endregion
@@ -0,0 +1,91 @@
+from DB import change_feed
+
+
+class DuplicateInstrumentError(Exception):
+    pass
+
+
+###################################################################################
+# StorageBackend
+###################################################################################
+class StorageBackend:
+    """
+    Base class of the instrument database storage backends (selected with the DATABASE_BACKEND app config).
+    Every method is thread safe and can be called outside a Flask application context.
+
+    Driver documents have the layout of /instrumentDB/getInstrument:
+        {'instrument_interface': {...}, 'general_settings': {...}, 'model_and_options': {...}, 'visa': {...},
+         'quantities': {label: {...}}}
+    """
+
+    name = None
+
+    def add_instrument(self, ins_interface: dict, instrument_details: dict):
+        """Stores an instrument and its parsed driver in one transaction
+            Raises:
+                DuplicateInstrumentError -- if ins_interface['cute_name'] already exists
+        """
+        raise NotImplementedError()
+
+    def delete_instrument(self, cute_name: str):
+        raise NotImplementedError()
+
+    def get_all_instruments(self) -> list:
+        """Returns a dict (cute_name, manufacturer, interface, address, serial, visa) per instrument"""
+        raise NotImplementedError()
+
+    def get_instrument_document(self, cute_name: str) -> dict:
+        """Returns the full driver document of cute_name
+            Raises:
+                KeyError -- if no instrument named cute_name exists
+        """
+        raise NotImplementedError()
+
+    def update_setting(self, table: str, column: str, value, key_column: str, key_value):
+        """Sets table.column to value in the row where key_column = key_value"""
+        raise NotImplementedError()
+
+    def apply_driver_changes(self, cute_name: str, changes: dict):
+        """
+        Applies the changes between two parsed drivers of cute_name (see driver_reload.diff_drivers) in one
+        transaction: only the changed columns of the changed rows are updated, latest values are kept.
+        Like add_instrument, empty values are set to the column DEFAULT.
+        """
+        raise NotImplementedError()
+
+    def get_latest_value(self, cute_name: str, label: str) -> str:
+        raise NotImplementedError()
+
+    def get_latest_values(self, quantities: list, cute_names: list) -> list:
+        """Returns (cute_name, label, latest_value) of the (cute_name, label) pairs in quantities
+        and of every quantity of the instruments in cute_names, in one query"""
+        raise NotImplementedError()
+
+    def set_latest_values(self, latest_values: list):
+        """Updates a list of (cute_name, label, latest_value) in one transaction"""
+        raise NotImplementedError()
+
+    def add_quantity_history(self, history: list):
+        """Appends a list of (cute_name, label, recorded_at, value) history records in one transaction"""
+        raise NotImplementedError()
+
+    def persist(self, latest_values: list, history: list):
+        """Appends the history records and updates the latest values (see add_quantity_history and set_latest_values)
+        in one transaction, either all of them are stored or none"""
+        raise NotImplementedError()
+
+    def get_quantity_history(self, cute_name: str, label: str, start, end, buckets: int) -> list:
+        """Returns the history of a quantity between start and end downsampled into at most <buckets> time buckets.
+        See instrumentDBService.getQuantityHistory for the layout.
+        """
+        raise NotImplementedError()
+
+    def create_change_feed(self, logger) -> change_feed.ChangeFeed:
+        """The change feed matching this storage, in-process unless the database can share it between processes"""
+        return change_feed.ChangeFeed(logger)
+
+    def stats(self) -> dict:
+        raise NotImplementedError()
+
+    def close(self):
+        raise NotImplementedError()
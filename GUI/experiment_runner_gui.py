@@ -1,6 +1,6 @@
 import os
 import sys
-from time import sleep
+from time import sleep, perf_counter
 import logging
 
 from PyQt6.QtGui import QAction, QIcon
@@ -13,6 +13,7 @@ from datetime import datetime
 
 from itertools import product
 import numpy as np
+from DB import metrics
 ###################################################################################
 # StringParameter
 ###################################################################################
@@ -122,6 +123,7 @@ class MainExperimentProcedure(Procedure):
             # step sequence is a list of tupules [(1 , 'a'), (True, )]
             # The datapoints we record at each "step":
             print(step_sequence)     
+            step_start = perf_counter()
             data = {}
             for level in range(len(self.input)):
                 for index in range(len(self.input[level])):
@@ -134,6 +136,9 @@ class MainExperimentProcedure(Procedure):
                 data[self.output_data_names[(ins, qty)]] = self.quantities[(ins, qty)].get_value()
                 sleep(self.delay_time)
 
+            metrics.SWEEP_STEP_LATENCY.observe(perf_counter() - step_start)
+            metrics.SWEEP_POINTS.inc()
+
             data['step'] = step
             self.logger.info("Data point recorded: ", data)
             self.emit('results', data)
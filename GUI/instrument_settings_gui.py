@@ -4,14 +4,12 @@ This is the Instrument Settings GUI that is used to edit Instrument "driver" par
 from the associated driver INI file.
 """
 
-import requests
-
 from PyQt6 import QtCore
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QScrollArea, QTreeWidget, QTreeWidgetItem, QPushButton,
                              QFrame, QApplication, QMessageBox)
 import logging
 
-from DB import db
+import instrument_server_service
 from GUI.setting_frames import StringSettingFrame, ComboBoxSettingFrame, FileDialogSettingFrame, SettingsGroupBox, \
     SettingFrameDTO, TwoRadioButtonSettingFrame, IntegerSettingFrame, SettingFrame
 
@@ -141,9 +139,7 @@ class InstrumentSettingsGUI(QWidget):
     def _get_settings_for_instrument(self, cute_name):
         """Gets all the settings associated with the instrument"""
         try:
-            url = r'http://127.0.0.1:5000/instrumentDB/getInstrumentSettings'
-            response = requests.get(url, params={'cute_name': cute_name})
-            return dict(response.json())
+            return instrument_server_service.get_service().get_instrument_settings(cute_name)
 
         except Exception as ex:
             QMessageBox.critical(self, 'ERROR', f'Could not retrieve settings for instrument {self.cute_name}: {ex}')
@@ -373,38 +369,25 @@ class InstrumentSettingsGUI(QWidget):
         # Only update the values that exist (not None)
         if frame.get_frame_dto().value is not None:
             frame_dto = frame.get_frame_dto()
-            updated_smt = f"UPDATE {frame_dto.db_table} SET {frame_dto.db_column} = {frame.get_gui_value()} " \
-                          f"WHERE {frame_dto.unique_key_column} = '{frame_dto.unique_key_value}';"
-
-            if frame.get_value_data_type() == 'str':
-                updated_smt = f"UPDATE {frame_dto.db_table} SET {frame_dto.db_column} = '{frame.get_gui_value()}' " \
-                              f"WHERE {frame_dto.unique_key_column} = '{frame_dto.unique_key_value}';"
-
-            with self.flask_app.app_context():
-                try:
-                    connection = db.get_db()
-                    with connection.cursor() as cursor:
-                        cursor.execute(updated_smt)
-                        connection.commit()
-
-                except Exception as ex:
-                    error_msg = f'There was an ERROR updating instrument settings for ' \
-                                f'instrument {frame_dto.unique_key_value}: {ex}'
-                    self.logger.fatal(error_msg)
-                    raise Exception(error_msg)
-
-                finally:
-                    # Make sure we always close the connection
-                    db.close_db(connection)
+
+            try:
+                instrument_server_service.get_service().update_setting(self.cute_name, frame_dto.db_table,
+                                                                       frame_dto.db_column, frame.get_gui_value(),
+                                                                       frame_dto.unique_key_column,
+                                                                       frame_dto.unique_key_value)
+
+            except Exception as ex:
+                error_msg = f'There was an ERROR updating instrument settings for ' \
+                            f'instrument {frame_dto.unique_key_value}: {ex}'
+                self.logger.fatal(error_msg)
+                raise Exception(error_msg)
 
     def remove_and_add_instrument(self, cute_name, new_ini_file_location):
         """Removes and then re-adds instrument (if ini file is updated)"""
 
         prev_instrument_details = dict()
         try:
-            url = r'http://127.0.0.1:5000/instrumentDB/getInstrumentSettings'
-            response = requests.get(url, params={'cute_name': cute_name})
-            prev_instrument_details = dict(response.json())
+            prev_instrument_details = instrument_server_service.get_service().get_instrument_settings(cute_name)
 
         except Exception as ex:
             QMessageBox.critical(self, 'ERROR', f'Could not retrieve settings for instrument {cute_name}: {ex}')
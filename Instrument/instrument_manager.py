@@ -3,7 +3,7 @@ from pyvisa import ResourceManager
 import requests
 from typing import Callable
 
-from .quantity_manager import QuantityManager
+from .quantity_manager import QuantityManager, QuantityStates
 
 # Maps terminating character from ini file to actual character
 TERM_CHAR = Enum('TERM_CHAR',
@@ -33,6 +33,7 @@ class InstrumentManager:
         self._parity = None
         self.query_errors = None
         self.quantities = dict()
+        self._quantity_states = None
 
         try:
             # Set VISA driver parameters
@@ -149,8 +150,12 @@ class InstrumentManager:
         str_true = self._driver['visa']['str_true']
         str_false = self._driver['visa']['str_false']
 
+        # latest values, visibility and links of all quantities are kept together, their definitions are shared
+        # with the other instruments using this driver
+        self._quantity_states = QuantityStates(self._name, self.write, self.read, str_true, str_false)
         for name, info in self._driver['quantities'].items():
-            self.quantities[name] = QuantityManager(info, self.write, self.read, str_true, str_false, self._logger)
+            self.quantities[name] = QuantityManager(info, self.write, self.read, str_true, str_false, self._logger,
+                                                    self._quantity_states)
 
     def _startup(self):
         """Sends relevant start up commands to instrument"""
@@ -208,6 +213,11 @@ class InstrumentManager:
     def name(self):
         return self._name
 
+    @property
+    def io_lock(self):
+        """Lock serializing the I/O with the instrument, held by every get/set of its quantities"""
+        return self._quantity_states.lock
+
     @property
     def model_name(self):
         return self._driver['instrument_interface']['manufacturer']
@@ -254,12 +264,41 @@ class InstrumentManager:
         else:
             self.quantities[quantity].linked_quantity_get = None
 
+    def update_quantities(self, quantities: dict, removed: list):
+        """Patches the quantities after the driver changed (hot reload) without reconnecting
+            Parameters:
+                quantities -- {label: quantity as stored} of the added and changed quantities
+                removed -- labels of the removed quantities
+        """
+        removed_quantities = [self.quantities.pop(label) for label in removed if label in self.quantities]
+        for label in removed:
+            self._driver['quantities'].pop(label, None)
+        for quantity in removed_quantities:
+            quantity.linked_quantity_get = None
+            quantity.linked_quantity_set = None
+
+        # links to a removed quantity are dropped
+        for quantity in self.quantities.values():
+            if quantity.linked_quantity_get in removed_quantities:
+                quantity.linked_quantity_get = None
+            if quantity.linked_quantity_set in removed_quantities:
+                quantity.linked_quantity_set = None
+
+        for label, info in quantities.items():
+            self._driver['quantities'][label] = info
+            if label in self.quantities:
+                self.quantities[label].update(info)
+            else:
+                self.quantities[label] = QuantityManager(info, self.write, self.read, self._driver['visa']['str_true'],
+                                                         self._driver['visa']['str_false'], self._logger,
+                                                         self._quantity_states)
+
     def get_value(self, quantity):
         """Gets value for given quantity
         Parameters:
             quantity -- Quantity name as provided in instrument driver
         """
-        value = self.quantities[quantity]
+        value = self.quantities[quantity].get_value()
         self.update_visibility(quantity, value)
         return value
 
@@ -1,5 +1,7 @@
 import requests
 
+from .quantity_manager import get_server_service
+
 
 class NonVisaInstrumentManager:
     def __init__(self, name, driver, logger):
@@ -31,9 +33,21 @@ class NonVisaInstrumentManager:
     def quantities(self):
         return self._driver['quantities']
 
+    def update_quantities(self, quantities: dict, removed: list):
+        """Patches the quantities after the driver changed (hot reload), see InstrumentManager.update_quantities"""
+        for label in removed:
+            self._driver['quantities'].pop(label, None)
+        self._driver['quantities'].update(quantities)
+
     '''Set's default value for given quantity'''
 
     def get_value(self, quantity):
+        # inside the Instrument Server process latest values are read from memory (or the DB)
+        service = get_server_service()
+        if service:
+            latest_value = service.get_latest_value(self._name, quantity)
+            return self.quantities[quantity]['def_value'] if latest_value is None else latest_value
+
         url = r'http://localhost:5000/instrumentDB/getLatestValue'
         response = requests.get(url, params={'cute_name': self._name, 'label': quantity})
         if 300 > response.status_code <= 200:
@@ -50,6 +64,12 @@ class NonVisaInstrumentManager:
 
     def set_value(self, quantity, value):
         self._check_limits(quantity, value)
+
+        service = get_server_service()
+        if service:
+            service.set_latest_value(self._name, quantity, str(value))
+            return
+
         url = r'http://localhost:5000/instrumentDB/setLatestValue'
         response = requests.put(url, params={'cute_name': self._name, 'label': quantity, 'latest_value': value})
         if 300 > response.status_code <= 200:
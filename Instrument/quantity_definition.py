@@ -0,0 +1,87 @@
+import threading
+import weakref
+from types import MappingProxyType
+
+# Definitions in use, keyed by their values (see get_definition)
+_definitions = weakref.WeakValueDictionary()
+_definitions_lock = threading.Lock()
+
+
+###################################################################################
+# QuantityDefinition
+###################################################################################
+class QuantityDefinition:
+    """
+    Immutable driver definition of a quantity (its row in the quantities table without the instrument's
+    latest value). Instruments using the same driver share one definition per quantity, get them with get_definition.
+    Lists are tuples and combo_cmd is a read-only mapping.
+    """
+
+    __slots__ = ('name', 'data_type', 'unit', 'default_value', 'tool_tip', 'low_lim', 'high_lim', 'x_name', 'x_unit',
+                 'combo_cmd', 'groupname', 'section', 'state_quant', 'state_values', 'model_values', 'option_values',
+                 'permission', 'show_in_measurement_dlg', 'set_cmd', 'get_cmd', '__weakref__')
+
+    def __init__(self, quantity_info: dict):
+        values = _definition_values(quantity_info)
+        for field, value in zip(self.__slots__, values):
+            object.__setattr__(self, field, value)
+        object.__setattr__(self, 'combo_cmd', None if values[9] is None else MappingProxyType(dict(values[9])))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{self.__class__.__name__} is immutable.')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{self.__class__.__name__} is immutable.')
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        # immutable and shared, copies of a quantity keep using the same definition
+        return self
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.name!r}, {self.data_type!r})'
+
+
+def get_definition(quantity_info: dict) -> QuantityDefinition:
+    """Returns the definition of a quantity (a dict as in the quantities of a driver document), the same object for
+    every quantity with the same values as long as one is in use"""
+    key = _definition_values(quantity_info)
+    with _definitions_lock:
+        definition = _definitions.get(key)
+        if definition is None:
+            definition = QuantityDefinition(quantity_info)
+            _definitions[key] = definition
+        return definition
+
+
+def definition_count() -> int:
+    """Number of distinct definitions in use"""
+    with _definitions_lock:
+        return len(_definitions)
+
+
+def _definition_values(quantity_info: dict) -> tuple:
+    """Values of the QuantityDefinition fields in __slots__ order, hashable (combo_cmd as a tuple of items)"""
+    combo_cmd = quantity_info['combo_cmd']
+    return (quantity_info['label'],
+            quantity_info['data_type'].upper(),
+            quantity_info['unit'],
+            quantity_info['def_value'],
+            quantity_info['tool_tip'],
+            float(quantity_info['low_lim']),
+            float(quantity_info['high_lim']),
+            quantity_info['x_name'],
+            quantity_info['x_unit'],
+            None if combo_cmd is None else tuple(combo_cmd.items()),
+            quantity_info['groupname'],
+            quantity_info['section'],
+            quantity_info['state_quant'],
+            tuple(quantity_info['state_values'] or ()),
+            tuple(quantity_info['model_values'] or ()),
+            tuple(quantity_info['option_values'] or ()),
+            quantity_info['permission'],
+            quantity_info['show_in_measurement_dlg'],
+            str(quantity_info['set_cmd']),
+            str(quantity_info['get_cmd']))
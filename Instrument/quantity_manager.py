@@ -1,42 +1,134 @@
 from __future__ import annotations
+import operator
+import threading
 from typing import Callable
 import requests
 
-
-class QuantityManager:
-    def __init__(self, quantity_info: dict, write_method: Callable, read_method: Callable, str_true, str_false, logger=None):
-        self.instrument_name = quantity_info['cute_name']
-        self.name = quantity_info['label']
-        self.data_type = quantity_info['data_type'].upper()
-        self.unit = quantity_info['unit']
-        self.default_value = quantity_info['def_value']
-        self.tool_tip = quantity_info['tool_tip']
-        self.low_lim = float(quantity_info['low_lim'])
-        self.high_lim = float(quantity_info['high_lim'])
-        self.x_name = quantity_info['x_name']
-        self.x_unit = quantity_info['x_unit']
-        self.combo_cmd = quantity_info['combo_cmd']
-        self.groupname = quantity_info['groupname']
-        self.section = quantity_info['section']
-        self.state_quant = quantity_info['state_quant']
-        self.state_values = quantity_info['state_values']
-        self.model_values = quantity_info['model_values']
-        self.option_values = quantity_info['option_values']
-        self.permission = quantity_info['permission']
-        self.show_in_measurement_dlg = quantity_info['show_in_measurement_dlg']
-        self.set_cmd = str(quantity_info['set_cmd'])
-        self.get_cmd = str(quantity_info['get_cmd'])
-        self.latest_value = quantity_info['latest_value']
-        self.is_visible = True
-
-        self._write_method = write_method
-        self._read_method = read_method
+from DB import metrics
+from .quantity_definition import QuantityDefinition, get_definition
+
+try:
+    import instrument_server_service
+except ImportError:
+    # used outside the Instrument Server, latest values go through its HTTP API
+    instrument_server_service = None
+
+
+###################################################################################
+# QuantityStates
+###################################################################################
+class QuantityStates:
+    """
+    Per-instrument state of an instrument's quantities: latest values, visibility and links are kept in arrays
+    indexed by QuantityManager.index, the instrument's I/O methods and boolean strings once for all its quantities.
+    lock serializes the I/O of the instrument: every get/set of its quantities holds it, and so does
+    InstrumentConnectionService.instrument_lock, whoever calls them (REST routes, GUI, experiment runner).
+    """
+
+    __slots__ = ('instrument_name', 'write_method', 'read_method', 'str_true', 'str_false', 'latest_values', 'visible',
+                 'linked_get', 'linked_set', 'lock')
+
+    def __init__(self, instrument_name: str, write_method: Callable, read_method: Callable, str_true, str_false):
+        self.instrument_name = instrument_name
+        self.write_method = write_method
+        self.read_method = read_method
         self.str_true = str_true
         self.str_false = str_false
-
-        # If quantity is linked to another, when get/set are called, it calls the corresponding linked quantity instead
-        self.linked_quantity_get: QuantityManager = None
-        self.linked_quantity_set: QuantityManager = None
+        self.latest_values = []
+        self.visible = bytearray()
+        # links are rare, {index: QuantityManager}
+        self.linked_get = {}
+        self.linked_set = {}
+        # reentrant, a quantity may be linked to another quantity of the same instrument
+        self.lock = threading.RLock()
+
+    def add(self, latest_value) -> int:
+        """Adds the state of a quantity, returns its index"""
+        self.latest_values.append(latest_value)
+        self.visible.append(1)
+        return len(self.latest_values) - 1
+
+
+###################################################################################
+# QuantityManager
+###################################################################################
+class QuantityManager:
+    """
+    A quantity of a connected instrument. Its driver definition (data_type, unit, combo_cmd, set_cmd...) is a
+    QuantityDefinition shared with the instruments using the same driver, its state (latest_value, is_visible,
+    links) lives in the instrument's QuantityStates. Pass the instrument's states to share them between its
+    quantities, otherwise the quantity gets its own.
+    """
+
+    __slots__ = ('definition', '_states', 'index')
+
+    def __init__(self, quantity_info: dict, write_method: Callable, read_method: Callable, str_true, str_false,
+                 logger=None, states: QuantityStates = None):
+        self.definition = get_definition(quantity_info)
+        if states is None:
+            states = QuantityStates(quantity_info['cute_name'], write_method, read_method, str_true, str_false)
+        self._states = states
+        self.index = self._states.add(quantity_info['latest_value'])
+
+    def update(self, quantity_info: dict):
+        """Applies a changed driver definition of this quantity (hot reload), keeps its latest value,
+        visibility and links"""
+        self.definition = get_definition(quantity_info)
+
+    # region per-instrument state
+    @property
+    def instrument_name(self) -> str:
+        return self._states.instrument_name
+
+    @property
+    def str_true(self):
+        return self._states.str_true
+
+    @property
+    def str_false(self):
+        return self._states.str_false
+
+    @property
+    def _write_method(self) -> Callable:
+        return self._states.write_method
+
+    @property
+    def _read_method(self) -> Callable:
+        return self._states.read_method
+
+    @property
+    def latest_value(self):
+        return self._states.latest_values[self.index]
+
+    @latest_value.setter
+    def latest_value(self, value):
+        self._states.latest_values[self.index] = value
+
+    @property
+    def is_visible(self) -> bool:
+        return bool(self._states.visible[self.index])
+
+    @is_visible.setter
+    def is_visible(self, value: bool):
+        self._states.visible[self.index] = bool(value)
+
+    # If quantity is linked to another, when get/set are called, it calls the corresponding linked quantity instead
+    @property
+    def linked_quantity_get(self) -> QuantityManager:
+        return self._states.linked_get.get(self.index)
+
+    @linked_quantity_get.setter
+    def linked_quantity_get(self, quantity: QuantityManager):
+        _set_link(self._states.linked_get, self.index, quantity)
+
+    @property
+    def linked_quantity_set(self) -> QuantityManager:
+        return self._states.linked_set.get(self.index)
+
+    @linked_quantity_set.setter
+    def linked_quantity_set(self, quantity: QuantityManager):
+        _set_link(self._states.linked_set, self.index, quantity)
+    # endregion
 
     # region set_value methods
     def set_value(self, value):
@@ -63,8 +155,9 @@ class QuantityManager:
         else:
             cmd += f' {value}'
 
-        self._write_method(cmd)
-        self.latest_value = value
+        with self._states.lock, metrics.INSTRUMENT_IO_LATENCY.time(self.instrument_name, self.name, 'set'):
+            self._write_method(cmd)
+        self.set_latest_value(value)
 
     def set_default_value(self):
         """Sets quantity value to default value as defined in driver"""
@@ -82,6 +175,12 @@ class QuantityManager:
 
         self.latest_value = value
 
+        # inside the Instrument Server process the value is buffered and written to the DB in batches
+        service = get_server_service()
+        if service:
+            service.set_latest_value(self.instrument_name, self.name, str(value))
+            return
+
         # send to server
         url = r'http://127.0.0.1:5000/instrumentDB/setLatestValue'
         response = requests.put(url, params={
@@ -96,8 +195,10 @@ class QuantityManager:
         if self.linked_quantity_get:
             return self.linked_quantity_get.get_value()
 
-        self._write_method(self.get_cmd)
-        value = self._read_method()
+        # the write/read pair must not interleave with another get/set of the instrument
+        with self._states.lock, metrics.INSTRUMENT_IO_LATENCY.time(self.instrument_name, self.name, 'get'):
+            self._write_method(self.get_cmd)
+            value = self._read_method()
 
         # update latest value
         self.set_latest_value(value)
@@ -108,6 +209,12 @@ class QuantityManager:
         if self.linked_quantity_get:
             return self.linked_quantity_get.get_latest_value()
 
+        # inside the Instrument Server process the value is read from memory (or the DB if it was not written since)
+        service = get_server_service()
+        if service:
+            self.latest_value = service.get_latest_value(self.instrument_name, self.name)
+            return self.latest_value
+
         # query server
         url = r'http://127.0.0.1:5000/instrumentDB/getLatestValue'
         response = requests.get(url, params={'cute_name': self.instrument_name, 'label': self.name})
@@ -221,3 +328,24 @@ class QuantityManager:
                 raise ValueError(
                     f"{value} is not a recognized state of {self.name}'s states. Valid states are {valid_states}.")
     # endregion
+
+
+# The fields of the definition are read-only properties of the quantity (quantity.data_type, quantity.set_cmd...)
+for _field in QuantityDefinition.__slots__:
+    if _field != '__weakref__':
+        setattr(QuantityManager, _field, property(operator.attrgetter(f'definition.{_field}')))
+del _field
+
+
+def _set_link(links: dict, index: int, quantity: QuantityManager):
+    if quantity is None:
+        links.pop(index, None)
+    else:
+        links[index] = quantity
+
+
+def get_server_service():
+    """The Instrument Server service of this process, None when running outside the server"""
+    if instrument_server_service is None:
+        return None
+    return instrument_server_service.get_service()
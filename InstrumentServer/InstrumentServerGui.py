@@ -8,8 +8,8 @@ import threading
 from PyQt6.QtCore import *
 from PyQt6.QtWidgets import *
 from PyQt6.QtGui import *
-from DB import db
-from instrument_connection_service import InstrumentConnectionService, AlreadyConnectedError
+import instrument_server_service
+from instrument_connection_service import AlreadyConnectedError, get_connection_service
 from InstrumentDetection.instrument_detection_service import InstrumentDetectionService
 from GUI.experimentWindowGui import ExperimentWindowGui
 from GUI.instrument_manager_gui import InstrumentManagerGUI
@@ -121,8 +121,8 @@ class InstrumentServerWindow(QMainWindow):
         # Set the central widget
         self.setCentralWidget(self.main_widget)
 
-        # Instrument Connection Service
-        self._ics = InstrumentConnectionService(self.my_logger)
+        # Instrument Connection Service (shared with the /instruments routes)
+        self._ics = get_connection_service()
 
         # Instrument Detection Service
         self._ids = InstrumentDetectionService(self.my_logger)
@@ -490,47 +490,33 @@ class InstrumentServerWindow(QMainWindow):
     def get_known_instruments(self):
         """Get all the known instruments from DB"""
         self.clear_instrument_list()
-        connection = None
 
-        with self.flask_app.app_context():
-            try:
-                connection = db.get_db()
-
-                with connection.cursor() as cursor:
-                    all_instruments_query = "SELECT * FROM {};".format("instruments")
-                    cursor.execute(all_instruments_query)
-                    result = cursor.fetchall()
-
-                    for instrument in result:
-                        cute_name = instrument[0]
-                        manufacturer = instrument[1]
-                        interface = instrument[2]
-                        address = instrument[3]
-                        serial = instrument[4]
-                        visa = instrument[5]
-
-                        if visa:
-                            self.instrument_type[cute_name] = "VISA"
-                        else:
-                            self.instrument_type[cute_name] = "NONE_VISA"
-
-                        # The actual address to be displayed
-                        display_address = address
-
-                        if interface == INST_INTERFACE.GPIB.name:
-                            display_address = f'{interface}::{address}'
-
-                        # If an IP Address was provided, use it for Address column, otherwise use the Interface
-                        self.add_instrument_to_list(manufacturer,
-                                                    cute_name,
-                                                    display_address)
-
-            except Exception as ex:
-                self.get_logger().fatal(f'There was a problem getting all known instruments: {ex}')
-
-            finally:
-                # Make sure we always close the connection
-                db.close_db(connection)
+        try:
+            for instrument in instrument_server_service.get_service().get_all_instruments():
+                cute_name = instrument['cute_name']
+                manufacturer = instrument['manufacturer']
+                interface = instrument['interface']
+                address = instrument['address']
+                visa = instrument['visa']
+
+                if visa:
+                    self.instrument_type[cute_name] = "VISA"
+                else:
+                    self.instrument_type[cute_name] = "NONE_VISA"
+
+                # The actual address to be displayed
+                display_address = address
+
+                if interface == INST_INTERFACE.GPIB.name:
+                    display_address = f'{interface}::{address}'
+
+                # If an IP Address was provided, use it for Address column, otherwise use the Interface
+                self.add_instrument_to_list(manufacturer,
+                                            cute_name,
+                                            display_address)
+
+        except Exception as ex:
+            self.get_logger().fatal(f'There was a problem getting all known instruments: {ex}')
 
     # Decorator allows method to know which item was double-clicked, we can ignore column in this case
     @pyqtSlot(QTreeWidgetItem, int)
@@ -10,6 +10,7 @@ def main():
     """
     Creates & Deploys Instrument Server
     Add dev_mode=True to NOT load a VISA backend (required to connect to instruments).
+    Add production=True to run_server to serve with a fixed pool of worker threads (requires waitress).
     """
     server = flask_instrument_server.FlaskInstrumentServer()
     server.run_server()
@@ -3,11 +3,10 @@ from msilib.schema import Error
 import platform
 import logging
 from flask import request, redirect, url_for
-from configparser import RawConfigParser
-from flask import (Blueprint, jsonify)
+from flask import (Blueprint, current_app, jsonify)
 from werkzeug.exceptions import (abort, BadRequestKeyError)
 
-import driverParserService as dps
+import instrument_server_service
 
 bp = Blueprint("driverParser", __name__,  url_prefix='/driverParser')
 ini_path = None
@@ -24,16 +23,7 @@ def parseDriver():
     try:
         global ini_path
         ini_path = request.get_json()
-
-        config = RawConfigParser()
-        config.read(ini_path)
-        gen_settings = dps.getGenSettings(dict(config['General settings']), ini_path)
-        model_options = dps.getModelOptions(dict(config['Model and options']))
-        visa_settings = dps.getVISASettings(dict(config['VISA settings']))
-        quantities = dps.getQuantities({key: value for key, value in config._sections.items() \
-                                        if key not in ('General settings', 'Model and options', 'VISA settings')})
-        return jsonify({'general_settings': gen_settings, 'model_and_options': model_options, 'visa': visa_settings,
-                        'quantities': quantities}), 200
+        return jsonify(instrument_server_service.get_service().parse_driver(ini_path)), 200
 
     except Exception as e:
         my_logger.error(e.args)
@@ -45,16 +35,26 @@ def addDriver():
     try:
         global ini_path
         ini_path = request.form['driverPath']
+        return instrument_server_service.get_service().parse_driver(ini_path), 200
         
-        config = RawConfigParser()
-        config.read(ini_path)
-        gen_settings = dps.getGenSettings(dict(config['General settings']), ini_path)
-        model_options = dps.getModelOptions(dict(config['Model and options']))
-        visa_settings = dps.getVISASettings(dict(config['VISA settings']))
-        quantities = dps.getQuantities({key: value for key, value in config._sections.items()\
-                if key not in ('General settings', 'Model and options', 'VISA settings')})
-        return {'general_settings': gen_settings, 'model_and_options': model_options, 'visa': visa_settings, 'quantities': quantities}, 200
-        
+    except Exception as e:
+        my_logger.error(e.args)
+        return jsonify(e.args), 400
+
+
+'''Parses and validates every .ini driver in the directory tree {"directory", "workers" (optional)}.
+   Returns a report with the name, quantity count, parse time, error and warnings of every driver'''
+@bp.route('/importLibrary', methods = ['POST'])
+def importLibrary():
+    my_logger.debug("driverParser/importLibrary was hit")
+    try:
+        body = request.get_json()
+        report = instrument_server_service.get_service().import_driver_library(
+            body['directory'], body.get('workers') or current_app.config['DRIVER_IMPORT_WORKERS'])
+        my_logger.info(f"Imported {report['driver_count']} drivers from {body['directory']}, "
+                       f"{report['failed_count']} failed")
+        return jsonify(report), 200
+
     except Exception as e:
         my_logger.error(e.args)
         return jsonify(e.args), 400
@@ -1,4 +1,88 @@
 import os
+from configparser import RawConfigParser
+
+# Sections of a driver that are not quantities
+SETTINGS_SECTIONS = ('General settings', 'Model and options', 'VISA settings')
+
+# Data types of quantities
+DATA_TYPES = frozenset(('DOUBLE', 'BOOLEAN', 'COMBO', 'STRING', 'COMPLEX', 'VECTOR', 'VECTOR_COMPLEX', 'PATH', 'BUTTON'))
+
+# Keys of a quantity that are numbered (combo_def_1, combo_def_2,...), collected into lists ordered by their number
+NUMBERED_KEYS = frozenset(('combo_def', 'cmd_def', 'state_value', 'model_value', 'option_value'))
+
+'''
+    Parses the .ini driver at ini_path
+    Returns dictionary with 'general_settings', 'model_and_options', 'visa' and 'quantities' of the driver
+    Raises FileNotFoundError if ini_path can not be read
+'''
+def parseDriver(ini_path) -> dict:
+    try:
+        # same encoding as RawConfigParser.read
+        with open(ini_path) as file:
+            text = file.read()
+    except OSError:
+        raise FileNotFoundError(f'Could not read driver {ini_path}.')
+
+    return parseDriverText(text, ini_path)
+
+'''
+    Parses text, the contents of the .ini driver at ini_path
+    Returns the same dictionary as parseDriver
+'''
+def parseDriverText(text: str, ini_path) -> dict:
+    sections = readSections(text)
+    if sections is None:
+        config = RawConfigParser()
+        config.read_string(text, source=ini_path)
+        sections = {name: dict(config[name]) for name in config.sections()}
+
+    return getDriver(sections, ini_path)
+
+'''
+    Single pass reader of the plain .ini files drivers are: [sections] and one line 'key: value' or 'key = value'
+    options, full line '#' and ';' comments. Keys and values are read exactly like RawConfigParser does.
+    Returns dictionary {section: {key: value}}, or None if text uses anything else (multi-line values, [DEFAULT],
+    duplicates, malformed lines), which is left to RawConfigParser (and its errors)
+'''
+def readSections(text: str):
+    sections = {}
+    section = None
+    for line in text.splitlines():
+        value = line.strip()
+        if not value or value[0] in '#;':
+            continue
+        if line[0].isspace():
+            # continuation of a multi-line value
+            return None
+
+        match = RawConfigParser.SECTCRE.match(value)
+        if match:
+            name = match.group('header')
+            if name in sections or name == 'DEFAULT':
+                return None
+            section = sections[name] = {}
+            continue
+
+        match = RawConfigParser.OPTCRE.match(value)
+        if section is None or not match:
+            return None
+        key = match.group('option').rstrip().lower()
+        if not key or key in section:
+            return None
+        section[key] = match.group('value').strip()
+
+    return sections
+
+'''
+    Takes the sections of the .ini driver ({section: {key: value}}) and its path
+    Returns dictionary with 'general_settings', 'model_and_options', 'visa' and 'quantities' of the driver
+'''
+def getDriver(sections: dict, ini_path) -> dict:
+    return {'general_settings': getGenSettings(sections['General settings'], ini_path),
+            'model_and_options': getModelOptions(sections['Model and options']),
+            'visa': getVISASettings(sections['VISA settings']),
+            'quantities': getQuantities({key: value for key, value in sections.items()
+                                         if key not in SETTINGS_SECTIONS})}
 
 '''
     Takes dictionary of just section ['General settings'] and the path of the .ini driver
@@ -283,110 +367,39 @@ def getVISASettings(settings: dict) -> dict:
     Takes dictionary of all sections excluding ['General settings'], ['Models and options'], ['VISA settings']
     Returns dictionary of dictionaries where each nested dictionary are
         the quantities with all keys and values (given and default) as defined by section 12.2 in Labber manual
+    Every quantity's keys are read in a single pass, numbered keys (combo_def_N, cmd_def_N, state_value_N,
+    model_value_N, option_value_N) are ordered by N and combo_def_N is paired with cmd_def_N
 '''
 def getQuantities(settings: dict) -> dict:
     quantities = {}
-    for key in settings:
-        quantity = settings[key]
+    for key, quantity in settings.items():
+        numbered = {}
+        for option, value in quantity.items():
+            if option[-1].isdigit():
+                name, _, number = option.rpartition('_')
+                if name in NUMBERED_KEYS and number.isdigit():
+                    numbered.setdefault(name, {})[int(number)] = value
 
-        if 'label' in quantity:
-            label = quantity['label']
-        else:
-            label = key
+        label = quantity.get('label', key)
 
-        if 'datatype' in quantity:
-            datatype = str.upper(quantity['datatype'])
-            if datatype not in \
-                    ('DOUBLE', 'BOOLEAN', 'COMBO', 'STRING', 'COMPLEX', 'VECTOR', 'VECTOR_COMPLEX', 'PATH', 'BUTTON'):
-                raise ValueError(f'Invlaid value {datatype} for [{key}].datatype')
-        else:
+        if 'datatype' not in quantity:
             raise ValueError(f"Expected 'datatype' for qunatity [{key}]")
+        datatype = str.upper(quantity['datatype'])
+        if datatype not in DATA_TYPES:
+            raise ValueError(f'Invlaid value {datatype} for [{key}].datatype')
 
-        if 'unit' in quantity:
-            unit = quantity['unit']
-        else:
-            unit = None
-
-        if 'def_value' in quantity:
-            def_value = quantity['def_value']
-        else:
-            def_value = None
-
-        if 'tooltip' in quantity:
-            tooltip = quantity['tooltip']
-        else:
-            tooltip = None
-
-        if 'low_lim' in quantity:
-            low_lim = quantity['low_lim']
-        else:
-            low_lim = '-INF'
-
-        if 'high_lim' in quantity:
-            high_lim = quantity['high_lim']
-        else:
-            high_lim = '+INF'
-
-        # x_name is only valid for vectors
-        if 'x_name' in quantity and datatype in ('VECTOR', 'VECTOR_COMPLEX'):
-            x_name = quantity['x_name']
-        else:
-            x_name = None
-
-        # x_unit is only valid for vectors
-        if 'x_unit' in quantity and datatype in ('VECTOR', 'VECTOR_COMPLEX'):
-            x_unit = quantity['x_unit']
-        else:
-            x_unit = None
-
-        # combo data type must have 'combo_def's in quantity
-        combos = [value for key, value in quantity.items() if 'combo_def_' in key]
-        if datatype == 'COMBO':
-            if len(combos) == 0:
-                raise ValueError(f"Quantity [{key}] must contain at least 'combo_def_1' if datatype is 'COMBO'")
-        else:
-            combos = None
+        # x_name and x_unit are only valid for vectors
+        is_vector = datatype in ('VECTOR', 'VECTOR_COMPLEX')
 
-        if 'group' in quantity:
-            group = quantity['group']
-        else:
-            group = None
+        permission = str.upper(quantity.get('permission', 'BOTH'))
+        if permission not in ('BOTH', 'READ', 'WRITE', 'NONE'):
+            raise ValueError(f"Invalid value '{permission}' for [{key}].permission")
 
-        if 'section' in quantity:
-            section = quantity['section']
-        else:
-            section = None
-
-        if 'state_quant' in quantity:
-            state_quant = quantity['state_quant']
-        else:
-            state_quant = None
-
-        ''' 
-        States, values, and options can have multiple entries such as state_value_1, state_value2,..., state_value_n
-        The following lines grab all keys and values with the given patterns and make a list of the values
-        '''
-        state_values = [value for key, value in quantity.items() if 'state_value_' in key]
-        model_values = [value for key, value in quantity.items() if 'model_value_' in key]
-        option_values = [value for key, value in quantity.items() if 'option_value_' in key]
-
-        if 'permission' in quantity:
-            permission = str.upper(quantity['permission'])
-            if permission not in ('BOTH', 'READ', 'WRITE', 'NONE'):
-                raise ValueError(f"Invalid value '{permission}' for [{key}].permission")
-        else:
-            permission = 'BOTH'
-
-        if 'show_in_measurement_dlg' in quantity:
-            show_in_measurement_dlg = bool(quantity['show_in_measurement_dlg'])
-        else:
-            show_in_measurement_dlg = None
-
-        if 'set_cmd' in quantity:
-            set_cmd = quantity['set_cmd']
-        else:
-            set_cmd = None
+        show_in_measurement_dlg = quantity.get('show_in_measurement_dlg')
+        if show_in_measurement_dlg is not None:
+            show_in_measurement_dlg = bool(show_in_measurement_dlg)
 
+        set_cmd = quantity.get('set_cmd')
         if 'get_cmd' in quantity:
             get_cmd = quantity['get_cmd']
         elif set_cmd:
@@ -394,45 +407,44 @@ def getQuantities(settings: dict) -> dict:
         else:
             get_cmd = None
 
-        # combo data type must have 'combo_def's in quantity
-        cmds = [value for key, value in quantity.items() if 'cmd_def_' in key]
+        # combo data type must have 'combo_def's with a 'cmd_def' of the same number each
+        combo_cmd = None
         if datatype == 'COMBO':
-            if len(cmds) == 0:
+            combos = numbered.get('combo_def')
+            cmds = numbered.get('cmd_def')
+            if not combos:
+                raise ValueError(f"Quantity [{key}] must contain at least 'combo_def_1' if datatype is 'COMBO'")
+            if not cmds:
                 raise ValueError(f"Quantity [{key}] must contain at least 'cmd_def_1' if datatype is 'COMBO'")
-        else:
-            cmds = None
-
-        combo_cmd = None
-
-        # id datatype is 'COMBO' must have same number of combo_defs and cmd_defs
-        # turn combos and cmds into dictionary
-        if combos and cmds:
-            if len(combos) != len(cmds):
-                raise ValueError(f"Quantity [{key}] must contain the same number of 'combo_def' and 'cmd_def' if datatype is 'COMBO'")
-            else:
-                combo_cmd = {combos[i]: cmds[i] for i in range(len(combos))}
+            if combos.keys() != cmds.keys():
+                raise ValueError(f"Quantity [{key}] must contain a 'cmd_def_N' for every 'combo_def_N' "
+                                 f"if datatype is 'COMBO'")
+            combo_cmd = {combos[number]: cmds[number] for number in sorted(combos)}
 
         quantities[label] = {
             'label': label,
             'data_type': datatype,
-            'unit': unit,
-            'def_value': def_value,
-            'tool_tip': tooltip,
-            'low_lim': low_lim,
-            'high_lim': high_lim,
-            'x_name': x_name,
-            'x_unit': x_unit,
-            'groupname': group,
-            'section': section,
-            'state_quant': state_quant,
-            'state_values': state_values,
-            'model_values': model_values,
-            'option_values': option_values,
+            'unit': quantity.get('unit'),
+            'def_value': quantity.get('def_value'),
+            'tool_tip': quantity.get('tooltip'),
+            'low_lim': quantity.get('low_lim', '-INF'),
+            'high_lim': quantity.get('high_lim', '+INF'),
+            'x_name': quantity.get('x_name') if is_vector else None,
+            'x_unit': quantity.get('x_unit') if is_vector else None,
+            'groupname': quantity.get('group'),
+            'section': quantity.get('section'),
+            'state_quant': quantity.get('state_quant'),
+            'state_values': _ordered(numbered.get('state_value')),
+            'model_values': _ordered(numbered.get('model_value')),
+            'option_values': _ordered(numbered.get('option_value')),
             'permission': permission,
             'show_in_measurement_dlg': show_in_measurement_dlg,
             'set_cmd': set_cmd,
             'get_cmd': get_cmd,
             'combo_cmd': combo_cmd
         }
-    
-    return quantities
\ No newline at end of file
+
+    return quantities
+
+def _ordered(values) -> list:
+    return [values[number] for number in sorted(values)] if values else []
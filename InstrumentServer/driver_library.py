@@ -0,0 +1,143 @@
+"""
+Bulk import of a library of .ini drivers: every driver in a directory tree is parsed (in a process pool),
+validated and reported on. The parsed drivers are added to the parsed driver cache, so adding instruments
+with them afterwards skips parsing.
+
+Also a command line tool, run from the project root:
+    python InstrumentServer/driver_library.py <directory> [--workers N] [--json]
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from parsed_driver_cache import ParsedDriverCache, parse_content
+
+# Smallest library worth starting worker processes for, smaller ones are parsed in this process
+MIN_DRIVERS_PER_POOL = 32
+
+
+def find_drivers(directory: str) -> list:
+    """Returns the paths of all .ini files in the directory tree, sorted
+        Raises:
+            NotADirectoryError -- if directory is not a directory
+    """
+    if not os.path.isdir(directory):
+        raise NotADirectoryError(f'{directory} is not a directory.')
+
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        paths += [os.path.join(root, name) for name in sorted(files) if name.lower().endswith('.ini')]
+    return paths
+
+
+def validate_driver(document: dict) -> list:
+    """Returns warnings about a parsed driver (problems the parser accepts but adding the instrument may not)"""
+    quantities = document['quantities']
+    warnings = []
+    if not quantities:
+        warnings.append('The driver has no quantities.')
+
+    for label, quantity in quantities.items():
+        if quantity['state_quant'] and quantity['state_quant'] not in quantities:
+            warnings.append(f"[{label}].state_quant refers to the unknown quantity '{quantity['state_quant']}'.")
+        if quantity['data_type'] == 'COMBO' and quantity['def_value'] is not None \
+                and quantity['def_value'] not in quantity['combo_cmd']:
+            warnings.append(f"[{label}].def_value '{quantity['def_value']}' is not one of its combo_defs.")
+    return warnings
+
+
+def parse_file(ini_path: str) -> dict:
+    """
+    Parses and validates the driver at ini_path (runs in the worker processes), returns its report
+    {"ini_path", "name", "quantity_count", "parse_ms", "error", "warnings"} and, if it parsed, the document with the
+    file's "mtime_ns", "size" and "sha256" for the parsed driver cache.
+    """
+    report = {'ini_path': ini_path, 'name': None, 'quantity_count': None, 'parse_ms': None, 'error': None,
+              'warnings': []}
+    start = time.perf_counter()
+    try:
+        file_stat = os.stat(ini_path)
+        with open(ini_path, 'rb') as file:
+            content = file.read()
+        document = parse_content(content, ini_path)
+        report.update(name=document['general_settings']['name'], quantity_count=len(document['quantities']),
+                      warnings=validate_driver(document), document=document, mtime_ns=file_stat.st_mtime_ns,
+                      size=file_stat.st_size, sha256=hashlib.sha256(content).hexdigest())
+    except Exception as ex:
+        # the parser reports missing sections and keys as KeyError, their message is just the key
+        report['error'] = f'{type(ex).__name__}: {ex}'
+    report['parse_ms'] = (time.perf_counter() - start) * 1000
+    return report
+
+
+def import_library(directory: str, workers: int = None, parsed_drivers: ParsedDriverCache = None) -> dict:
+    """
+    Parses every .ini driver in the directory tree with up to workers processes (one per CPU if None),
+    adds the drivers that parsed to parsed_drivers (if given) and returns the report
+    {"directory", "workers", "driver_count", "failed_count", "warning_count", "elapsed_ms",
+     "drivers": [{"ini_path", "name", "quantity_count", "parse_ms", "error", "warnings"}]}
+        Raises:
+            NotADirectoryError -- if directory is not a directory
+    """
+    start = time.perf_counter()
+    paths = find_drivers(directory)
+    workers = min(workers or os.cpu_count() or 1, max(1, len(paths) // MIN_DRIVERS_PER_POOL))
+
+    if workers == 1:
+        reports = [parse_file(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # chunks keep the inter-process overhead per driver small
+            reports = list(executor.map(parse_file, paths, chunksize=max(1, len(paths) // (workers * 4))))
+
+    for report in reports:
+        document = report.pop('document', None)
+        file_state = [report.pop(key, None) for key in ('mtime_ns', 'size', 'sha256')]
+        if document is not None and parsed_drivers is not None:
+            parsed_drivers.add(report['ini_path'], *file_state, document)
+
+    return {
+        'directory': directory,
+        'workers': workers,
+        'driver_count': len(reports),
+        'failed_count': sum(1 for report in reports if report['error']),
+        'warning_count': sum(1 for report in reports if report['warnings']),
+        'elapsed_ms': (time.perf_counter() - start) * 1000,
+        'drivers': reports
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parses and validates every .ini driver in a directory tree.')
+    parser.add_argument('directory', help='root of the driver library')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--json', action='store_true', help='print the full report as JSON')
+    args = parser.parse_args()
+
+    try:
+        library = import_library(args.directory, args.workers)
+    except NotADirectoryError as ex:
+        parser.error(str(ex))
+
+    if args.json:
+        print(json.dumps(library, indent=2))
+    else:
+        for report in library['drivers']:
+            if report['error']:
+                print(f"FAILED  {report['ini_path']}: {report['error']}")
+            for warning in report['warnings']:
+                print(f"WARNING {report['ini_path']}: {warning}")
+        print(f"{library['driver_count']} drivers, {library['failed_count']} failed, "
+              f"{library['warning_count']} with warnings, {library['elapsed_ms']:.0f} ms "
+              f"({library['workers']} workers)")
+
+    sys.exit(1 if library['failed_count'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+import os
+import copy
+import time
+import logging
+import threading
+
+from instrument_connection_service import InstrumentConnectionService
+from instrument_server_service import InstrumentServerService
+
+# Sections of a parsed driver stored as one row per instrument
+SETTINGS_SECTIONS = ('general_settings', 'model_and_options', 'visa')
+
+# The watcher of the Instrument Server running in this process (None when running outside the server)
+_watcher = None
+
+
+def diff_drivers(old: dict, new: dict) -> dict:
+    """
+    Returns the changes between two parsed drivers (see driverParserService.parseDriver) of an instrument:
+        {"settings": {table: {column: new value}}, "added": {label: quantity}, "changed": {label: {column: new value}},
+         "removed": [label]}
+    A renamed quantity is removed and added.
+    """
+    settings = {}
+    for section in SETTINGS_SECTIONS:
+        changed_settings = {key: value for key, value in new[section].items() if old[section].get(key) != value}
+        changed_settings.update({key: None for key in old[section].keys() - new[section].keys()})
+        if changed_settings:
+            settings[section] = changed_settings
+
+    # the manufacturer of an instrument is the name of its driver
+    if 'name' in settings.get('general_settings', {}):
+        settings['instruments'] = {'manufacturer': new['general_settings']['name']}
+
+    old_quantities, new_quantities = old['quantities'], new['quantities']
+    changed = {}
+    for label, quantity in new_quantities.items():
+        old_quantity = old_quantities.get(label)
+        if old_quantity is not None and old_quantity != quantity:
+            changed[label] = {key: value for key, value in quantity.items() if old_quantity.get(key) != value}
+            changed[label].update({key: None for key in old_quantity.keys() - quantity.keys()})
+
+    return {'settings': settings,
+            'added': {label: quantity for label, quantity in new_quantities.items() if label not in old_quantities},
+            'changed': changed,
+            'removed': [label for label in old_quantities if label not in new_quantities]}
+
+
+def has_changes(changes: dict) -> bool:
+    return any(changes.values())
+
+
+###################################################################################
+# DriverWatcher
+###################################################################################
+class DriverWatcher:
+    """
+    Hot reload of the .ini drivers of the stored instruments. The parsed driver of every instrument is kept
+    as a baseline, when its file changes the new driver is compared with it and only the changes are applied:
+    the changed rows are written to the DB and the quantities of a connected instrument are patched in place
+    (between two of its get/set calls), without disconnecting it.
+    Changes to the general, model or VISA settings are stored but take effect on the next connection.
+    A background thread checks the files every interval seconds (None: only when reload() is called).
+
+    An instrument changed through the server (re-added or its settings updated) gets a new baseline from its file.
+    Files are compared with their driver as of the server's start, changes made while it was down are not detected.
+    """
+
+    def __init__(self, service: InstrumentServerService, connection_service: InstrumentConnectionService,
+                 logger: logging.Logger, interval=2.0):
+        self._service = service
+        self._ics = connection_service
+        self._my_logger = logger
+        self._interval = interval
+        self._lock = threading.Lock()
+        # {cute_name: {"ini_path", "mtime_ns", "size", "document", "version"}}
+        self._baselines = {}
+        self._reloads = 0
+        self._failures = 0
+        self._stop_event = threading.Event()
+        self._watcher = None
+        self._my_logger.debug(f'{self.__class__.__name__} initialized...')
+
+    def start(self):
+        """Records the driver of every instrument and, if an interval is set, starts checking them"""
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._run_watcher, name='DriverWatcher', daemon=True)
+            self._watcher.start()
+            self._my_logger.debug(f'{self.__class__.__name__} checking drivers every {self._interval} seconds...')
+
+    def close(self):
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def poll(self):
+        """Reloads the driver of every instrument whose .ini file changed"""
+        cute_names = [instrument['cute_name'] for instrument in self._service.get_all_instruments()]
+        for cute_name in cute_names:
+            try:
+                self.reload(cute_name)
+            except FileNotFoundError as ex:
+                # moved or being replaced, checked again next time
+                self._my_logger.debug(f'Not watching the driver of {cute_name}: {ex}')
+            except Exception as ex:
+                with self._lock:
+                    self._failures += 1
+                self._my_logger.error(f'Failed to reload the driver of {cute_name}: {ex}')
+
+        # forget removed instruments
+        with self._lock:
+            for cute_name in self._baselines.keys() - set(cute_names):
+                del self._baselines[cute_name]
+
+    def reload(self, cute_name: str) -> dict:
+        """
+        Applies the changes of cute_name's .ini file since it was last checked, returns the report
+        {"cute_name", "ini_path", "settings": [table], "added", "changed", "removed": [label], "patched",
+         "reconnect_required", "elapsed_ms"}. The first call only records the driver (nothing changed).
+            Raises:
+                KeyError -- if no instrument named cute_name exists
+                FileNotFoundError -- if its driver can not be read
+        """
+        start = time.perf_counter()
+        with self._lock:
+            baseline = self._baselines.get(cute_name)
+            version = self._service.get_driver_version(cute_name)
+            if baseline is None or baseline['version'] != version:
+                # new or changed through the server, the driver as stored is the one in the file now
+                ini_path = self._service.get_instrument_settings(cute_name)['general_settings']['ini_path']
+                baseline = self._read_driver(ini_path)
+                baseline['version'] = version
+                self._baselines[cute_name] = baseline
+                changes = {'settings': {}, 'added': {}, 'changed': {}, 'removed': []}
+            else:
+                current = self._read_driver(baseline['ini_path'], baseline)
+                changes = diff_drivers(baseline['document'], current['document'])
+                if has_changes(changes):
+                    self._service.apply_driver_changes(cute_name, changes)
+                    self._reloads += 1
+                current['version'] = self._service.get_driver_version(cute_name)
+                self._baselines[cute_name] = current
+
+        report = {'cute_name': cute_name, 'ini_path': baseline['ini_path'], 'settings': list(changes['settings']),
+                  'added': list(changes['added']), 'changed': list(changes['changed']),
+                  'removed': changes['removed'], 'patched': False, 'reconnect_required': False}
+
+        if has_changes(changes):
+            if self._ics.is_connected(cute_name):
+                report['patched'] = self._patch_instrument(cute_name, changes)
+                report['reconnect_required'] = bool(changes['settings']) or not report['patched']
+            self._my_logger.info(f"Reloaded the driver of {cute_name}: {len(report['added'])} quantities added, "
+                                 f"{len(report['changed'])} changed, {len(report['removed'])} removed, "
+                                 f"settings changed: {report['settings']}.")
+            if report['reconnect_required']:
+                self._my_logger.warning(f'Reconnect {cute_name} to use all the changes of its driver.')
+
+        report['elapsed_ms'] = (time.perf_counter() - start) * 1000
+        return report
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'watched_drivers': len(self._baselines), 'reloads': self._reloads, 'failures': self._failures}
+
+    # region private helper methods
+    def _run_watcher(self):
+        self._safe_poll()
+        if self._interval is None:
+            return
+
+        while not self._stop_event.wait(self._interval):
+            self._safe_poll()
+
+    def _safe_poll(self):
+        try:
+            self.poll()
+        except Exception as ex:
+            # the DB may be down, try again next time
+            self._my_logger.error(f'Failed to check the instrument drivers: {ex}')
+
+    def _read_driver(self, ini_path: str, baseline: dict = None) -> dict:
+        """Returns the parsed driver at ini_path, baseline if the file did not change since"""
+        try:
+            file_stat = os.stat(ini_path)
+        except OSError:
+            raise FileNotFoundError(f'Could not read driver {ini_path}.')
+
+        if baseline is not None and (baseline['mtime_ns'], baseline['size']) == (file_stat.st_mtime_ns,
+                                                                                  file_stat.st_size):
+            return dict(baseline)
+        return {'ini_path': ini_path, 'mtime_ns': file_stat.st_mtime_ns, 'size': file_stat.st_size,
+                'document': self._service.parse_driver(ini_path)}
+
+    def _patch_instrument(self, cute_name: str, changes: dict) -> bool:
+        labels = list(changes['added']) + list(changes['changed'])
+        if not labels and not changes['removed']:
+            return True
+
+        # the quantities as stored (column defaults, latest values), each manager gets its own copy
+        quantities = self._service.get_instrument(cute_name, [f'quantities.{label}' for label in labels])['quantities']
+        return self._ics.update_quantities(cute_name, copy.deepcopy(quantities), changes['removed'])
+    # endregion
+
+
+def set_watcher(watcher: DriverWatcher):
+    global _watcher
+    _watcher = watcher
+
+
+def get_watcher() -> DriverWatcher:
+    return _watcher
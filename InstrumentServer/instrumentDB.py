@@ -1,58 +1,52 @@
 import logging
+import datetime
 from flask import request
-from psycopg2 import errors
-import requests
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify
 from werkzeug.exceptions import (BadRequestKeyError)
-import instrumentDBService as ids
-from DB import db
+from DB.storage_backend import DuplicateInstrumentError
+import instrument_server_service
+import driver_reload
+import vector_encoding
 from http import HTTPStatus
 
 bp = Blueprint("instrumentDB", __name__,  url_prefix='/instrumentDB')
-UniqueViolation = errors.lookup('23505')
+
+# Response header with the version of the returned driver document
+DRIVER_VERSION_HEADER = 'X-Driver-Version'
 
 def setLogger(logger: logging.Logger):
     global my_logger 
     my_logger = logger
 
+def requestedFields():
+    ''' Fields asked for with fields=a,b (or repeated fields=), None if all fields are wanted '''
+    fields = [field for value in request.args.getlist('fields') for field in value.split(',') if field]
+    return fields or None
+
+def conditionalResponse(etag: str, make_body, headers=None):
+    ''' Answers 304 Not Modified if the client's copy (If-None-Match) is etag, otherwise make_body() as JSON
+        (return the response as it is, a status code would replace the 304) '''
+    if etag in request.if_none_match:
+        response = Response(status=HTTPStatus.NOT_MODIFIED)
+    else:
+        response = jsonify(make_body())
+    response.set_etag(etag)
+    response.headers.update(headers or {})
+    return response
+
 ''' Adds instrument details to the database '''
 @bp.route('/addInstrument', methods=['GET', 'POST'])
 def addInstrument():
     try:        
         details = request.get_json()
-        url = r'http://127.0.0.1:5000/driverParser/'
-        instrument_details = requests.post(url, json=details['path'])
-        if HTTPStatus.MULTIPLE_CHOICES > instrument_details.status_code <= HTTPStatus.OK:
-            connection = db.get_db()
-            cute_name = details['cute_name']
-            instrument_details = instrument_details.json()
-            manufacturer = instrument_details['general_settings']['name']
-            
-            ids.addInstrumentInterface(connection, details, manufacturer)
-            ids.addGenSettings(connection, instrument_details['general_settings'], cute_name)
-            ids.addModelOptions(connection, instrument_details['model_and_options'], cute_name)
-            ids.addVisaSettings(connection, instrument_details['visa'], cute_name)
-            for quantity in instrument_details['quantities'].keys():
-                ids.addQuantity(connection, instrument_details['quantities'][quantity], cute_name)
-            connection.commit()
-
-            # If the baud rate is provided, we will overwrite the value we got from the ini file
-            if details['baud_rate']:
-                my_logger.info(f"Baud Rate: {details['baud_rate']} was provided. Replacing value from ini file.")
-                ids.update_visa_baud_rate(connection, cute_name, details['baud_rate'])
-
-            db.close_db(connection)
-            return jsonify(f"Instrument: \"{details['cute_name']}\" was (re)added!"), HTTPStatus.OK
-        else:
-            raise FileNotFoundError
+        instrument_server_service.get_service().add_instrument(details)
+        return jsonify(f"Instrument: \"{details['cute_name']}\" was (re)added!"), HTTPStatus.OK
         
     except FileNotFoundError:
         my_logger.error("Invalid driver path.")
         return jsonify("Invalid driver path."), HTTPStatus.BAD_REQUEST
     
-    except UniqueViolation:
-        connection.rollback()
-        db.close_db(connection)
+    except DuplicateInstrumentError:
         my_logger.error("Instrument name already exists.")
         return jsonify("Instrument name already exists."), HTTPStatus.BAD_REQUEST
 
@@ -61,25 +55,53 @@ def addInstrument():
         return jsonify(Exception.args), HTTPStatus.BAD_REQUEST
 
 
+''' Applies the changes of an instrument's .ini file since it was last checked without disconnecting it,
+    returns the report of driver_reload.DriverWatcher.reload '''
+@bp.route('/reloadDriver', methods=['POST'])
+def reloadDriver():
+    try:
+        instrument_name = request.args['cute_name']
+        return jsonify(driver_reload.get_watcher().reload(instrument_name)), HTTPStatus.OK
+
+    except BadRequestKeyError:
+        my_logger.error('Invalid instrument name.')
+        return jsonify('Invalid instrument name.'), HTTPStatus.BAD_REQUEST
+
+    except KeyError:
+        my_logger.error(f'Instrument {instrument_name} does not exist.')
+        return jsonify(f'Instrument {instrument_name} does not exist.'), HTTPStatus.NOT_FOUND
+
+    except FileNotFoundError:
+        my_logger.error("Invalid driver path.")
+        return jsonify("Invalid driver path."), HTTPStatus.BAD_REQUEST
+
+    except Exception as e:
+        my_logger.error(e.args)
+        return jsonify(e.args), HTTPStatus.BAD_REQUEST
+
+
 ''' Returns 'cute_name' and 'manufacturer' of existing instruments '''
 @bp.route('/allInstruments')
 def allInstruments():
     try:
-        connection = db.get_db()
-        all_instruments = {}
+        service = instrument_server_service.get_service()
+        fields = requestedFields() or ['manufacturer', 'interface', 'address']
+        unknown_fields = set(fields) - {'manufacturer', 'interface', 'address'}
+        if unknown_fields:
+            return jsonify(f'Unknown fields {sorted(unknown_fields)}.'), HTTPStatus.BAD_REQUEST
+
+        def allInstrumentsBody():
+            all_instruments = {}
 
-        with connection.cursor() as cursor:
-            all_instruments_query = "SELECT cute_name, manufacturer, interface, address FROM {table_name};".format(table_name="instruments")
-            cursor.execute(all_instruments_query)
-            result = cursor.fetchall()
+            for instrument in service.get_all_instruments():
+                all_instruments[instrument['cute_name']] = {field: instrument[field] for field in fields}
 
-            for instrument in result:
-                all_instruments[instrument[0]] = {'manufacturer': instrument[1], 'interface': instrument[2], 'address': instrument[3]}
+            if len(all_instruments) == 0:
+                return "No instruments were added."
+            return all_instruments
 
-        db.close_db(connection)
-        if len(all_instruments) == 0:
-            return jsonify("No instruments were added."), HTTPStatus.OK
-        return jsonify(all_instruments), HTTPStatus.OK
+        # read the version first, a change while loading makes the client fetch the list again
+        return conditionalResponse(service.get_catalog_version(), allInstrumentsBody)
 
     except Exception:
         my_logger.error(Exception.args)
@@ -90,20 +112,26 @@ def allInstruments():
 def getInstrument():
     try:
         instrument_name = request.args['cute_name']        
-        connection = db.get_db()
-        instrument_interface = ids.getInstrumentInterface(connection, instrument_name)
-        general_settings = ids.getGenSettings(connection, instrument_name)
-        model_options = ids.getModelOptions(connection, instrument_name)
-        visa_settings = ids.getVisaSettings(connection, instrument_name)
-        quantities = ids.getQuantities(connection, instrument_name)
-
-        db.close_db(connection)
-        return jsonify({'instrument_interface' : instrument_interface, 'general_settings' : general_settings, 'model_and_options' : model_options, 'visa' : visa_settings, 'quantities' : quantities}), HTTPStatus.OK
+        service = instrument_server_service.get_service()
+        fields = requestedFields()
+        # read the versions first, a change while loading makes the client fetch the document again
+        version = service.get_driver_version(instrument_name)
+        etag = service.get_instrument_version(instrument_name)
+        return conditionalResponse(etag, lambda: service.get_instrument(instrument_name, fields),
+                                   {DRIVER_VERSION_HEADER: version})
 
     except BadRequestKeyError:
         my_logger.error('Invalid instrument name.')
         return jsonify('Invalid instrument name.'), HTTPStatus.BAD_REQUEST
 
+    except KeyError:
+        my_logger.error(f'Unknown instrument {instrument_name}.')
+        return jsonify(f'Unknown instrument {instrument_name}.'), HTTPStatus.NOT_FOUND
+
+    except ValueError as ex:
+        my_logger.error(str(ex))
+        return jsonify(str(ex)), HTTPStatus.BAD_REQUEST
+
     except Exception:
         my_logger.error(Exception.args)
         return jsonify(Exception.args), HTTPStatus.BAD_REQUEST
@@ -112,22 +140,41 @@ def getInstrument():
 def getInstrumentSettings():
     try:
         instrument_name = request.args['cute_name']
-        connection = db.get_db()
-        instrument_interface = ids.getInstrumentInterface(connection, instrument_name)
-        general_settings = ids.getGenSettings(connection, instrument_name)
-        visa_settings = ids.getVisaSettings(connection, instrument_name)
+        service = instrument_server_service.get_service()
+        fields = requestedFields() or ['instrument_interface', 'general_settings', 'visa']
+        if any(field.partition('.')[0] not in ('instrument_interface', 'general_settings', 'visa') for field in fields):
+            return jsonify('Only instrument_interface, general_settings and visa fields are available.'), HTTPStatus.BAD_REQUEST
 
-        db.close_db(connection)
-        return jsonify({'instrument_interface' : instrument_interface, 'general_settings' : general_settings, 'visa' : visa_settings}), HTTPStatus.OK
+        version = service.get_driver_version(instrument_name)
+        return conditionalResponse(version, lambda: instrument_server_service.project_document(
+            service.get_instrument_settings(instrument_name), fields), {DRIVER_VERSION_HEADER: version})
 
     except BadRequestKeyError:
         my_logger.error('Invalid instrument name.')
         return jsonify('Invalid instrument name.'), HTTPStatus.BAD_REQUEST
 
+    except KeyError:
+        my_logger.error(f'Unknown instrument {instrument_name}.')
+        return jsonify(f'Unknown instrument {instrument_name}.'), HTTPStatus.NOT_FOUND
+
     except Exception:
         my_logger.error(Exception.args)
         return jsonify(Exception.args), HTTPStatus.BAD_REQUEST
 
+''' Returns the driver document version of each cute_name given (all instruments if none are given) '''
+@bp.route('/getDriverVersions')
+def getDriverVersions():
+    try:
+        service = instrument_server_service.get_service()
+        instrument_names = request.args.getlist('cute_name')
+        if not instrument_names:
+            instrument_names = [instrument['cute_name'] for instrument in service.get_all_instruments()]
+        return jsonify({name: service.get_driver_version(name) for name in instrument_names}), HTTPStatus.OK
+
+    except Exception as e:
+        my_logger.error(str(e))
+        return jsonify(str(e)), HTTPStatus.BAD_REQUEST
+
 
 ''' Returns latest value of label '''
 @bp.route('/getLatestValue')
@@ -135,9 +182,12 @@ def getLatestValue():
     try:
         instrument_name = request.args['cute_name']
         label = request.args['label']
-        connection = db.get_db()
-        latest_value = ids.getLatestValue(connection, instrument_name, label)
-        db.close_db(connection)
+        latest_value = instrument_server_service.get_service().get_latest_value(instrument_name, label)
+
+        # vectors are sent as .npy buffers to clients asking for them
+        response = vector_encoding.vector_response(instrument_name, label, latest_value)
+        if response is not None:
+            return response
         return jsonify({'latest_value': latest_value}), HTTPStatus.OK
 
     except BadRequestKeyError:
@@ -157,9 +207,7 @@ def setLatestValue():
         instrument_name = request.args['cute_name']
         label = request.args['label']
         latest_value = request.args['latest_value']
-        connection = db.get_db()
-        ids.setLatestValue(connection, latest_value, instrument_name, label)
-        db.close_db(connection)
+        instrument_server_service.get_service().set_latest_value(instrument_name, label, latest_value)
         return jsonify("Instrument's latest value on {label} updated.".format(label=label)), HTTPStatus.OK
 
     except BadRequestKeyError:
@@ -170,13 +218,92 @@ def setLatestValue():
         my_logger.error(Exception.args)
         return jsonify(Exception.args), HTTPStatus.BAD_REQUEST
     
+'''
+Returns latest values of many quantities in one query: {'latest_values': {cute_name: {label: latest_value}}}
+GET: every quantity of each cute_name argument
+POST: JSON {'quantities': [[cute_name, label], ...], 'instruments': [cute_name, ...]} (both optional)
+'''
+@bp.route('/getLatestValues', methods = ['GET', 'POST'])
+def getLatestValues():
+    try:
+        if request.method == 'POST':
+            body = request.get_json()
+            quantities = [(cute_name, label) for cute_name, label in body.get('quantities', [])]
+            instrument_names = body.get('instruments', [])
+        else:
+            quantities = []
+            instrument_names = request.args.getlist('cute_name')
+
+        latest_values = instrument_server_service.get_service().get_latest_values(quantities, instrument_names)
+        return jsonify({'latest_values': latest_values}), HTTPStatus.OK
+
+    except (ValueError, TypeError, AttributeError):
+        my_logger.error('Invalid list of quantities.')
+        return jsonify('Expected quantities as a list of [cute_name, label] pairs.'), HTTPStatus.BAD_REQUEST
+
+    except Exception as e:
+        my_logger.error(str(e))
+        return jsonify(str(e)), HTTPStatus.BAD_REQUEST
+
+
+''' Sets latest values of many quantities at once, JSON {'latest_values': [[cute_name, label, latest_value], ...]} '''
+@bp.route('/setLatestValues', methods = ['PUT'])
+def setLatestValues():
+    try:
+        latest_values = [(cute_name, label, latest_value)
+                         for cute_name, label, latest_value in request.get_json()['latest_values']]
+        instrument_server_service.get_service().set_latest_values(latest_values)
+        return jsonify(f'{len(latest_values)} latest values updated.'), HTTPStatus.OK
+
+    except (KeyError, ValueError, TypeError):
+        my_logger.error('Invalid list of latest values.')
+        return jsonify('Expected latest_values as a list of [cute_name, label, latest_value].'), HTTPStatus.BAD_REQUEST
+
+    except Exception as e:
+        my_logger.error(str(e))
+        return jsonify(str(e)), HTTPStatus.BAD_REQUEST
+
+''' Returns the history of label between start and end (ISO 8601, UTC) downsampled to at most buckets entries '''
+@bp.route('/getValueHistory')
+def getValueHistory():
+    try:
+        instrument_name = request.args['cute_name']
+        label = request.args['label']
+        end = _parseUTCTime(request.args['end']) if 'end' in request.args else datetime.datetime.utcnow()
+        start = _parseUTCTime(request.args['start']) if 'start' in request.args else end - datetime.timedelta(days=1)
+        buckets = int(request.args.get('buckets', 100))
+
+        if buckets < 1 or start >= end:
+            my_logger.error('Invalid history range.')
+            return jsonify('buckets must be positive and start must be before end.'), HTTPStatus.BAD_REQUEST
+
+        history = instrument_server_service.get_service().get_value_history(instrument_name, label, start, end, buckets)
+        return jsonify({'start': start.isoformat(), 'end': end.isoformat(), 'buckets': history}), HTTPStatus.OK
+
+    except BadRequestKeyError:
+        my_logger.error('Invalid instrument name or label.')
+        return jsonify('Invalid instrument name or label.'), HTTPStatus.BAD_REQUEST
+
+    except ValueError as e:
+        my_logger.error(e.args)
+        return jsonify(e.args), HTTPStatus.BAD_REQUEST
+
+    except Exception as e:
+        my_logger.error(str(e))
+        return jsonify(str(e)), HTTPStatus.BAD_REQUEST
+
+def _parseUTCTime(timestamp: str) -> datetime.datetime:
+    """Parses an ISO 8601 timestamp into a naive UTC datetime (history is recorded in UTC)"""
+    parsed = datetime.datetime.fromisoformat(timestamp)
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
 @bp.route('/removeInstrument')
 def removeInstrument():
     try:
         instrument_name = request.args['cute_name']        
-        connection = db.get_db()
-        ids.deleteInstrument(connection, instrument_name)
-        db.close_db(connection)
+        instrument_server_service.get_service().remove_instrument(instrument_name)
         return jsonify('Instrument removed.'), HTTPStatus.OK
     
     except BadRequestKeyError:
@@ -1,280 +1,381 @@
 import json
 import psycopg2
 from psycopg2.extensions import AsIs
+from psycopg2.extras import execute_values
+from DB import db
 
-def addInstrumentInterface(connection, ins_interface: dict, manufacturer):
-
-    table = 'instruments'
-    with connection.cursor() as cursor:
-
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)           
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
-        columns, values = [], []
-        
-        for column_name in column_names:
-            if column_name[0] in ins_interface.keys():
-                if ins_interface[column_name[0]]:
-                    columns.append(column_name[0])
-                    values.append(ins_interface[column_name[0]])
-
-        columns.append('manufacturer')
-        values.append(manufacturer) 
-
-        insert_statement = cursor.mogrify("INSERT INTO %s (%s) VALUES %s;", (AsIs(table), AsIs(','.join(columns)), tuple(values)))
-        cursor.execute(insert_statement)
+def addInstrumentDetails(connection, ins_interface: dict, instrument_details: dict):
+    """
+    Inserts an instrument and its parsed driver (general_settings, model_and_options, visa and quantities)
+    into every table in one round trip. The caller commits.
+    """
 
-
-def addGenSettings(connection, gen_settings: dict, cute_name):
- 
-    table = 'general_settings'
+    cute_name = ins_interface['cute_name']
+    manufacturer = instrument_details['general_settings']['name']
 
     with connection.cursor() as cursor:
+        statements = [_instrumentInterfaceInsert(cursor, ins_interface, manufacturer),
+                      _genSettingsInsert(cursor, instrument_details['general_settings'], cute_name),
+                      _modelOptionsInsert(cursor, instrument_details['model_and_options'], cute_name),
+                      _visaSettingsInsert(cursor, instrument_details['visa'], cute_name)]
 
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)           
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
-        columns, values = [], []
-
-        for column_name in column_names:
-            if column_name[0] in gen_settings.keys():
-                if gen_settings[column_name[0]]:
-                    columns.append(column_name[0])
-                    values.append(gen_settings[column_name[0]])
-       
-        columns.append('cute_name')
-        values.append(cute_name)        
-        insert_statement = cursor.mogrify("INSERT INTO %s (%s) VALUES %s;", (AsIs(table), AsIs(','.join(columns)), tuple(values)))
-        cursor.execute(insert_statement)
+        quantities = list(instrument_details['quantities'].values())
+        if quantities:
+            statements.append(_quantitiesInsert(cursor, quantities, cute_name))
 
+        cursor.execute(b'\n'.join(statements))
 
-def addModelOptions(connection, model_options: dict, cute_name):
-
-    table = 'model_and_options'
-    with connection.cursor() as cursor:
 
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)           
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
-        columns, values = [], []
-
-        for column_name in column_names:
-            if column_name[0] in model_options.keys():
-                if column_name[0] == 'models':
-                    columns.append('models')
-                    models = '{' + ','.join(model_options['models'].keys()) + '}'
-                    values.append(models)
-                    columns.append('model_ids')
-                    model_ids = '{' + ','.join(model_options['models'].values()) + '}'
-                    values.append(model_ids)
-                elif column_name[0] == 'options':
-                    columns.append('options')
-                    options = '{' + ','.join(model_options['options'].keys()) + '}'
-                    values.append(options)
-                    columns.append('option_ids')
-                    option_ids = '{' + ','.join(model_options['options'].values()) + '}'
-                    values.append(option_ids)
-                elif model_options[column_name[0]]:
-                    columns.append(column_name[0])
-                    values.append(model_options[column_name[0]])
-
-        columns.append('cute_name')
-        values.append(cute_name)         
-        insert_statement = cursor.mogrify("INSERT INTO %s (%s) VALUES %s;", (AsIs(table), AsIs(','.join(columns)), tuple(values)))
-        cursor.execute(insert_statement)
-
-
-def addVisaSettings(connection, visa_settings: dict, cute_name):
+def applyDriverChanges(connection, cute_name: str, changes: dict):
+    """
+    Applies the changes between two parsed drivers of cute_name (see driver_reload.diff_drivers) in one round trip
+    and transaction: the changed columns of the changed rows are updated, removed quantities deleted and added ones
+    inserted. Latest values are kept.
+    """
 
-    table = 'visa'
     with connection.cursor() as cursor:
+        statements = [_rowUpdate(cursor, table, values, cute_name) for table, values in changes['settings'].items()]
+        statements += [_rowUpdate(cursor, 'quantities', values, cute_name, label)
+                       for label, values in changes['changed'].items()]
+
+        if changes['removed']:
+            statements.append(cursor.mogrify("DELETE FROM quantities WHERE cute_name = %s AND label = ANY(%s);",
+                                             (cute_name, list(changes['removed']))))
+        if changes['added']:
+            statements.append(_quantitiesInsert(cursor, list(changes['added'].values()), cute_name))
+
+        statements = [statement for statement in statements if statement]
+        if statements:
+            cursor.execute(b'\n'.join(statements))
+    connection.commit()
+
+
+def _rowUpdate(cursor, table: str, values: dict, cute_name, label=None) -> bytes:
+    """UPDATE of the given columns of cute_name's row (its quantity label), empty values fall back to the column
+    DEFAULT. Returns an empty statement if none of the values is a column of table"""
+
+    catalog = db.get_catalog()
+    array_columns = catalog.array_columns(table)
+    json_columns = catalog.json_columns(table)
+    values = dict(values)
+
+    # models and options are {name: id} in the driver, stored as two parallel arrays
+    for key, id_key in (('models', 'model_ids'), ('options', 'option_ids')):
+        if table == 'model_and_options' and key in values:
+            values[id_key] = list(values[key].values())
+            values[key] = list(values[key].keys())
+
+    assignments = []
+    for column_name in catalog.columns(table):
+        if column_name not in values:
+            continue
+
+        if column_name in array_columns:
+            value = list(values[column_name] or [])
+        elif column_name in json_columns:
+            value = json.dumps(values[column_name])
+        elif values[column_name]:
+            value = values[column_name]
+        else:
+            value = AsIs('DEFAULT')
+        assignments.append(cursor.mogrify("%s = %s", (AsIs(column_name), value)))
+
+    if not assignments:
+        return b''
+
+    statement = cursor.mogrify("UPDATE %s SET ", (AsIs(table),)) + b','.join(assignments)
+    if label is None:
+        return statement + cursor.mogrify(" WHERE cute_name = %s;", (cute_name,))
+    return statement + cursor.mogrify(" WHERE cute_name = %s AND label = %s;", (cute_name, label))
+
+
+def _instrumentInterfaceInsert(cursor, ins_interface: dict, manufacturer) -> bytes:
 
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)           
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
-        columns, values = [], []
-
-        for column_name in column_names:
-            if column_name[0] in visa_settings.keys():
-                if visa_settings[column_name[0]]:
-                    columns.append(column_name[0])
-                    values.append(visa_settings[column_name[0]])
-
-        columns.append('cute_name')
-        values.append(cute_name)         
-        insert_statement = cursor.mogrify("INSERT INTO %s (%s) VALUES %s;", (AsIs(table), AsIs(','.join(columns)), tuple(values)))
-        cursor.execute(insert_statement)
-
-def addQuantity(connection, quantity: dict, cute_name):
+    table = 'instruments'
+    column_names = db.get_catalog().columns(table)
+    columns, values = [], []
 
-    table = 'quantities'
-    with connection.cursor() as cursor:
+    for column_name in column_names:
+        if column_name in ins_interface.keys():
+            if ins_interface[column_name]:
+                columns.append(column_name)
+                values.append(ins_interface[column_name])
 
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)           
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
-        columns, values = [], []
-        
-        for column_name in column_names:
-            if column_name[0] in quantity.keys():             
-                if column_name[0] == 'state_values':
-                    columns.append('state_values')
-                    state_values = '{' + ','.join(quantity['state_values']) + '}'
-                    values.append(state_values)
-                
-                elif column_name[0] == 'model_values':
-                    columns.append('model_values')
-                    model_values = '{' + ','.join(quantity['model_values']) + '}'
-                    values.append(model_values)
-                    
-                elif column_name[0] == 'option_values':
-                    columns.append('option_values')
-                    option_values = '{' + ','.join(quantity['option_values']) + '}'
-                    values.append(option_values)
-
-                elif column_name[0] == 'combo_cmd':
-                    columns.append('combo_cmd')
-                    combo_cmd = json.dumps(quantity['combo_cmd'])
-                    values.append(combo_cmd)
-
-
-                elif quantity[column_name[0]]:
-                    columns.append(column_name[0])
-                    values.append(quantity[column_name[0]])
-
-        columns.append('cute_name')
-        values.append(cute_name)         
-        insert_statement = cursor.mogrify("INSERT INTO %s (%s) VALUES %s;", (AsIs(table), AsIs(','.join(columns)), tuple(values)))        
-        cursor.execute(insert_statement)
-
-def getInstrumentInterface(connection: object, instrument_name: str) -> dict:
+    columns.append('manufacturer')
+    values.append(manufacturer)
 
-    table = 'instruments'
-    general_settings = {}
-    with connection.cursor() as cursor:
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)            
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
-        column_names = tuple(column_name[0] for column_name in column_names)
-        
-        get_instrument_query = cursor.mogrify("SELECT %s FROM %s WHERE cute_name = %s;", (AsIs(','.join(column_names)), AsIs(table), instrument_name))
-        cursor.execute(get_instrument_query)
-        result = cursor.fetchmany()
-        ins_interface = {key : value for key, value in zip(column_names, result[0])}
+    return cursor.mogrify("INSERT INTO %s (%s) VALUES %s;", (AsIs(table), AsIs(','.join(columns)), tuple(values)))
 
-    return ins_interface
 
-def getGenSettings(connection: object, instrument_name: str) -> dict:
+def _genSettingsInsert(cursor, gen_settings: dict, cute_name) -> bytes:
 
     table = 'general_settings'
-    general_settings = {}
-    with connection.cursor() as cursor:
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)            
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
-        column_names = tuple(column_name[0] for column_name in column_names)
-        
-        get_instrument_query = cursor.mogrify("SELECT %s FROM %s WHERE cute_name = %s;", (AsIs(','.join(column_names)), AsIs(table), instrument_name))
-        cursor.execute(get_instrument_query)
-        result = cursor.fetchmany()
-        general_settings = {key : value for key, value in zip(column_names, result[0])}
+    column_names = db.get_catalog().columns(table)
+    columns, values = [], []
 
-    return general_settings
+    for column_name in column_names:
+        if column_name in gen_settings.keys():
+            if gen_settings[column_name]:
+                columns.append(column_name)
+                values.append(gen_settings[column_name])
 
+    columns.append('cute_name')
+    values.append(cute_name)
 
-def getModelOptions(connection: object, instrument_name: str) -> dict:
+    return cursor.mogrify("INSERT INTO %s (%s) VALUES %s;", (AsIs(table), AsIs(','.join(columns)), tuple(values)))
 
-    table = 'model_and_options'
-    model_options = {}
 
-    with connection.cursor() as cursor:
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)            
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
-        column_names = tuple(column_name[0] for column_name in column_names)
+def _modelOptionsInsert(cursor, model_options: dict, cute_name) -> bytes:
 
-        get_instrument_query = cursor.mogrify("SELECT %s FROM %s WHERE cute_name = %s;", (AsIs(','.join(column_names)), AsIs(table), instrument_name))
-        cursor.execute(get_instrument_query)
-        result = cursor.fetchmany()
-
-        for key, value in zip(column_names, result[0]):         
-            model_options[key] =  value            
+    table = 'model_and_options'
+    column_names = db.get_catalog().columns(table)
+    columns, values = [], []
+
+    for column_name in column_names:
+        if column_name in model_options.keys():
+            # models and options are {name: id} in the driver, stored as two parallel arrays
+            if column_name == 'models':
+                columns.append('models')
+                values.append(list(model_options['models'].keys()))
+                columns.append('model_ids')
+                values.append(list(model_options['models'].values()))
+            elif column_name == 'options':
+                columns.append('options')
+                values.append(list(model_options['options'].keys()))
+                columns.append('option_ids')
+                values.append(list(model_options['options'].values()))
+            elif model_options[column_name]:
+                columns.append(column_name)
+                values.append(model_options[column_name])
+
+    columns.append('cute_name')
+    values.append(cute_name)
+
+    return cursor.mogrify("INSERT INTO %s (%s) VALUES %s;", (AsIs(table), AsIs(','.join(columns)), tuple(values)))
+
+
+def _visaSettingsInsert(cursor, visa_settings: dict, cute_name) -> bytes:
 
-    return model_options
+    table = 'visa'
+    column_names = db.get_catalog().columns(table)
+    columns, values = [], []
 
+    for column_name in column_names:
+        if column_name in visa_settings.keys():
+            if visa_settings[column_name]:
+                columns.append(column_name)
+                values.append(visa_settings[column_name])
 
-def getVisaSettings(connection: object, instrument_name: str) -> dict:
+    columns.append('cute_name')
+    values.append(cute_name)
 
-    table = 'visa'
-    visa_settings = {}
-    with connection.cursor() as cursor:
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)            
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
-        column_names = tuple(column_name[0] for column_name in column_names)
-        
-        get_instrument_query = cursor.mogrify("SELECT %s FROM %s WHERE cute_name = %s;", (AsIs(','.join(column_names)), AsIs(table), instrument_name))
-        cursor.execute(get_instrument_query)
-        result = cursor.fetchmany()
-        visa_settings = {key : value for key, value in zip(column_names, result[0])}
-            
-    return visa_settings
+    return cursor.mogrify("INSERT INTO %s (%s) VALUES %s;", (AsIs(table), AsIs(','.join(columns)), tuple(values)))
 
 
-def getQuantities(connection: object, instrument_name: str) -> dict:
+def _quantitiesInsert(cursor, quantities: list, cute_name) -> bytes:
+    """Multi-row INSERT for quantities. Values a quantity leaves empty fall back to the column DEFAULT"""
 
     table = 'quantities'
-    quantities = {}
-    with connection.cursor() as cursor:
-        column_names_query = "SELECT DISTINCT column_name FROM information_schema.columns WHERE table_name = '{table_name}';".format(table_name=table)            
-        cursor.execute(column_names_query)
-        column_names = cursor.fetchall()
-        column_names = tuple(column_name[0] for column_name in column_names)
+    catalog = db.get_catalog()
+    array_columns = catalog.array_columns(table)
+    json_columns = catalog.json_columns(table)
+
+    # every row must list the same columns, so use all the columns that any of the quantities provide
+    columns = [column_name for column_name in catalog.columns(table)
+               if column_name != 'cute_name' and any(column_name in quantity for quantity in quantities)]
+    rows = []
+
+    for quantity in quantities:
+        values = []
+        for column_name in columns:
+            if column_name not in quantity.keys():
+                values.append(AsIs('DEFAULT'))
+
+            # lists are adapted by psycopg2 to ARRAY[...]
+            elif column_name in array_columns:
+                values.append(list(quantity[column_name] or []))
+
+            elif column_name in json_columns:
+                values.append(json.dumps(quantity[column_name]))
+
+            elif quantity[column_name]:
+                values.append(quantity[column_name])
+
+            else:
+                values.append(AsIs('DEFAULT'))
+
+        values.append(cute_name)
+        rows.append(cursor.mogrify("%s", (tuple(values),)))
+
+    columns.append('cute_name')
+
+    return cursor.mogrify("INSERT INTO %s (%s) VALUES ", (AsIs(table), AsIs(','.join(columns)))) + b','.join(rows) + b';'
+
+def getInstrumentDocument(connection: object, instrument_name: str) -> dict:
+    """
+    Returns the full driver document of an instrument (same layout as /instrumentDB/getInstrument)
+    assembled by Postgres in a single statement.
+    Raises:
+        KeyError -- if no instrument named instrument_name exists
+    """
+    document_query = """
+        SELECT json_build_object(
+            'instrument_interface', (SELECT row_to_json(i) FROM instruments i WHERE i.cute_name = %(cute_name)s),
+            'general_settings', (SELECT row_to_json(gs) FROM general_settings gs WHERE gs.cute_name = %(cute_name)s),
+            'model_and_options', (SELECT row_to_json(mo) FROM model_and_options mo WHERE mo.cute_name = %(cute_name)s),
+            'visa', (SELECT row_to_json(v) FROM visa v WHERE v.cute_name = %(cute_name)s),
+            'quantities', (SELECT COALESCE(json_object_agg(q.label, row_to_json(q)), '{}'::json)
+                           FROM quantities q WHERE q.cute_name = %(cute_name)s)
+        );"""
 
-        get_quantity_names_query = "SELECT {column} FROM {table_name} WHERE cute_name = '{cute_name}';".format(column='label', table_name=table, cute_name=instrument_name)
-        cursor.execute(get_quantity_names_query)
-        quantity_names = cursor.fetchall()
+    with connection.cursor() as cursor:
+        cursor.execute(document_query, {'cute_name': instrument_name})
+        document = cursor.fetchone()[0]
 
-        for quantity in quantity_names:
-            get_quantity_query = cursor.mogrify("SELECT %s FROM %s WHERE cute_name = %s AND label = %s;", (AsIs(','.join(column_names)), AsIs(table), instrument_name, quantity[0]))
-            cursor.execute(get_quantity_query)
-            result = cursor.fetchmany()
-            quantities[quantity[0]] = {key : value for key, value in zip(column_names, result[0])}
+    if document['instrument_interface'] is None:
+        raise KeyError(f'No instrument named {instrument_name}.')
 
-    return quantities
+    return document
 
 
 def getLatestValue(connection: object, instrument_name: str, label: str) -> str:
-    table = 'quantities'
     latest_value = None
     with connection.cursor() as cursor:
-        latest_value_query = "SELECT {column} FROM {table_name} WHERE cute_name = '{cute_name}' and label = '{label}';"\
-            .format(column='latest_value', table_name=table, cute_name=instrument_name, label=label)
-        cursor.execute(latest_value_query)
+        db.execute_prepared(cursor, 'get_latest_value',
+                            "SELECT latest_value FROM quantities WHERE cute_name = $1 AND label = $2",
+                            (instrument_name, label))
         latest_value = cursor.fetchone()[0]
 
     return latest_value
 
 
-def setLatestValue(connection: object, latest_value: str, instrument_name: str, label: str):
-    table = 'quantities'
+def getLatestValues(connection: object, quantities: list, instrument_names: list) -> list:
+    """
+    Returns (cute_name, label, latest_value) of every (cute_name, label) pair in quantities
+    and of every quantity of the instruments in instrument_names, in one statement
+    """
     with connection.cursor() as cursor:
-        query = f"UPDATE {table} SET latest_value = '{latest_value}' WHERE cute_name = '{instrument_name}' and label = '{label}'"
-        cursor.execute(query)
+        db.execute_prepared(cursor, 'get_latest_values',
+                            "SELECT cute_name, label, latest_value FROM quantities "
+                            "WHERE (cute_name, label) IN (SELECT * FROM unnest($1::text[], $2::text[])) "
+                            "OR cute_name = ANY($3::text[])",
+                            ([cute_name for cute_name, _ in quantities], [label for _, label in quantities],
+                             list(instrument_names)))
+        return cursor.fetchall()
+
+
+def setLatestValues(connection: object, latest_values: list):
+    """Updates many latest values in one statement and transaction. latest_values is a list of (cute_name, label, latest_value)"""
+    if not latest_values:
+        return
+    with connection.cursor() as cursor:
+        _updateLatestValues(cursor, latest_values)
         connection.commit()
 
+# Monthly quantity_history partitions already created by this process
+_history_partitions = set()
+
+def addQuantityHistory(connection: object, history: list):
+    """Appends history records in one statement and transaction. history is a list of (cute_name, label, recorded_at, value)"""
+    if not history:
+        return
+    with connection.cursor() as cursor:
+        months = _insertQuantityHistory(cursor, history)
+        connection.commit()
+    _history_partitions.update(months)
+
+def persistLatestValues(connection: object, latest_values: list, history: list):
+    """Updates latest values and appends history records (see setLatestValues and addQuantityHistory) in one transaction"""
+    if not latest_values and not history:
+        return
+    months = set()
+    with connection.cursor() as cursor:
+        if history:
+            months = _insertQuantityHistory(cursor, history)
+        if latest_values:
+            _updateLatestValues(cursor, latest_values)
+        connection.commit()
+    _history_partitions.update(months)
+
+def _updateLatestValues(cursor, latest_values: list):
+    """Runs on every flush of the latest value store, prepared once per connection (the batch is passed as arrays)"""
+    db.execute_prepared(cursor, 'set_latest_values',
+                        "UPDATE quantities AS q SET latest_value = v.latest_value "
+                        "FROM unnest($1::text[], $2::text[], $3::text[]) AS v(cute_name, label, latest_value) "
+                        "WHERE q.cute_name = v.cute_name AND q.label = v.label",
+                        ([cute_name for cute_name, _, _ in latest_values], [label for _, label, _ in latest_values],
+                         [None if value is None else str(value) for _, _, value in latest_values]))
+
+def _insertQuantityHistory(cursor, history: list) -> set:
+    """Inserts history records without committing, returns the (year, month) partitions they went to"""
+    rows = []
+    months = set()
+    for cute_name, label, recorded_at, value in history:
+        try:
+            numeric_value = float(value)
+        except (TypeError, ValueError):
+            numeric_value = None
+        rows.append((cute_name, label, recorded_at, value, numeric_value))
+        months.add((recorded_at.year, recorded_at.month))
+
+    for year, month in months - _history_partitions:
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        partition_statement = "CREATE TABLE IF NOT EXISTS quantity_history_y{year}m{month:02d} PARTITION OF quantity_history " \
+                              "FOR VALUES FROM ('{year}-{month:02d}-01') TO ('{next_year}-{next_month:02d}-01');"\
+            .format(year=year, month=month, next_year=next_year, next_month=next_month)
+        cursor.execute(partition_statement)
+
+    insert_statement = "INSERT INTO quantity_history (cute_name, label, recorded_at, value, numeric_value) VALUES %s;"
+    execute_values(cursor, insert_statement, rows, template='(%s, %s, %s, %s::text, %s)', page_size=len(rows))
+    return months
+
+def getQuantityHistory(connection: object, instrument_name: str, label: str, start, end, buckets: int) -> list:
+    """
+    Returns the history of a quantity between start and end downsampled into at most <buckets> equal time buckets.
+    Each bucket has the count of records and min, max, mean of the numeric values, and the last value recorded.
+    Empty buckets are left out.
+    """
+    history_query = """
+        SELECT bucket, count(*), min(numeric_value), max(numeric_value), avg(numeric_value),
+               (array_agg(value ORDER BY recorded_at DESC))[1]
+        FROM (SELECT width_bucket(extract(epoch FROM recorded_at), extract(epoch FROM %(start)s::timestamp),
+                                  extract(epoch FROM %(end)s::timestamp), %(buckets)s) AS bucket,
+                     recorded_at, value, numeric_value
+              FROM quantity_history
+              WHERE cute_name = %(cute_name)s AND label = %(label)s AND recorded_at >= %(start)s AND recorded_at < %(end)s
+             ) AS bucketed
+        GROUP BY bucket
+        ORDER BY bucket;"""
+
+    bucket_width = (end - start) / buckets
+    with connection.cursor() as cursor:
+        cursor.execute(history_query, {'cute_name': instrument_name, 'label': label, 'start': start, 'end': end,
+                                       'buckets': buckets})
+        result = cursor.fetchall()
+
+    return [{'start': (start + (bucket - 1) * bucket_width).isoformat(),
+             'end': (start + bucket * bucket_width).isoformat(),
+             'count': count, 'min': minimum, 'max': maximum, 'mean': mean, 'last': last}
+            for bucket, count, minimum, maximum, mean, last in result]
+
 def deleteInstrument(connection: object, cute_name: str):
     table_names = ['general_settings', 'model_and_options', 'visa', 'quantities', 'instruments']
     with connection.cursor() as cursor:
         for table in table_names:
-            delete_instrument_query = "DELETE FROM {table_name} WHERE cute_name = '{cute_name}';".format(table_name = table, cute_name = cute_name)
-            cursor.execute(delete_instrument_query)
-            connection.commit()
+            db.execute_prepared(cursor, f'delete_instrument_{table}', f"DELETE FROM {table} WHERE cute_name = $1",
+                                (cute_name,))
+        connection.commit()
 
 
-def update_visa_baud_rate(connection: object, cute_name: str, new_baud_rate):
-    table = 'visa'
+def updateSetting(connection: object, table: str, column: str, value, key_column: str, key_value):
+    """Sets table.column to value where key_column = key_value. Table and column names are checked against the catalog"""
+    column_names = db.get_catalog().columns(table)
+    if column not in column_names or key_column not in column_names:
+        raise KeyError(f'Unknown column {column} or {key_column} in table {table}.')
+
     with connection.cursor() as cursor:
-        query = f"UPDATE {table} SET baud_rate= '{new_baud_rate}' WHERE cute_name= '{cute_name}';"
-        cursor.execute(query)
+        update_statement = "UPDATE {table} SET {column} = %s WHERE {key_column} = %s;"\
+            .format(table=table, column=column, key_column=key_column)
+        cursor.execute(update_statement, (value, key_value))
         connection.commit()
+
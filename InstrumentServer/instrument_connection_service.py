@@ -1,13 +1,19 @@
+import copy
 import pyvisa
-import requests
 import logging
+import threading
+import contextlib
 from enum import Enum
-from http import HTTPStatus
 from Instrument.instrument_manager import InstrumentManager
+from DB.storage_backend import DuplicateInstrumentError
+import instrument_server_service
 import sys
 import importlib
 import os
 
+# The connection service of the Instrument Server running in this process (None when running outside the server)
+_connection_service = None
+
 
 class INST_INTERFACE(Enum):
     USB = 'USB'
@@ -25,6 +31,8 @@ class AlreadyConnectedError(Exception):
 class InstrumentConnectionService:
     def __init__(self, logger: logging.Logger) -> None:
         self._connected_instruments = {}
+        # I/O with an instrument is serialized by its lock, different instruments are used concurrently
+        self._instrument_locks = {}
         self._my_logger = logger
         self._my_logger.debug(f'{self.__class__.__name__} initialized...')
 
@@ -41,15 +49,8 @@ class InstrumentConnectionService:
         if self.is_connected(cute_name):
             raise AlreadyConnectedError(f'{cute_name} is already connected.')
 
-        # Use cute_name to determine the interface (hit endpoint for that)
-        url = r'http://127.0.0.1:5000/instrumentDB/getInstrument'
-        response = requests.get(url, params={'cute_name': cute_name})
-
-        # raise exception for error
-        if HTTPStatus.OK < response.status_code >= HTTPStatus.MULTIPLE_CHOICES:
-            response.raise_for_status()
-
-        driver_dict = dict(response.json())
+        # Use cute_name to determine the interface (the manager gets its own copy of the driver)
+        driver_dict = copy.deepcopy(instrument_server_service.get_service().get_instrument(cute_name))
         interface = driver_dict['instrument_interface']['interface']
         address = driver_dict['instrument_interface']['address']
 
@@ -112,6 +113,7 @@ class InstrumentConnectionService:
 
         try:
             im = ManagerClass(cute_name, connection_str, driver_dict, self._my_logger)
+            self._instrument_locks[cute_name] = self._io_lock(im)
             self._connected_instruments[cute_name] = im
             self._my_logger.info(f"VISA connection established to: {cute_name}.")
         # InstrumentManager may throw value error, this service should throw a Connection error
@@ -123,14 +125,8 @@ class InstrumentConnectionService:
         if cute_name in self._connected_instruments.keys():
             raise ValueError(f'{cute_name} is already connected.')
 
-        # Use cute_name to determine the interface (hit endpoint for that)
-        url = r'http://127.0.0.1:5000/instrumentDB/getInstrument'
-        response = requests.get(url, params={'cute_name': cute_name})
-        # raise exception for error
-        if 200 < response.status_code >= 300:
-            response.raise_for_status()
-
-        response_dict = dict(response.json())
+        # Use cute_name to determine the interface (the manager gets its own copy of the driver)
+        response_dict = copy.deepcopy(instrument_server_service.get_service().get_instrument(cute_name))
         try:
             # importing custom driver module from the driver_path
             driver_path = response_dict["general_settings"]["driver_path"]
@@ -155,6 +151,7 @@ class InstrumentConnectionService:
 
             # create connection
             im = getattr(custom_driver, module_name)(name=cute_name, driver=response_dict, logger=self._my_logger)
+            self._instrument_locks[cute_name] = self._io_lock(im)
             self._connected_instruments[cute_name] = im
 
             self._my_logger.info(f"Connected to {cute_name}.")
@@ -167,7 +164,10 @@ class InstrumentConnectionService:
         if cute_name not in self._connected_instruments.keys():
             return
 
-        del self._connected_instruments[cute_name]
+        # wait for the instrument's pending get/set to finish
+        with self._instrument_locks.get(cute_name, contextlib.nullcontext()):
+            self._connected_instruments.pop(cute_name, None)
+        self._instrument_locks.pop(cute_name, None)
         self._my_logger.debug(f"Disconnected {cute_name}.")
 
     def disconnect_all_instruments(self):
@@ -190,6 +190,53 @@ class InstrumentConnectionService:
 
         return self._connected_instruments[cute_name]
 
+    @staticmethod
+    def _io_lock(instrument_manager):
+        """The lock the instrument manager's quantities hold during I/O (so direct get/set calls, e.g. from the GUI,
+        are serialized with the ones made through this service), a new one if it has none"""
+        return getattr(instrument_manager, 'io_lock', None) or threading.RLock()
+
+    @contextlib.contextmanager
+    def instrument_lock(self, cute_name: str, timeout=-1):
+        """Holds cute_name's instrument for exclusive I/O, yields its instrument manager
+            Raises:
+                KeyError -- if cute_name is not connected
+                TimeoutError -- if the instrument is still busy after timeout seconds
+        """
+        lock = self._instrument_locks.get(cute_name)
+        if lock is None:
+            raise KeyError(f"{cute_name} is not currently connected.")
+
+        if not lock.acquire(timeout=timeout):
+            raise TimeoutError(f"{cute_name} is busy.")
+        try:
+            # it may have been disconnected while waiting
+            yield self.get_instrument_manager(cute_name)
+        finally:
+            lock.release()
+
+    def get_value(self, cute_name: str, label: str, timeout=-1):
+        """Reads quantity label of the connected instrument cute_name"""
+        with self.instrument_lock(cute_name, timeout) as instrument_manager:
+            return instrument_manager.get_value(label)
+
+    def set_value(self, cute_name: str, label: str, value, timeout=-1):
+        """Sets quantity label of the connected instrument cute_name to value"""
+        with self.instrument_lock(cute_name, timeout) as instrument_manager:
+            instrument_manager.set_value(label, value)
+
+    def update_quantities(self, cute_name: str, quantities: dict, removed: list) -> bool:
+        """Patches the quantities of the connected instrument cute_name after its driver changed, once its pending
+        get/set finished. Returns False if it is not connected or its manager can not be patched (reconnect it)"""
+        try:
+            with self.instrument_lock(cute_name) as instrument_manager:
+                if not hasattr(instrument_manager, 'update_quantities'):
+                    return False
+                instrument_manager.update_quantities(quantities, removed)
+                return True
+        except KeyError:
+            return False
+
     def make_conn_str_tcip_instrument(self, address: str) -> str:
         """
         Construct a connection string for TCPIP instruments
@@ -202,12 +249,19 @@ class InstrumentConnectionService:
         return f'{TCPIP_INTERFACE}::{address}::{END}'
 
     def add_instrument_to_database(self, details: dict):
-        url = r'http://127.0.0.1:5000/instrumentDB/addInstrument'
-        response = requests.post(url, json=details)
-        if HTTPStatus.MULTIPLE_CHOICES > response.status_code <= HTTPStatus.OK:
-            return True, response.json()
-        else:
-            return False, response.json()
+        try:
+            instrument_server_service.get_service().add_instrument(details)
+            return True, f"Instrument: \"{details['cute_name']}\" was (re)added!"
+
+        except FileNotFoundError:
+            return False, "Invalid driver path."
+
+        except DuplicateInstrumentError:
+            return False, "Instrument name already exists."
+
+        except Exception as e:
+            self._my_logger.error(f'Failed to add instrument {details.get("cute_name")}: {e}')
+            return False, str(e)
 
     def remove_instrument_from_database(self, cute_name: str):
 
@@ -221,10 +275,18 @@ class InstrumentConnectionService:
         except Exception as e:
             self._my_logger.info(f'Instrument {cute_name} is not currently connected.')
 
-        url = r'http://127.0.0.1:5000/instrumentDB/removeInstrument'
-        response = requests.get(url, params={'cute_name': cute_name})
-        if HTTPStatus.MULTIPLE_CHOICES > response.status_code <= HTTPStatus.OK:
+        try:
+            instrument_server_service.get_service().remove_instrument(cute_name)
             return "Instrument removed."
-        else:
-            self._my_logger.fatal(response.raise_for_status())
+        except Exception as e:
+            self._my_logger.fatal(f'Failed to remove instrument {cute_name}: {e}')
         return "Failed to remove the instrument."
+
+
+def set_connection_service(connection_service: InstrumentConnectionService):
+    global _connection_service
+    _connection_service = connection_service
+
+
+def get_connection_service() -> InstrumentConnectionService:
+    return _connection_service
@@ -0,0 +1,156 @@
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from instrument_connection_service import InstrumentConnectionService
+
+# The gateway of the Instrument Server running in this process (None when running outside the server)
+_gateway = None
+
+
+class DeadlineExceededError(TimeoutError):
+    """An instrument call did not finish before its deadline"""
+    pass
+
+
+###################################################################################
+# InstrumentGateway
+###################################################################################
+class InstrumentGateway:
+    """
+    Asyncio front end of the InstrumentConnectionService.
+    The blocking I/O of every instrument runs on the instrument's own single thread executor, so one event loop
+    drives many instruments concurrently while the calls to one instrument keep their order.
+    Every call takes a timeout (seconds). A call that is cancelled or runs out of time before it started is never
+    sent to the instrument. A call that is already talking to the instrument can not be interrupted (PyVISA calls
+    block), it finishes in the background and its result is dropped.
+    The coroutines can be awaited on any event loop, synchronous code uses run() to run them on the gateway's loop.
+    """
+
+    def __init__(self, connection_service: InstrumentConnectionService, logger: logging.Logger):
+        self._ics = connection_service
+        self._my_logger = logger
+        self._lock = threading.Lock()
+        self._executors = {}
+        self._pending = {}
+        self._loop = None
+        self._loop_thread = None
+        self._my_logger.debug(f'{self.__class__.__name__} initialized...')
+
+    # region awaitable instrument I/O
+    async def get_value(self, cute_name: str, label: str, timeout: float = None):
+        """Reads quantity label of the connected instrument cute_name
+            Raises:
+                KeyError -- if cute_name is not connected or has no quantity label
+                DeadlineExceededError -- if the instrument did not answer within timeout seconds
+                TimeoutError -- if the instrument stayed busy with other callers until the deadline
+        """
+        return await self._call(cute_name, timeout,
+                                lambda lock_timeout: self._ics.get_value(cute_name, label, lock_timeout))
+
+    async def set_value(self, cute_name: str, label: str, value, timeout: float = None):
+        """Sets quantity label of the connected instrument cute_name to value (raises like get_value)"""
+        return await self._call(cute_name, timeout,
+                                lambda lock_timeout: self._ics.set_value(cute_name, label, value, lock_timeout))
+
+    async def query(self, cute_name: str, command: str, timeout: float = None) -> str:
+        """Writes command to the connected instrument cute_name and returns its answer (raises like get_value)"""
+        def ask(lock_timeout):
+            with self._ics.instrument_lock(cute_name, lock_timeout) as instrument_manager:
+                return instrument_manager.ask(command)
+
+        return await self._call(cute_name, timeout, ask)
+
+    async def get_values(self, quantities: list, timeout: float = None) -> list:
+        """Reads a list of (cute_name, label) concurrently across instruments,
+        returns their values (or the exception raised reading them) in the same order"""
+        return await asyncio.gather(*(self.get_value(cute_name, label, timeout) for cute_name, label in quantities),
+                                    return_exceptions=True)
+    # endregion
+
+    # region synchronous callers
+    def start(self):
+        """Starts the gateway's event loop, used by run()"""
+        if self._loop_thread is None:
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(target=self._loop.run_forever, name='InstrumentGateway', daemon=True)
+            self._loop_thread.start()
+
+    def run(self, coroutine):
+        """Runs coroutine on the gateway's event loop and returns its result (call from outside the loop)"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def close(self):
+        """Stops the event loop, calls that did not start yet are dropped"""
+        if self._loop_thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop.close()
+            self._loop_thread = None
+
+        with self._lock:
+            executors, self._executors = self._executors, {}
+        for executor in executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """Number of calls waiting for or talking to each instrument"""
+        with self._lock:
+            return dict(self._pending)
+    # endregion
+
+    # region private helper methods
+    async def _call(self, cute_name: str, timeout, operation):
+        if not self._ics.is_connected(cute_name):
+            raise KeyError(f'{cute_name} is not currently connected.')
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def run():
+            if deadline is None:
+                return operation(-1)
+
+            # waited in the executor's queue, only the rest of the time is left to wait for the instrument's lock
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceededError(f'{cute_name}: the deadline passed before the call started.')
+            return operation(remaining)
+
+        with self._lock:
+            self._pending[cute_name] = self._pending.get(cute_name, 0) + 1
+        future = asyncio.get_running_loop().run_in_executor(self._executor(cute_name), run)
+        try:
+            done, _ = await asyncio.wait({future}, timeout=timeout)
+        except asyncio.CancelledError:
+            # cancelling the future drops a call that did not start
+            future.cancel()
+            raise
+        finally:
+            with self._lock:
+                self._pending[cute_name] -= 1
+                if not self._pending[cute_name]:
+                    del self._pending[cute_name]
+
+        if not done:
+            future.cancel()
+            raise DeadlineExceededError(f'{cute_name} did not answer within {timeout} seconds.')
+        return future.result()
+
+    def _executor(self, cute_name: str) -> ThreadPoolExecutor:
+        with self._lock:
+            executor = self._executors.get(cute_name)
+            if executor is None:
+                executor = self._executors[cute_name] = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f'InstrumentIO-{cute_name}')
+            return executor
+    # endregion
+
+
+def set_gateway(gateway: InstrumentGateway):
+    global _gateway
+    _gateway = gateway
+
+
+def get_gateway() -> InstrumentGateway:
+    return _gateway
@@ -0,0 +1,213 @@
+import logging
+import datetime
+
+import driverParserService as dps
+import driver_library
+from DB import change_feed
+from DB.storage_backend import StorageBackend
+from DB.driver_cache import DriverCache
+from DB.latest_value_store import LatestValueStore
+from parsed_driver_cache import ParsedDriverCache
+
+# The service of the Instrument Server running in this process (None when running outside the server)
+_service = None
+
+
+###################################################################################
+# InstrumentServerService
+###################################################################################
+class InstrumentServerService:
+    """
+    In-process API of the Instrument Server: driver parsing, the instrument catalog and latest values.
+    The Flask routes are thin wrappers around it, code running inside the server (GUIs, instrument connections)
+    calls it directly instead of making HTTP requests to its own process.
+    Every method is thread safe and can be called outside a Flask application context.
+    """
+
+    def __init__(self, backend: StorageBackend, store: LatestValueStore, cache: DriverCache,
+                 feed: change_feed.ChangeFeed, logger: logging.Logger, parsed_drivers: ParsedDriverCache = None):
+        self._backend = backend
+        self._store = store
+        self._cache = cache
+        self._feed = feed
+        # without a cache every driver is parsed again
+        self._parsed_drivers = parsed_drivers
+        self._my_logger = logger
+        self._my_logger.debug(f'{self.__class__.__name__} initialized...')
+
+    # region drivers and instruments
+    def parse_driver(self, ini_path: str) -> dict:
+        """Returns the parsed .ini driver at ini_path
+            Raises:
+                FileNotFoundError -- if ini_path can not be read
+        """
+        if self._parsed_drivers is None:
+            return dps.parseDriver(ini_path)
+        return self._parsed_drivers.parse_driver(ini_path)
+
+    def import_driver_library(self, directory: str, workers: int = None) -> dict:
+        """Parses and validates every .ini driver in the directory tree (see driver_library.import_library),
+        returns the per-file report
+            Raises:
+                NotADirectoryError -- if directory is not a directory
+        """
+        return driver_library.import_library(directory, workers, self._parsed_drivers)
+
+    def add_instrument(self, details: dict):
+        """Parses the driver at details['path'] and stores the instrument described by details
+            Raises:
+                FileNotFoundError -- if the driver can not be read
+                DuplicateInstrumentError -- if details['cute_name'] already exists
+        """
+        instrument_details = self.parse_driver(details['path'])
+
+        # If the baud rate is provided, we will overwrite the value we got from the ini file
+        if details.get('baud_rate'):
+            self._my_logger.info(f"Baud Rate: {details['baud_rate']} was provided. Replacing value from ini file.")
+            instrument_details['visa']['baud_rate'] = details['baud_rate']
+
+        # All tables are written in a single round trip and transaction
+        self._backend.add_instrument(details, instrument_details)
+        self._cache.invalidate(details['cute_name'])
+        self._feed.publish(change_feed.INSTRUMENT_ADDED, details['cute_name'])
+
+    def apply_driver_changes(self, cute_name: str, changes: dict):
+        """Stores the changes between two parsed drivers of cute_name (see driver_reload.diff_drivers),
+        only the changed rows are written"""
+        self._backend.apply_driver_changes(cute_name, changes)
+        self._cache.invalidate(cute_name)
+        self._feed.publish(change_feed.DRIVER_CHANGED, cute_name, added=list(changes['added']),
+                           changed=list(changes['changed']), removed=list(changes['removed']))
+
+    def remove_instrument(self, cute_name: str):
+        self._store.discard_instrument(cute_name)
+        self._backend.delete_instrument(cute_name)
+        self._cache.invalidate(cute_name)
+        self._feed.publish(change_feed.INSTRUMENT_REMOVED, cute_name)
+
+    def get_all_instruments(self) -> list:
+        """Returns a dict (cute_name, manufacturer, interface, address, serial, visa) per instrument"""
+        return self._backend.get_all_instruments()
+
+    def get_instrument(self, cute_name: str, fields: list = None) -> dict:
+        """Returns the driver document of cute_name with the current latest values, only the given fields
+        if fields is not None (see project_document)
+            Raises:
+                KeyError -- if no instrument named cute_name exists
+                ValueError -- if fields names an unknown section
+        """
+        document = self.get_instrument_settings(cute_name)
+        if fields is not None:
+            document = project_document(document, fields)
+        if 'quantities' not in document:
+            return document
+
+        # latest values change on every reading and are not part of the cached document
+        latest_values = self._store.get_many(cute_name, document['quantities'].keys())
+        if latest_values:
+            quantities = {label: dict(quantity, latest_value=latest_values[label]) if label in latest_values else quantity
+                          for label, quantity in document['quantities'].items()}
+            document = dict(document, quantities=quantities)
+
+        return document
+
+    def get_instrument_settings(self, cute_name: str) -> dict:
+        """Returns the cached driver document of cute_name (latest values as last flushed), must not be modified"""
+        return self._cache.get(cute_name, lambda: self._backend.get_instrument_document(cute_name))
+
+    def get_driver_version(self, cute_name: str) -> str:
+        """Version tag of cute_name's driver document, clients keep their copy while it does not change"""
+        return self._cache.version_tag(cute_name)
+
+    def get_instrument_version(self, cute_name: str) -> str:
+        """Version tag of cute_name's driver document including its latest values (see get_instrument)"""
+        return f'{self._cache.version_tag(cute_name)}-{self._store.version(cute_name)}'
+
+    def get_catalog_version(self) -> str:
+        """Version tag of the list of instruments (see get_all_instruments)"""
+        return self._cache.catalog_version_tag()
+
+    def update_setting(self, cute_name: str, table: str, column: str, value, key_column: str, key_value):
+        """Sets table.column of instrument cute_name to value in the row where key_column = key_value"""
+        self._backend.update_setting(table, column, value, key_column, key_value)
+
+        # Cached driver documents of this instrument (and its new name, if renamed) are now stale
+        self._cache.invalidate(cute_name)
+        if column == key_column:
+            self._cache.invalidate(value)
+    # endregion
+
+    # region latest values and history
+    def get_latest_value(self, cute_name: str, label: str):
+        # Values in the store may not have been flushed to the DB yet
+        found, latest_value = self._store.get(cute_name, label)
+        if not found:
+            latest_value = self._backend.get_latest_value(cute_name, label)
+        return latest_value
+
+    def get_latest_values(self, quantities: list = (), cute_names: list = ()) -> dict:
+        """
+        Returns {cute_name: {label: latest_value}} of the (cute_name, label) pairs in quantities
+        and of every quantity of the instruments in cute_names. Unknown quantities are left out.
+        """
+        latest_values = {}
+        for cute_name, label, latest_value in self._backend.get_latest_values(list(quantities), list(cute_names)):
+            latest_values.setdefault(cute_name, {})[label] = latest_value
+
+        # Values in the store may not have been flushed to the DB yet
+        for cute_name, instrument_values in latest_values.items():
+            instrument_values.update(self._store.get_many(cute_name, list(instrument_values.keys())))
+
+        return latest_values
+
+    def set_latest_value(self, cute_name: str, label: str, latest_value):
+        self._store.set(cute_name, label, latest_value)
+
+    def set_latest_values(self, latest_values: list):
+        """Sets a list of (cute_name, label, latest_value), persisted together in the next flush"""
+        self._store.set_many(latest_values)
+
+    def get_value_history(self, cute_name: str, label: str, start: datetime.datetime, end: datetime.datetime,
+                          buckets: int) -> list:
+        """Returns the history of a quantity between start and end (naive UTC) downsampled into at most <buckets>"""
+        # history that is still buffered in memory is included
+        self._store.flush()
+        return self._backend.get_quantity_history(cute_name, label, start, end, buckets)
+    # endregion
+
+
+def project_document(document: dict, fields: list) -> dict:
+    """
+    Returns the parts of a driver document named in fields: whole sections ('general_settings', 'quantities')
+    or single entries of a section ('quantities.Voltage', 'visa.baud_rate'). Unknown entries are left out.
+    The returned sections are shared with document.
+        Raises:
+            ValueError -- if a field names an unknown section
+    """
+    projected = {}
+    entries = {}
+    for field in fields:
+        section, _, key = field.partition('.')
+        if section not in document:
+            raise ValueError(f'Unknown field {field}.')
+        if key:
+            entries.setdefault(section, []).append(key)
+        else:
+            projected[section] = document[section]
+
+    for section, keys in entries.items():
+        # a whole section was asked for as well
+        if section in projected:
+            continue
+        projected[section] = {key: document[section][key] for key in keys if key in document[section]}
+
+    return projected
+
+
+def set_service(service: InstrumentServerService):
+    global _service
+    _service = service
+
+
+def get_service() -> InstrumentServerService:
+    return _service
@@ -0,0 +1,199 @@
+###################################################################################
+# Blueprint: 'instruments'
+###################################################################################
+
+import json
+import time
+import logging
+from http import HTTPStatus
+
+from flask import (Blueprint, Response, current_app, jsonify, request)
+
+from DB import change_feed
+import instrument_server_service
+import instrument_connection_service
+import instrument_gateway
+import vector_encoding
+import request_limiter
+
+'''
+Create 'instruments' Blueprint
+'''
+bp = Blueprint('instruments', __name__, url_prefix='/instruments')
+
+
+def set_logger(logger: logging.Logger):
+    global my_logger
+    my_logger = logger
+
+
+@bp.route('/<cute_name>/stream')
+def stream_latest_values(cute_name):
+    """
+    Server-Sent Events stream of the latest values of cute_name's quantities.
+    Query parameters: label (repeatable, all quantities if missing) and max_rate (messages per second,
+    at most STREAM_MAX_RATE). The first message holds the current values, the following ones every value
+    changed since the previous message (only the newest value of a quantity is sent).
+    Messages are 'latest_values' events with data {"cute_name", "latest_values": {label: value}, "timestamp"}.
+    The stream ends with an 'instrument_removed' event when the instrument is removed.
+    """
+    my_logger.debug(f"/instruments/{cute_name}/stream was hit!")
+    service = instrument_server_service.get_service()
+
+    try:
+        service.get_instrument_settings(cute_name)
+    except KeyError:
+        return jsonify(f'Unknown instrument {cute_name}.'), HTTPStatus.NOT_FOUND
+
+    labels = request.args.getlist('label') or None
+    try:
+        max_rate = min(float(request.args.get('max_rate', current_app.config['STREAM_MAX_RATE'])),
+                       current_app.config['STREAM_MAX_RATE'])
+        if max_rate <= 0:
+            raise ValueError
+    except ValueError:
+        return jsonify('max_rate must be a positive number.'), HTTPStatus.BAD_REQUEST
+
+    keep_alive_interval = current_app.config['STREAM_KEEP_ALIVE_INTERVAL']
+
+    # a stream holds a server thread until it is closed, so does its slot (STREAM_MAX_CLIENTS)
+    limiter = current_app.extensions['request_limiter']
+    if not limiter.acquire(request.endpoint):
+        return request_limiter.busy_response()
+    endpoint = request.endpoint
+
+    # subscribe before reading the current values so no change in between is missed
+    try:
+        subscription = change_feed.get_feed().subscribe_coalescing(
+            [change_feed.LATEST_VALUE, change_feed.INSTRUMENT_REMOVED], cute_name, labels)
+    except Exception:
+        limiter.release(endpoint)
+        raise
+
+    def events():
+        latest_values = service.get_latest_values(cute_names=[cute_name]).get(cute_name, {})
+        if labels is not None:
+            latest_values = {label: value for label, value in latest_values.items() if label in labels}
+        message_id = 0
+        yield _format_event(message_id, 'latest_values', {'cute_name': cute_name, 'latest_values': latest_values,
+                                                          'timestamp': None})
+
+        next_message_at = 0.0
+        while True:
+            changes = subscription.get_all(timeout=keep_alive_interval)
+            if not changes:
+                # comment line, keeps proxies from closing the idle connection
+                yield ': keep-alive\n\n'
+                continue
+
+            # changes arriving until the next message may be sent are coalesced by the subscription
+            delay = next_message_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+                changes += subscription.get_all(timeout=0)
+
+            if any(change['type'] == change_feed.INSTRUMENT_REMOVED for change in changes):
+                yield _format_event(message_id + 1, 'instrument_removed', {'cute_name': cute_name})
+                return
+
+            message_id += 1
+            yield _format_event(message_id, 'latest_values', {
+                'cute_name': cute_name,
+                'latest_values': {change['label']: change['value'] for change in changes},
+                'timestamp': changes[-1]['timestamp']})
+            next_message_at = time.monotonic() + 1 / max_rate
+
+    response = Response(events(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # the server closes the response when the client disconnects (even before the first message)
+    response.call_on_close(subscription.close)
+    response.call_on_close(lambda: limiter.release(endpoint))
+    return response
+
+
+@bp.route('/<cute_name>/quantities/<path:label>', methods=['GET'])
+def get_quantity_value(cute_name, label):
+    """
+    Reads quantity label from the connected instrument cute_name, returns {"cute_name", "label", "value"}
+    (vectors as .npy buffers if the Accept header prefers application/x-npy).
+    Query parameter timeout: deadline in seconds (at most INSTRUMENT_LOCK_TIMEOUT).
+    """
+    my_logger.debug(f"GET /instruments/{cute_name}/quantities/{label} was hit!")
+    return _instrument_io(cute_name, label, lambda gateway, timeout: gateway.get_value(cute_name, label, timeout))
+
+
+@bp.route('/<cute_name>/quantities/<path:label>', methods=['PUT'])
+def set_quantity_value(cute_name, label):
+    """
+    Sets quantity label of the connected instrument cute_name to the value in the JSON body {"value": value}
+    (or the value query parameter), returns {"cute_name", "label", "value"}.
+    Query parameter timeout: deadline in seconds (at most INSTRUMENT_LOCK_TIMEOUT).
+    """
+    my_logger.debug(f"PUT /instruments/{cute_name}/quantities/{label} was hit!")
+    body = request.get_json(silent=True)
+    if isinstance(body, dict) and 'value' in body:
+        value = body['value']
+    elif 'value' in request.args:
+        value = request.args['value']
+    else:
+        return jsonify('Missing value.'), HTTPStatus.BAD_REQUEST
+
+    async def set_value(gateway, timeout):
+        await gateway.set_value(cute_name, label, value, timeout)
+        return value
+
+    return _instrument_io(cute_name, label, set_value)
+
+
+def _instrument_io(cute_name: str, label: str, operation):
+    """Runs the coroutine operation(gateway, timeout) on the gateway's loop, answers with the value it returns"""
+    max_timeout = current_app.config['INSTRUMENT_LOCK_TIMEOUT']
+    try:
+        timeout = min(float(request.args.get('timeout', max_timeout)), max_timeout)
+        if timeout <= 0:
+            raise ValueError
+    except ValueError:
+        return jsonify('timeout must be a positive number.'), HTTPStatus.BAD_REQUEST
+
+    ics = instrument_connection_service.get_connection_service()
+    if ics is None or not ics.is_connected(cute_name):
+        return jsonify(f'{cute_name} is not currently connected.'), HTTPStatus.NOT_FOUND
+
+    if label not in ics.get_instrument_manager(cute_name).quantities:
+        return jsonify(f'Unknown quantity {label} of {cute_name}.'), HTTPStatus.NOT_FOUND
+
+    try:
+        gateway = instrument_gateway.get_gateway()
+        value = gateway.run(operation(gateway, timeout))
+
+        response = vector_encoding.vector_response(cute_name, label, value) if request.method == 'GET' else None
+        if response is not None:
+            return response
+        return jsonify({'cute_name': cute_name, 'label': label, 'value': value}), HTTPStatus.OK
+
+    except instrument_gateway.DeadlineExceededError as ex:
+        # the instrument is slow (or hangs), retrying right away would not help
+        return jsonify(str(ex)), HTTPStatus.GATEWAY_TIMEOUT
+
+    except TimeoutError as ex:
+        # busy with other requests until the deadline
+        return jsonify(str(ex)), HTTPStatus.SERVICE_UNAVAILABLE, {'Retry-After': '1'}
+
+    except KeyError as ex:
+        # disconnected while waiting for the instrument
+        if not ics.is_connected(cute_name):
+            return jsonify(f'{cute_name} is not currently connected.'), HTTPStatus.NOT_FOUND
+        my_logger.error(f'{cute_name}: {label} failed: {ex}')
+        return jsonify(str(ex)), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    except ValueError as ex:
+        # value outside the quantity's limits or states
+        return jsonify(str(ex)), HTTPStatus.BAD_REQUEST
+
+    except Exception as ex:
+        my_logger.error(f'{cute_name}: {label} failed: {ex}')
+        return jsonify(str(ex)), HTTPStatus.INTERNAL_SERVER_ERROR
+
+
+def _format_event(message_id: int, event: str, data: dict) -> str:
+    return f'id: {message_id}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n'
@@ -0,0 +1,143 @@
+import os
+import json
+import locale
+import hashlib
+import logging
+import threading
+
+import driverParserService as dps
+
+# Bump whenever driverParserService builds different documents from the same .ini file,
+# entries written by another format are parsed again
+FORMAT_VERSION = 2
+
+
+###################################################################################
+# ParsedDriverCache
+###################################################################################
+class ParsedDriverCache:
+    """
+    Parsed .ini driver documents (see driverParserService.parseDriver) kept in a directory, so they outlive restarts.
+    An entry is keyed by the driver's path and holds the file's mtime, size and SHA-256 of its content:
+        - mtime and size unchanged: the document is used without reading the file
+        - mtime changed but the same content (copied or touched): the document is used after hashing the file
+        - otherwise the file is parsed again
+    Entries are read from the directory the first time their path is asked for.
+    Every call returns a new copy of the document, callers may modify it.
+    """
+
+    def __init__(self, directory: str, logger: logging.Logger):
+        self._directory = directory
+        self._my_logger = logger
+        self._lock = threading.Lock()
+        # {ini_path: entry as stored, with the document as JSON text}
+        self._entries = {}
+        self._loading = {}
+        self._hits = 0
+        self._parses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._my_logger.debug(f'{self.__class__.__name__} initialized...')
+
+    def parse_driver(self, ini_path: str) -> dict:
+        """Returns the parsed .ini driver at ini_path
+            Raises:
+                FileNotFoundError -- if ini_path can not be read
+        """
+        try:
+            file_stat = os.stat(ini_path)
+        except OSError:
+            raise FileNotFoundError(f'Could not read driver {ini_path}.')
+
+        # one thread checks (and if needed parses) a driver, the others wait and use its entry
+        with self._loading_lock(ini_path):
+            entry = self._entry(ini_path)
+            if entry is not None and entry['mtime_ns'] == file_stat.st_mtime_ns and entry['size'] == file_stat.st_size:
+                return self._hit(entry)
+
+            try:
+                with open(ini_path, 'rb') as file:
+                    content = file.read()
+            except OSError:
+                raise FileNotFoundError(f'Could not read driver {ini_path}.')
+            sha256 = hashlib.sha256(content).hexdigest()
+
+            if entry is not None and entry['sha256'] == sha256:
+                entry = dict(entry, mtime_ns=file_stat.st_mtime_ns, size=file_stat.st_size)
+                self._store(ini_path, entry)
+                return self._hit(entry)
+
+            # parse the bytes that were hashed, the file may change in between
+            document = parse_content(content, ini_path)
+            with self._lock:
+                self._parses += 1
+            self._store(ini_path, _new_entry(ini_path, file_stat.st_mtime_ns, file_stat.st_size, sha256, document))
+            return document
+
+    def add(self, ini_path: str, mtime_ns: int, size: int, sha256: str, document: dict):
+        """Stores document, parsed elsewhere from the content (SHA-256, size) of ini_path as of mtime_ns"""
+        with self._loading_lock(ini_path):
+            self._store(ini_path, _new_entry(ini_path, mtime_ns, size, sha256, document))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'cached_drivers': len(self._entries), 'hits': self._hits, 'parses': self._parses}
+
+    # region private helper methods
+    def _loading_lock(self, ini_path: str) -> threading.Lock:
+        with self._lock:
+            return self._loading.setdefault(ini_path, threading.Lock())
+
+    def _file_name(self, ini_path: str) -> str:
+        return os.path.join(self._directory, hashlib.sha1(ini_path.encode()).hexdigest() + '.json')
+
+    def _entry(self, ini_path: str):
+        """Returns the entry of ini_path, read from the directory the first time, None if there is none"""
+        with self._lock:
+            if ini_path in self._entries:
+                return self._entries[ini_path]
+
+        entry = None
+        try:
+            with open(self._file_name(ini_path), encoding='utf-8') as file:
+                entry = json.load(file)
+            if entry.get('format') != FORMAT_VERSION or entry.get('ini_path') != ini_path:
+                entry = None
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as ex:
+            self._my_logger.warning(f'Ignoring the unreadable parsed driver cache entry of {ini_path}: {ex}')
+
+        with self._lock:
+            self._entries[ini_path] = entry
+        return entry
+
+    def _hit(self, entry: dict) -> dict:
+        with self._lock:
+            self._hits += 1
+        return json.loads(entry['document'])
+
+    def _store(self, ini_path: str, entry: dict):
+        with self._lock:
+            self._entries[ini_path] = entry
+
+        # write a temporary file and rename it, a crash never leaves a truncated entry
+        file_name = self._file_name(ini_path)
+        temporary_name = f'{file_name}.{threading.get_ident()}.tmp'
+        try:
+            with open(temporary_name, 'w', encoding='utf-8') as file:
+                json.dump(entry, file)
+            os.replace(temporary_name, file_name)
+        except OSError as ex:
+            # still cached in memory, parsed again after a restart
+            self._my_logger.warning(f'Could not write the parsed driver cache entry of {ini_path}: {ex}')
+    # endregion
+
+
+def parse_content(content: bytes, ini_path: str) -> dict:
+    """Returns the parsed driver, content read from ini_path (decoded like RawConfigParser.read does)"""
+    return dps.parseDriverText(content.decode(locale.getpreferredencoding(False)), ini_path)
+
+
+def _new_entry(ini_path: str, mtime_ns: int, size: int, sha256: str, document: dict) -> dict:
+    return {'format': FORMAT_VERSION, 'ini_path': ini_path, 'mtime_ns': mtime_ns, 'size': size, 'sha256': sha256,
+            'document': json.dumps(document)}
@@ -0,0 +1,135 @@
+import logging
+import threading
+from http import HTTPStatus
+from flask import Flask, g, jsonify, request
+
+
+###################################################################################
+# RouteLimit
+###################################################################################
+class RouteLimit:
+    """
+    At most max_concurrent requests of a route run at once, at most max_waiting more wait for up to wait_timeout
+    seconds. Anything beyond that is rejected right away, so a slow instrument can not tie up every server thread.
+    """
+
+    def __init__(self, max_concurrent: int, max_waiting: int, wait_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+
+        self._condition = threading.Condition()
+        self._running = 0
+        self._waiting = 0
+        self._rejected = 0
+
+    def acquire(self) -> bool:
+        with self._condition:
+            if self._running < self.max_concurrent:
+                self._running += 1
+                return True
+
+            if self._waiting >= self.max_waiting:
+                self._rejected += 1
+                return False
+
+            self._waiting += 1
+            try:
+                if not self._condition.wait_for(lambda: self._running < self.max_concurrent,
+                                                timeout=self.wait_timeout):
+                    self._rejected += 1
+                    return False
+                self._running += 1
+                return True
+            finally:
+                self._waiting -= 1
+
+    def release(self):
+        with self._condition:
+            self._running -= 1
+            self._condition.notify()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {'max_concurrent': self.max_concurrent, 'running': self._running, 'waiting': self._waiting,
+                    'rejected': self._rejected}
+
+
+###################################################################################
+# RequestLimiter
+###################################################################################
+class RequestLimiter:
+    """
+    Per-route concurrency limits, configured with ROUTE_CONCURRENCY_LIMITS = {endpoint: max_concurrent}
+    (endpoint as in url_for, e.g. 'instrumentDB.addInstrument'). Requests that can not get a slot
+    get 503 Service Unavailable with a Retry-After header.
+
+    Teardown runs before a streamed response body is sent, so streaming routes (limit with streamed=True) take
+    their slot themselves with acquire and release it when their response is closed.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self._my_logger = logger
+        self._limits = {}
+        self._streamed = set()
+
+    def init_app(self, app: Flask):
+        max_waiting = app.config.get('ROUTE_MAX_WAITING', 16)
+        wait_timeout = app.config.get('ROUTE_WAIT_TIMEOUT', 10.0)
+        self._limits = {endpoint: RouteLimit(max_concurrent, max_waiting, wait_timeout)
+                        for endpoint, max_concurrent in app.config.get('ROUTE_CONCURRENCY_LIMITS', {}).items()}
+
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def limit(self, endpoint: str, max_concurrent: int, max_waiting=16, wait_timeout=10.0, streamed=False):
+        """Limits an endpoint that was not configured in ROUTE_CONCURRENCY_LIMITS"""
+        self._limits.setdefault(endpoint, RouteLimit(max_concurrent, max_waiting, wait_timeout))
+        if streamed:
+            self._streamed.add(endpoint)
+
+    def acquire(self, endpoint: str) -> bool:
+        """Takes a slot of a streamed endpoint, False if none is free (respond with busy_response)"""
+        route_limit = self._limits.get(endpoint)
+        if route_limit is None:
+            return True
+
+        if not route_limit.acquire():
+            self._my_logger.warning(f'Rejected {endpoint}: {route_limit.max_concurrent} requests running '
+                                    f'and {route_limit.max_waiting} waiting.')
+            return False
+        return True
+
+    def release(self, endpoint: str):
+        """Frees the slot taken with acquire"""
+        route_limit = self._limits.get(endpoint)
+        if route_limit is not None:
+            route_limit.release()
+
+    def stats(self) -> dict:
+        return {endpoint: limit.stats() for endpoint, limit in self._limits.items()}
+
+    def _before_request(self):
+        if request.endpoint in self._streamed:
+            return None
+
+        route_limit = self._limits.get(request.endpoint)
+        if route_limit is None:
+            return None
+
+        if not self.acquire(request.endpoint):
+            return busy_response()
+
+        g.route_limit = route_limit
+        return None
+
+    @staticmethod
+    def _teardown_request(exception=None):
+        route_limit = g.pop('route_limit', None)
+        if route_limit is not None:
+            route_limit.release()
+
+
+def busy_response():
+    """503 response of a request that did not get a slot"""
+    return jsonify('Server busy, try again later.'), HTTPStatus.SERVICE_UNAVAILABLE, {'Retry-After': '1'}
@@ -7,7 +7,16 @@ import logging
 import datetime
 from http import HTTPStatus
 
-from flask import (Blueprint, jsonify)
+from flask import (Blueprint, Response, jsonify, current_app)
+
+from DB import db
+from DB import driver_cache
+from DB import change_feed
+from DB import metrics
+from DB import latest_value_store
+import instrument_connection_service
+import instrument_gateway
+import driver_reload
 
 '''
 Create 'serverStatus' Blueprint
@@ -42,3 +51,88 @@ def get_Os_Platform():
 def get_server_utc_time():
     my_logger.debug("/getServerUTCTime was hit!")
     return jsonify(datetime.datetime.utcnow()), HTTPStatus.OK
+
+
+@bp.route('/getDbPoolStats')
+def get_db_pool_stats():
+    my_logger.debug("/getDbPoolStats was hit!")
+    return jsonify(db.get_backend().stats()), HTTPStatus.OK
+
+
+
+@bp.route('/getDriverCacheStats')
+def get_driver_cache_stats():
+    my_logger.debug("/getDriverCacheStats was hit!")
+    return jsonify(driver_cache.get_cache().stats()), HTTPStatus.OK
+
+
+@bp.route('/getChangeFeedStats')
+def get_change_feed_stats():
+    my_logger.debug("/getChangeFeedStats was hit!")
+    return jsonify(change_feed.get_feed().stats()), HTTPStatus.OK
+
+
+@bp.route('/getRequestLimiterStats')
+def get_request_limiter_stats():
+    my_logger.debug("/getRequestLimiterStats was hit!")
+    return jsonify(current_app.extensions['request_limiter'].stats()), HTTPStatus.OK
+
+
+@bp.route('/metrics')
+def get_metrics():
+    """Request, DB and instrument I/O latencies and the state of the server's components in Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE), HTTPStatus.OK
+
+
+# Component metrics are read from the stats of the server's components when /metrics is scraped
+def _cache_lookups():
+    stats = driver_cache.get_cache().stats()
+    return {('hit',): stats['hits'], ('miss',): stats['misses']}
+
+
+def _cache_hit_ratio():
+    ratio = driver_cache.get_cache().stats()['hit_ratio']
+    return {} if ratio is None else {(): ratio}
+
+
+def _route_limits(state: str) -> dict:
+    return {(endpoint,): stats[state] for endpoint, stats in current_app.extensions['request_limiter'].stats().items()}
+
+
+metrics.REGISTRY.register_callback(
+    'instrument_server_db_pool', 'Connection pool state (open, in_use, idle connections and lease counters).',
+    'gauge', ('stat',), lambda: {(stat,): value for stat, value in db.get_backend().stats().items()})
+metrics.REGISTRY.register_callback(
+    'instrument_server_driver_cache_lookups_total', 'Driver document cache lookups.', 'counter', ('result',),
+    _cache_lookups)
+metrics.REGISTRY.register_callback(
+    'instrument_server_driver_cache_hit_ratio', 'Share of driver document lookups served from the cache.',
+    'gauge', (), _cache_hit_ratio)
+metrics.REGISTRY.register_callback(
+    'instrument_server_latest_values_pending', 'Latest values written to memory but not yet to the DB.',
+    'gauge', (), lambda: {(): latest_value_store.get_store().pending})
+metrics.REGISTRY.register_callback(
+    'instrument_server_change_feed_events_total', 'Change feed events published, delivered to and dropped '
+    'for subscribers.', 'counter', ('kind',),
+    lambda: {(kind,): change_feed.get_feed().stats()[kind] for kind in ('published', 'delivered', 'dropped')})
+metrics.REGISTRY.register_callback(
+    'instrument_server_change_feed_subscribers', 'Open change feed subscriptions (including live streams).',
+    'gauge', (), lambda: {(): change_feed.get_feed().stats()['subscribers']})
+metrics.REGISTRY.register_callback(
+    'instrument_server_route_running_requests', 'Requests running in concurrency limited routes.',
+    'gauge', ('endpoint',), lambda: _route_limits('running'))
+metrics.REGISTRY.register_callback(
+    'instrument_server_route_rejected_requests_total', 'Requests rejected by route concurrency limits.',
+    'counter', ('endpoint',), lambda: _route_limits('rejected'))
+metrics.REGISTRY.register_callback(
+    'instrument_server_connected_instruments', 'Instruments with an open connection.', 'gauge', (),
+    lambda: {(): len(instrument_connection_service.get_connection_service().connected_instruments)})
+metrics.REGISTRY.register_callback(
+    'instrument_server_gateway_pending_calls', 'Instrument calls waiting for or talking to each instrument.',
+    'gauge', ('cute_name',),
+    lambda: {(cute_name,): count for cute_name, count in instrument_gateway.get_gateway().stats().items()})
+metrics.REGISTRY.register_callback(
+    'instrument_server_driver_reloads_total', 'Changed .ini drivers applied without reconnecting, and failed reloads.',
+    'counter', ('result',),
+    lambda: {('applied',): driver_reload.get_watcher().stats()['reloads'],
+             ('failed',): driver_reload.get_watcher().stats()['failures']})
@@ -0,0 +1,126 @@
+import io
+import gzip
+import threading
+import collections
+import numpy as np
+from http import HTTPStatus
+from flask import Response, current_app, request
+
+import instrument_server_service
+
+# Content type of values sent as NumPy .npy buffers
+NPY_MIMETYPE = 'application/x-npy'
+
+# Quantity data types that can be sent as .npy buffers, with their (little-endian) dtype
+VECTOR_DTYPES = {'VECTOR': np.dtype('<f8'), 'VECTOR_COMPLEX': np.dtype('<c16')}
+
+# Encoded buffers of the last value of the most recently read vectors, {(cute_name, label): EncodedVector}
+_MAX_CACHED_VECTORS = 64
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class EncodedVector:
+    """A vector value with its .npy buffer and, once needed, the gzip compressed buffer"""
+
+    def __init__(self, value, npy: bytes):
+        self.value = value
+        self.npy = npy
+        self.compressed = {}
+
+    def gzip(self, level: int) -> bytes:
+        if level not in self.compressed:
+            self.compressed[level] = gzip.compress(self.npy, compresslevel=level)
+        return self.compressed[level]
+
+
+def parse_vector(value, data_type: str) -> np.ndarray:
+    """
+    Returns a VECTOR (float64) or VECTOR_COMPLEX (complex128) value as an array.
+    Values may be sequences, arrays or their text form as stored in latest_value: '[1.0, 2.0]' or '1.0,2.0'
+    (Python complex numbers like '(1+2j)', or real and imaginary parts interleaved).
+        Raises:
+            ValueError -- if value is not a vector
+    """
+    dtype = VECTOR_DTYPES[data_type]
+    if not isinstance(value, str):
+        return np.ascontiguousarray(value, dtype=dtype)
+
+    text = value.strip().strip('[]').replace(',', ' ')
+    if dtype.kind != 'c':
+        return np.array(text.split(), dtype=dtype)
+
+    if 'j' in text:
+        return np.array([complex(token.strip('()')) for token in text.split()], dtype=dtype)
+    interleaved = np.array(text.split(), dtype='<f8')
+    if len(interleaved) % 2:
+        raise ValueError('Interleaved complex vectors need an even number of values.')
+    return interleaved.view(dtype)
+
+
+def encode_npy(array: np.ndarray) -> bytes:
+    """Returns array in NumPy .npy framing (header followed by the raw little-endian buffer)"""
+    buffer = io.BytesIO()
+    np.lib.format.write_array(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def wants_npy() -> bool:
+    """Does the current request prefer .npy buffers over JSON?"""
+    return request.accept_mimetypes.best_match(['application/json', NPY_MIMETYPE]) == NPY_MIMETYPE
+
+
+def vector_response(cute_name: str, label: str, value):
+    """
+    Returns value as a .npy response if the client asked for one and label is a vector quantity, otherwise None
+    (the caller answers with JSON). The buffer is gzip compressed when the client accepts it and it is larger
+    than VECTOR_COMPRESSION_MIN_SIZE bytes.
+    """
+    if value is None or not wants_npy():
+        return None
+
+    try:
+        quantities = instrument_server_service.get_service().get_instrument_settings(cute_name)['quantities']
+        data_type = quantities[label]['data_type'].upper()
+    except KeyError:
+        return None
+    if data_type not in VECTOR_DTYPES:
+        return None
+
+    try:
+        encoded = _encode(cute_name, label, value, data_type)
+    except ValueError:
+        # not stored in a form we can parse, send the value as it is
+        return None
+
+    body = encoded.npy
+    headers = {'Vary': 'Accept, Accept-Encoding'}
+
+    config = current_app.config
+    if config['VECTOR_COMPRESSION_LEVEL'] and len(body) > config['VECTOR_COMPRESSION_MIN_SIZE'] \
+            and 'gzip' in request.accept_encodings:
+        body = encoded.gzip(config['VECTOR_COMPRESSION_LEVEL'])
+        headers['Content-Encoding'] = 'gzip'
+
+    return Response(body, status=HTTPStatus.OK, mimetype=NPY_MIMETYPE, headers=headers)
+
+
+def _encode(cute_name: str, label: str, value, data_type: str) -> EncodedVector:
+    """Returns the encoded value, parsed and encoded again only when the quantity's value changed"""
+    key = (cute_name, label)
+    with _cache_lock:
+        encoded = _cache.get(key)
+        if encoded is not None:
+            _cache.move_to_end(key)
+
+    # the latest value store hands out the same object until the value changes
+    if encoded is not None and isinstance(value, str) and (encoded.value is value or encoded.value == value):
+        return encoded
+
+    encoded = EncodedVector(value, encode_npy(parse_vector(value, data_type)))
+    if isinstance(value, str):
+        with _cache_lock:
+            _cache[key] = encoded
+            while len(_cache) > _MAX_CACHED_VECTORS:
+                _cache.popitem(last=False)
+    return encoded